@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Per-site running totals for /analytics.
+
+`site_analytics` holds one row per outlet with sums and counts for every
+metric.  It is adjusted in the same transaction as the analysis write (or
+reset / delete) that changes it, so the unfiltered analytics page is a read
+of len(SITES) rows.  Filtered views aggregate the pre-extracted numeric
+columns on Article in SQL instead of re-parsing analysis JSON.
+
+`site_daily_stats` counts analyses per site and day as they land (claims,
+tokens, and n / sum / sum of squares per score for mean and variance).  It
+only grows, so trends survive the pruning of old articles, and a trend
+chart reads one row per site and day shown.
+
+    python aggregates.py --rebuild        # recompute from the articles table
+    python aggregates.py --rebuild-daily  # recompute the daily rollup
+"""
+from __future__ import annotations
+import argparse, logging, math
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import (
+    Session, Article, ArticleAnalysis, ChangeGeneration, SiteDailyStats, SiteStats,
+)
+
+log = logging.getLogger("aggregates")
+
+SCORES = ("objectivity", "depth", "evidence", "clarity")
+GENERATION = "scores"      # bumped whenever per-article scores or claims change
+
+
+# ---------- extraction --------------------------------------------------
+def extract_scores(analysis: dict) -> Dict[str, Optional[float]]:
+    """{'objectivity_score': 72.0, …} from an analysis dict (None if missing)."""
+    quality = (analysis or {}).get("reporting_quality") or {}
+    out = {}
+    for name in SCORES:
+        value = quality.get(f"{name}_score")
+        try:
+            out[f"{name}_score"] = float(value) if value is not None else None
+        except (TypeError, ValueError):
+            out[f"{name}_score"] = None
+    return out
+
+
+def contribution(article: Article, sign: int = 1) -> dict:
+    """Column deltas one analysed article adds to (or removes from) its site."""
+    delta = {
+        "analysed": sign,
+        "verified": sign * (article.verified_claims or 0),
+        "corrected": sign * (article.corrected_claims or 0),
+    }
+    for name in SCORES:
+        value = getattr(article, f"{name}_score")
+        delta[f"{name}_sum"] = sign * (value or 0.0)
+        delta[f"{name}_n"] = sign * (value is not None)
+    return delta
+
+
+def daily_contribution(row: ArticleAnalysis) -> dict:
+    """Column deltas one stored analysis adds to its day's rollup."""
+    delta = {
+        "analysed": 1,
+        "verified": row.verified_claims or 0,
+        "corrected": row.corrected_claims or 0,
+        "tokens": row.tokens or 0,
+    }
+    for name in SCORES:
+        value = getattr(row, f"{name}_score")
+        delta[f"{name}_n"] = int(value is not None)
+        delta[f"{name}_sum"] = value or 0.0
+        delta[f"{name}_sum_sq"] = (value or 0.0) ** 2
+    return delta
+
+
+# ---------- incremental updates ----------------------------------------
+def _upsert(sess, model, keys: dict, delta: dict) -> None:
+    """Atomically add `delta` to the row of `model` identified by `keys`."""
+    dialect = sess.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(model).values(**keys, **delta)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[getattr(model, k) for k in keys],
+            set_={col: getattr(model, col) + stmt.excluded[col] for col in delta},
+        )
+        sess.execute(stmt)
+        return
+
+    updated = sess.execute(
+        update(model)
+        .where(*[getattr(model, k) == v for k, v in keys.items()])
+        .values({col: getattr(model, col) + val for col, val in delta.items()})
+    ).rowcount
+    if not updated:
+        sess.add(model(**keys, **delta))
+        sess.flush()
+
+
+def bump_generation(sess, name: str = GENERATION) -> None:
+    _upsert(sess, ChangeGeneration, {"name": name}, {"value": 1})
+
+
+def generation(sess, name: str = GENERATION) -> int:
+    value = sess.execute(
+        select(ChangeGeneration.value).where(ChangeGeneration.name == name)
+    ).scalar()
+    return value or 0
+
+
+def apply_delta(sess, site: str, delta: dict) -> None:
+    """Atomically add `delta` to the site's row (upsert)."""
+    _upsert(sess, SiteStats, {"site": site}, delta)
+
+
+def record_daily(sess, site: str, row: ArticleAnalysis) -> None:
+    """Count a freshly stored analysis in its site's rollup for the day."""
+    _upsert(sess, SiteDailyStats, {"day": row.created_at.date(), "site": site},
+            daily_contribution(row))
+
+
+def record_analysis(sess, article: Article, before: Optional[dict]) -> None:
+    """
+    Account for a freshly written analysis.  `before` is the article's
+    contribution prior to the write (None if it was not analysed).
+    """
+    if before:
+        apply_delta(sess, article.site, {k: -v for k, v in before.items()})
+    apply_delta(sess, article.site, contribution(article))
+    bump_generation(sess)
+
+
+def forget(sess, *criteria) -> None:
+    """Remove analysed articles matching `criteria` from the totals (before deleting them)."""
+    for site, totals in totals_by_site(sess, *criteria).items():
+        apply_delta(sess, site, {k: -v for k, v in totals.items()})
+    bump_generation(sess)
+
+
+def reset(sess) -> None:
+    sess.query(SiteStats).delete()
+    bump_generation(sess)
+
+
+def reset_daily(sess) -> None:
+    sess.query(SiteDailyStats).delete()
+
+
+# ---------- reads --------------------------------------------------------
+def _finish(raw: dict) -> dict:
+    """Turn sums/counts into the metrics dict the analytics template expects."""
+    out = {
+        "verified": int(raw["verified"] or 0),
+        "corrected": int(raw["corrected"] or 0),
+        "total_articles": int(raw["analysed"] or 0),
+    }
+    for name in SCORES:
+        n = raw[f"{name}_n"] or 0
+        avg = (raw[f"{name}_sum"] or 0) / n if n else 0
+        out[f"avg_{name}"] = min(100, max(0, round(avg, 1)))
+    return out
+
+
+def totals_select(*criteria):
+    """SELECT of sums/counts over analysed articles, grouped by site."""
+    cols = [
+        Article.site,
+        func.count().label("analysed"),
+        func.coalesce(func.sum(Article.verified_claims), 0).label("verified"),
+        func.coalesce(func.sum(Article.corrected_claims), 0).label("corrected"),
+    ]
+    for name in SCORES:
+        col = getattr(Article, f"{name}_score")
+        cols += [func.coalesce(func.sum(col), 0.0).label(f"{name}_sum"),
+                 func.count(col).label(f"{name}_n")]
+    return (
+        select(*cols)
+        .where(Article.analyzed_at.is_not(None), *criteria)
+        .group_by(Article.site)
+    )
+
+
+def totals_by_site(sess, *criteria) -> Dict[str, dict]:
+    """Sums/counts over analysed articles matching `criteria`, grouped by site."""
+    rows = sess.execute(totals_select(*criteria)).all()
+    out = {}
+    for row in rows:
+        data = row._asdict()
+        out[data.pop("site")] = data
+    return out
+
+
+def site_metrics(sess, *criteria) -> Dict[str, dict]:
+    """
+    Metrics per site.  Without criteria this reads `site_analytics`; with
+    criteria (e.g. a search filter) it aggregates the matching articles.
+    """
+    if not criteria:
+        return {
+            row.site: _finish(row.__dict__)
+            for row in sess.query(SiteStats).filter(SiteStats.analysed > 0)
+        }
+    return {site: _finish(t) for site, t in totals_by_site(sess, *criteria).items()}
+
+
+def daily_trends(sess, days: int = 30, today: Optional[date] = None) -> dict:
+    """
+    Per-site series over the last `days` days for the trend chart:
+    {"days": [iso, …], "sites": {site: {"analysed": [...], "tokens": [...],
+    "<score>_mean": [...], "<score>_std": [...]}}}.  Days without analyses
+    are 0 / None.
+    """
+    today = today or datetime.utcnow().date()
+    start = today - timedelta(days=days - 1)
+    axis = [start + timedelta(days=i) for i in range(days)]
+    index = {d: i for i, d in enumerate(axis)}
+    sites: Dict[str, dict] = {}
+    for row in sess.query(SiteDailyStats).filter(SiteDailyStats.day >= start,
+                                                 SiteDailyStats.day <= today):
+        series = sites.get(row.site)
+        if series is None:
+            series = sites[row.site] = {"analysed": [0] * days, "tokens": [0] * days,
+                                        "verified": [0] * days, "corrected": [0] * days}
+            for name in SCORES:
+                series[f"{name}_mean"] = [None] * days
+                series[f"{name}_std"] = [None] * days
+        i = index[row.day]
+        for col in ("analysed", "tokens", "verified", "corrected"):
+            series[col][i] = getattr(row, col)
+        for name in SCORES:
+            n = getattr(row, f"{name}_n")
+            if n:
+                mean = getattr(row, f"{name}_sum") / n
+                var = max(0.0, getattr(row, f"{name}_sum_sq") / n - mean * mean)
+                series[f"{name}_mean"][i] = round(mean, 1)
+                series[f"{name}_std"][i] = round(math.sqrt(var), 1)
+    return {"days": [d.isoformat() for d in axis], "sites": sites}
+
+
+# ---------- backfill -----------------------------------------------------
+def backfill_scores(sess) -> int:
+    """Fill the numeric score columns from the current analysis where missing."""
+    rows = (
+        sess.query(Article.id, ArticleAnalysis.payload_json, ArticleAnalysis.payload_z)
+        .join(ArticleAnalysis, ArticleAnalysis.id == Article.analysis_id)
+        .filter(*[getattr(Article, f"{n}_score").is_(None) for n in SCORES])
+        .all()
+    )
+    filled = 0
+    for art_id, plain, compressed in rows:
+        payload = compressed if compressed is not None else plain
+        scores = extract_scores(payload if isinstance(payload, dict) else None)
+        if any(v is not None for v in scores.values()):
+            sess.execute(update(Article).where(Article.id == art_id).values(**scores))
+            filled += 1
+    return filled
+
+
+def rebuild(sess) -> None:
+    """Recompute every site's totals from the articles table."""
+    filled = backfill_scores(sess)
+    reset(sess)
+    for site, totals in totals_by_site(sess).items():
+        sess.add(SiteStats(site=site, **totals))
+    log.info("Rebuilt site analytics (%d rows given numeric scores)", filled)
+
+
+def rebuild_daily(sess) -> int:
+    """
+    Recompute site_daily_stats from article_analysis for the days that still
+    have analyses; returns rows written.  Days whose articles were pruned
+    keep their rollup – and so does the oldest remaining day once older ones
+    are gone, as pruning may have taken part of it.
+    """
+    day = func.date(ArticleAnalysis.created_at)
+    cols = [
+        day.label("day"), Article.site,
+        func.count().label("analysed"),
+        func.coalesce(func.sum(ArticleAnalysis.verified_claims), 0).label("verified"),
+        func.coalesce(func.sum(ArticleAnalysis.corrected_claims), 0).label("corrected"),
+        func.coalesce(func.sum(ArticleAnalysis.tokens), 0).label("tokens"),
+    ]
+    for name in SCORES:
+        col = getattr(ArticleAnalysis, f"{name}_score")
+        cols += [func.count(col).label(f"{name}_n"),
+                 func.coalesce(func.sum(col), 0.0).label(f"{name}_sum"),
+                 func.coalesce(func.sum(col * col), 0.0).label(f"{name}_sum_sq")]
+    rows = sess.execute(
+        select(*cols)
+        .join(Article, Article.id == ArticleAnalysis.article_id)
+        .group_by(day, Article.site)
+    ).all()
+    rows = [{**row._asdict(), "day": date.fromisoformat(str(row.day)[:10])}   # str on SQLite
+            for row in rows]
+    days = {row["day"] for row in rows}
+    rolled_up_since = sess.query(func.min(SiteDailyStats.day)).scalar()
+    if days and rolled_up_since is not None and rolled_up_since < min(days):
+        days.discard(min(days))             # partly pruned: its rollup is the better count
+    sess.query(SiteDailyStats).filter(SiteDailyStats.day.in_(days)) \
+        .delete(synchronize_session=False)
+    written = [row for row in rows if row["day"] in days]
+    for data in written:
+        sess.add(SiteDailyStats(**data))
+    log.info("Rebuilt daily site rollup (%d site-days; older days kept)", len(written))
+    return len(written)
+
+
+# -----------------------------------------------------------------------------
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    p = argparse.ArgumentParser(description="Maintain per-site analytics totals.")
+    p.add_argument("--rebuild", action="store_true",
+                   help="recompute site_analytics from the articles table")
+    p.add_argument("--rebuild-daily", action="store_true",
+                   help="recompute site_daily_stats from article_analysis")
+    args = p.parse_args()
+    if args.rebuild or args.rebuild_daily:
+        sess = Session()
+        try:
+            if args.rebuild:
+                rebuild(sess)
+            if args.rebuild_daily:
+                rebuild_daily(sess)
+            sess.commit()
+        finally:
+            sess.close()
+    else:
+        p.print_help()
@@ -2,12 +2,33 @@
 Single place that talks to the OpenAI API.
 Both fetch_news.py (batch) and app.py (lazy button) import this.
 """
-import json, time, logging
-import openai
-from config import OPENAI_API_KEY, MODELS
+import hashlib, json, time, logging, threading
+from config import OPENAI_API_KEY, OPENAI_TIMEOUT_SECONDS, MODELS
+from metrics import openai_call
 
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
 log = logging.getLogger("analysis")
+_client = None
+_client_lock = threading.Lock()
+
+
+class AnalysisFailed(RuntimeError):
+    """OpenAI gave no usable analysis, retries included."""
+
+
+def get_client():
+    """
+    OpenAI client, built on first use (importing openai is slow).  One client
+    per process, shared by all threads/greenlets – it is thread-safe and
+    pools its HTTP connections.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import openai
+                _client = openai.OpenAI(api_key=OPENAI_API_KEY,
+                                        timeout=OPENAI_TIMEOUT_SECONDS)
+    return _client
 
 SYSTEM_PROMPT = """Du är en expert på nyhetsanalys med djup expertis inom mediabiasanalys, faktakontroll och balanserad rapportering. Din uppgift är att analysera NYHETSARTIKLARS RUBRIK OCH SAMMANFATTNING ENDAST - inte hela artikeln. Detta är en viktig begränsning som måste respekteras.
 
@@ -175,6 +196,9 @@ Formatera ditt svar som ett JSON-objekt med följande struktur:
 
 Håll din analys koncis och fokusera på de viktigaste aspekterna. Begränsa ditt svar till cirka {max_words} ord."""
 
+# Stored with every analysis; changes whenever the prompt text does
+PROMPT_VERSION = hashlib.sha1(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
 def classify_content(title: str, summary: str) -> str:
     """
     Classify the content type based on keywords and context.
@@ -249,7 +273,8 @@ def analyse_article(article: dict,
                     model: str = None) -> dict:
     """
     article: {"title": "...", "summary": "..."}
-    returns dict + key 'tokens' (prompt+completion)
+    returns dict + key 'tokens' (prompt+completion); raises AnalysisFailed
+    when every try fails, so callers never store an empty analysis
     """
     # Classify content and get appropriate model config
     content_type = classify_content(article["title"], article["summary"])
@@ -261,71 +286,32 @@ def analyse_article(article: dict,
     model = model or model_config["model"]
     
     system_prompt = SYSTEM_PROMPT.format(max_words=max_words)
-    tries = 0
+    tries, last_error = 0, None
     while tries < 3:
         tries += 1
         try:
-            resp = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user",   "content": json.dumps(article, ensure_ascii=False)},
-                ],
-                max_tokens=max_tokens,
-                temperature=0.2,
-            )
+            with openai_call(model) as call:
+                resp = get_client().chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user",   "content": json.dumps(article, ensure_ascii=False)},
+                    ],
+                    max_tokens=max_tokens,
+                    temperature=0.2,
+                )
+                call["tokens"] = resp.usage.total_tokens
             raw  = resp.choices[0].message.content
-            log.info("Raw OpenAI response: %s", raw)
+            log.debug("Raw OpenAI response: %s", raw)
             data = json.loads(raw)
-            log.info("Parsed analysis data: %s", json.dumps(data, ensure_ascii=False, indent=2))
             data["tokens"] = resp.usage.total_tokens
             data["content_type"] = content_type  # Add content type to response
             data["model_used"] = model  # Add model info to response
+            data["prompt_version"] = PROMPT_VERSION
             return data
         except Exception as e:
+            last_error = e
             log.warning("OpenAI error (try %d/3): %s", tries, e)
             time.sleep(2 ** tries)
 
-    # all retries failed → return empty shell
-    return {
-        "bias_analysis": {
-            "political_leaning": None,
-            "framing_analysis": None,
-            "language_analysis": None,
-            "source_analysis": None,
-            "omission_analysis": None
-        },
-        "balanced_perspective": {
-            "missing_viewpoints": None,
-            "additional_context": None,
-            "improvement_suggestions": None
-        },
-        "factual_accuracy": {
-            "claim_verification": None,
-            "unsupported_assertions": None,
-            "logical_fallacies": None,
-            "source_credibility": None
-        },
-        "reporting_quality": {
-            "objectivity_score": None,
-            "depth_score": None,
-            "evidence_score": None,
-            "clarity_score": None,
-            "overall_quality": None
-        },
-        "dalio_perspective": {
-            "cycle_analysis": None,
-            "pattern_identification": None,
-            "long_term_implications": None,
-            "principles_applied": None
-        },
-        "elon_musk_perspective": {
-            "tech_perspective": None,
-            "innovation_potential": None,
-            "future_vision": None,
-            "practical_application": None
-        },
-        "tokens": 0,
-        "content_type": content_type,
-        "model_used": model
-    }
+    raise AnalysisFailed(f"OpenAI analysis failed after {tries} tries: {last_error}")
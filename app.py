@@ -1,77 +1,124 @@
 #!/usr/bin/env python3
-from datetime import datetime, timedelta
+"""
+Web front end.  `create_app()` builds the Flask app; gunicorn calls it via
+`gunicorn "app:create_app()"` and `flask --app app run` finds it on its own.
+
+Nothing heavy is imported here: the OpenAI client (analysis.py) and the
+scraping stack (fetch_news.py) load on first use inside the job and fetch
+threads, NumPy (score_store.py) on the first /analytics view, and the
+schema is created by `flask --app app init-db` (Procfile release phase)
+rather than by every worker at boot.
+"""
+import time
+_import_started = time.perf_counter()
+
+from datetime import datetime
 import json
-from collections import defaultdict
-from flask import Flask, render_template, jsonify, abort, request
+from flask import Blueprint, Flask, Response, current_app, g, render_template, jsonify, abort, request, url_for
 from flask_talisman import Talisman
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from dotenv import load_dotenv
-from models   import Session, Article, init_db
-from analysis import analyse_article
+from models   import db_session, read_session, Article, AnalysisJob, FetchRun, init_db
+from jobs     import enqueue, is_fresh, job_to_dict
 from sources  import SITES           # ← dynamic registry
-from config   import MODELS, ADMIN_PASSWORD, FLASK_ENV, template_config  # Use template_config instead of config
-from fetch_news import collect_news, NEWS_PER_SITE, NEWS_SUMMARY_LEN  # Import fetch functions
-from sqlalchemy import or_, func
+from search   import match_ids, parse_terms
+from store    import reset_analyses, delete_articles, attach_analyses, current_analyses, analysis_history
+from aggregates import daily_trends, site_metrics
+from pagination import PAGE_SIZE, BadCursor, clamp_limit, recent_page, search_page
+from config   import MODELS, ADMIN_PASSWORD, FLASK_ENV, METRICS_TOKEN, LOG_SAMPLE_RATE, INIT_DB_ON_STARTUP, QUERY_DEBUG_HEADERS, PROFILE_SLOW_MS, template_config  # Use template_config instead of config
+from runs     import claim_run, start_background, run_to_dict, recent_runs
+from scheduler import record_demand
+import metrics
+import profiling
+import hmac
 import logging
 import os
 from functools import wraps
 
 load_dotenv()
-app = Flask(__name__)
-app.config.from_prefixed_env()
+log = logging.getLogger("app")
+bp = Blueprint("news", __name__)
+
+# Request timing + per-request DB accounting (see metrics.py)
+@bp.before_app_request
+def start_timer():
+    metrics.begin_request()
+
+@bp.after_app_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    stats = metrics.end_request(request.method, route, response.status_code)
+    if stats is None:
+        return response
+    if QUERY_DEBUG_HEADERS:
+        response.headers['X-DB-Queries'] = str(stats["queries"])
+        response.headers['Server-Timing'] = (
+            f'db;dur={stats["db_seconds"] * 1000:.1f};desc="{stats["queries"]} queries", '
+            f'app;dur={stats["seconds"] * 1000:.1f}')
+    view = current_app.view_functions.get(request.endpoint)
+    metrics.check_budget(route, stats["queries"], getattr(view, "query_budget", None))
+    return response
+
+# On-demand profiling (see profiling.py): every request while PROFILE_MODE is
+# set, kept when slow; or one request sending X-Profile: <ADMIN_PASSWORD>
+@bp.before_app_request
+def start_profile():
+    token = request.headers.get('X-Profile')
+    forced = bool(token and ADMIN_PASSWORD
+                  and hmac.compare_digest(token.encode(), ADMIN_PASSWORD.encode()))
+    if profiling.ENABLED or forced:
+        g.profile = profiling.start(request.path, force=forced)
+        g.profile_forced = forced
+
+@bp.after_app_request
+def stop_profile(response):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        path = profile.stop(min_ms=0 if g.get('profile_forced') else PROFILE_SLOW_MS)
+        if path and g.get('profile_forced'):
+            response.headers['X-Profile-File'] = os.path.basename(path)
+    return response
+
+@bp.teardown_app_request
+def discard_profile(exc):
+    # after_request does not run when the view raised
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop(min_ms=float('inf'))
 
 # Basic security headers
-@app.after_request
+@bp.after_app_request
 def add_security_headers(response):
     response.headers['X-Content-Type-Options'] = 'nosniff'
     response.headers['X-Frame-Options'] = 'SAMEORIGIN'
     response.headers['X-XSS-Protection'] = '1; mode=block'
     return response
 
-# Security headers - configured for both dev and prod
-Talisman(app,
-    force_https=FLASK_ENV == 'production',  # Only force HTTPS in production
-    strict_transport_security=FLASK_ENV == 'production',  # Only HSTS in production
-    session_cookie_secure=FLASK_ENV == 'production',  # Only secure cookies in production
-    content_security_policy={
-        'default-src': "'self'",
-        'script-src': "'self' 'unsafe-inline' https://cdn.jsdelivr.net",
-        'style-src': "'self' 'unsafe-inline'",
-        'img-src': "'self' data: https:",
-        'connect-src': "'self'",
-    },
-    feature_policy={
-        'geolocation': "'none'",
-        'camera': "'none'",
-        'microphone': "'none'",
-    }
-)
-
 # Error handlers
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found_error(error):
     return render_template('404.html', 
                          sites=SITES,
                          now=datetime.utcnow()), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
     return render_template('500.html', 
                          sites=SITES,
                          now=datetime.utcnow()), 500
 
 # Rate limiting - only in production
+limiter = None
 if FLASK_ENV == 'production':
     try:
         # Log Redis URL (without password) for debugging
         redis_url = os.getenv("REDIS_URL", "")
         if redis_url:
             safe_url = redis_url.split("@")[-1] if "@" in redis_url else redis_url
-            print(f"Initializing rate limiter with Redis at {safe_url}")
+            log.info("Initializing rate limiter with Redis at %s", safe_url)
         
         limiter = Limiter(
-            app=app,
             key_func=get_remote_address,
             default_limits=["200 per day", "50 per hour"],
             storage_uri=os.getenv("REDIS_URL"),
@@ -81,39 +128,43 @@ if FLASK_ENV == 'production':
                 "socket_connect_timeout": 5
             },
             strategy="fixed-window",    # More reliable than the default
-            on_breach=lambda: print("Rate limit breached")  # Add logging
+            on_breach=lambda limit: metrics.RATE_LIMITED.inc()
         )
 
         # Add rate limits to API endpoints
         def rate_limit(limit):
             return limiter.limit(limit)
             
-        print("Rate limiter initialized successfully")
     except Exception as e:
-        print(f"Error initializing rate limiter: {str(e)}")
+        log.error("Error initializing rate limiter: %s", e)
+        limiter = None
         # Fallback to dummy decorator if Redis is not available
         def rate_limit(limit):
             def decorator(f):
                 @wraps(f)
                 def wrapped(*args, **kwargs):
-                    print(f"Rate limit {limit} would be applied here (Redis unavailable)")
+                    metrics.log_event(log, "rate_limit_skipped", level=logging.WARNING,
+                                      sample=LOG_SAMPLE_RATE,
+                                      limit=limit, reason="redis unavailable")
                     return f(*args, **kwargs)
                 return wrapped
             return decorator
-        print("Using dummy rate limiter (no actual rate limiting)")
+        log.warning("Using dummy rate limiter (no actual rate limiting)")
 else:
     # Dummy decorator for development
     def rate_limit(limit):
         def decorator(f):
             @wraps(f)
             def wrapped(*args, **kwargs):
-                print(f"Rate limit {limit} would be applied here (development mode)")
+                metrics.log_event(log, "rate_limit_skipped", level=logging.DEBUG,
+                                  sample=LOG_SAMPLE_RATE,
+                                  limit=limit, reason="development")
                 return f(*args, **kwargs)
             return wrapped
         return decorator
 
 # Add error handler for rate limit exceeded
-@app.errorhandler(429)
+@bp.app_errorhandler(429)
 def ratelimit_handler(e):
     return jsonify({
         "error": "Rate limit exceeded",
@@ -122,7 +173,7 @@ def ratelimit_handler(e):
     }), 429
 
 # Add error handler for Redis connection issues
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def redis_error_handler(e):
     if "Redis" in str(e):
         return jsonify({
@@ -131,14 +182,8 @@ def redis_error_handler(e):
         }), 503
     return e
 
-init_db()
-
-# Rate limiting constants
-FETCH_COOLDOWN_MINUTES = 15  # Minimum minutes between fetches
-MAX_FETCHES_PER_DAY = 48     # Maximum fetches per day (increased from 24)
-
 # Add custom Jinja filter
-@app.template_filter('from_json')
+@bp.app_template_filter('from_json')
 def from_json(value):
     if not value:
         return {}
@@ -151,127 +196,103 @@ def from_json(value):
 def site_exists(slug: str) -> bool:     # central truth
     return slug in SITES
 
-def check_fetch_limits() -> tuple[bool, str]:
-    """Check if we can fetch news based on rate limits.
-    Returns (can_fetch, message)"""
-    sess = Session()
-    try:
-        # Get the most recent fetch
-        latest_fetch = (
-            sess.query(Article.fetched_at)
-            .order_by(Article.fetched_at.desc())
-            .first()
-        )
-        
-        if latest_fetch:
-            # Check cooldown period
-            cooldown = timedelta(minutes=FETCH_COOLDOWN_MINUTES)
-            if datetime.utcnow() - latest_fetch[0] < cooldown:
-                remaining = cooldown - (datetime.utcnow() - latest_fetch[0])
-                return False, f"Vänta {int(remaining.total_seconds() / 60)} minuter innan nästa uppdatering"
-            
-            # Check daily limit - count distinct fetch operations instead of articles
-            today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-            
-            # Get all timestamps and round them in Python instead of SQL
-            raw_timestamps = (
-                sess.query(Article.fetched_at)
-                .filter(Article.fetched_at >= today_start)
-                .all()
-            )
-            
-            # Round timestamps to seconds in Python
-            rounded_timestamps = set(
-                ts[0].replace(microsecond=0)
-                for ts in raw_timestamps
-            )
-            
-            # Debug: Print rounded timestamps
-            print("\nDEBUG: Fetch timestamps today (rounded to seconds):")
-            for ts in sorted(rounded_timestamps, reverse=True):
-                print(f"  {ts}")
-            
-            today_fetches = len(rounded_timestamps)
-            print(f"\nDEBUG: Found {today_fetches} distinct fetch operations today")
-            
-            if today_fetches >= MAX_FETCHES_PER_DAY:
-                return False, f"Maximalt antal uppdateringar ({MAX_FETCHES_PER_DAY}) för idag har nåtts"
-        
-        return True, "OK"
-    finally:
-        sess.close()
+def read_only(view):
+    """Serve this view from the read engine (replica / separate pool)."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return wrapped
 
-# ---------- front page (all) -----------------------------------------
-@app.route("/")
-def index_all():
-    query = request.args.get('q', '').strip()
-    sess = Session()
-    
+def query_budget(n: int):
+    """Most SQL statements one request to this view may run (see
+    metrics.check_budget); put it right under the route decorator."""
+    def decorator(view):
+        view.query_budget = n
+        return view
+    return decorator
+
+def db():
+    """Session for the current request: the reader inside @read_only views,
+    the writer everywhere else."""
+    return read_session() if g.get('read_only') else db_session()
+
+def load_page(sess, site, query, cursor, limit=PAGE_SIZE):
+    """One keyset page for a listing or search, analyses attached; raises BadCursor."""
     if query:
-        # Search in title and summary
-        arts = (
-            sess.query(Article)
-            .filter(or_(
-                Article.title.ilike(f'%{query}%'),
-                Article.summary.ilike(f'%{query}%')
-            ))
-            .order_by(Article.fetched_at.desc())
-            .limit(30)
-            .all()
-        )
+        page = search_page(sess, query, site=site, cursor=cursor, limit=limit)
     else:
-        arts = (
-            sess.query(Article)
-            .order_by(Article.fetched_at.desc())
-            .limit(30)
-            .all()
-        )
-    
-    sess.close()
+        page = recent_page(sess, site=site, cursor=cursor, limit=limit)
+    attach_analyses(sess, page.items)
+    return page
+
+def render_listing(site):
+    query = request.args.get('q', '').strip()
+    cursor = request.args.get('cursor') or None
+    try:
+        page = load_page(db(), site, query, cursor)
+    except BadCursor:
+        abort(400)
+
     return render_template("index.html",
-        sites=SITES, current_site="all", articles=arts,
+        sites=SITES, current_site=site or "all", articles=page.items,
+        next_cursor=page.next_cursor,
         now=datetime.utcnow(), search_query=query, config=template_config)
 
+# ---------- front page (all) -----------------------------------------
+@bp.route("/")
+@query_budget(3)
+@read_only
+def index_all():
+    return render_listing(None)
+
 # ---------- front page (single) --------------------------------------
-@app.route("/site/<site>")
+@bp.route("/site/<site>")
+@query_budget(3)
+@read_only
 def index_site(site: str):
     if not site_exists(site):
         abort(404)
-    
+    return render_listing(site)
+
+# ---------- listing API (infinite scroll) ----------------------------
+@bp.route("/api/articles")
+@query_budget(3)
+@read_only
+def api_articles():
+    site = request.args.get('site') or None
+    if site and not site_exists(site):
+        return jsonify({'error': 'Unknown site'}), 404
+
     query = request.args.get('q', '').strip()
-    sess = Session()
-    
-    if query:
-        # Search in title and summary for specific site
-        arts = (
-            sess.query(Article)
-            .filter_by(site=site)
-            .filter(or_(
-                Article.title.ilike(f'%{query}%'),
-                Article.summary.ilike(f'%{query}%')
-            ))
-            .order_by(Article.fetched_at.desc())
-            .limit(30)
-            .all()
-        )
-    else:
-        arts = (
-            sess.query(Article)
-            .filter_by(site=site)
-            .order_by(Article.fetched_at.desc())
-            .limit(30)
-            .all()
-        )
-    
-    sess.close()
-    return render_template("index.html",
-        sites=SITES, current_site=site, articles=arts,
-        now=datetime.utcnow(), search_query=query, config=template_config)
+    cursor = request.args.get('cursor') or None
+    limit = clamp_limit(request.args.get('limit', type=int))
+    try:
+        page = load_page(db(), site, query, cursor, limit)
+    except BadCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    payload = {
+        'articles': [{
+            'id': a.id,
+            'site': a.site,
+            'title': a.title,
+            'summary': a.summary,
+            'url': a.url,
+            'fetched_at': a.fetched_at.isoformat() if a.fetched_at else None,
+            'analyzed': a.analyzed_at is not None,
+        } for a in page.items],
+        'html': render_template("_article_cards.html", articles=page.items),
+        'next_cursor': page.next_cursor,
+    }
+    return jsonify(payload)
 
 # ---------- analyse one article --------------------------------------
-@app.route('/api/analyse', methods=['POST'])
+@bp.route('/api/analyse', methods=['POST'])
+@query_budget(7)
 @rate_limit("30 per hour")
 def api_analyse():
+    """Queue an analysis; the client polls the returned status_url."""
     try:
         data = request.get_json()
         article_id = data.get('article_id')
@@ -279,175 +300,136 @@ def api_analyse():
         if not article_id:
             return jsonify({'error': 'No article ID provided'}), 400
             
-        sess = Session()
-        article = sess.query(Article).get(article_id)
+        sess = db()
+        article = sess.get(Article, article_id)
         if not article:
-            sess.close()
             return jsonify({'error': 'Article not found'}), 404
             
-        # Get analysis from OpenAI
-        analysis = analyse_article({"title": article.title, "summary": article.summary})
-        
-        # Update article with analysis results
-        article.bias_analysis = json.dumps(analysis.get('bias_analysis', {}), ensure_ascii=False)
-        article.balanced_perspective = json.dumps(analysis.get('balanced_perspective', {}), ensure_ascii=False)
-        article.factual_accuracy = json.dumps(analysis.get('factual_accuracy', {}), ensure_ascii=False)
-        article.reporting_quality = json.dumps(analysis.get('reporting_quality', {}), ensure_ascii=False)
-        article.dalio_perspective = json.dumps(analysis.get('dalio_perspective', {}), ensure_ascii=False)
-        
-        # Count verifications and corrections
-        claim_verification = analysis['factual_accuracy']['claim_verification']
-        unsupported_assertions = analysis['factual_accuracy']['unsupported_assertions']
-        
-        # Count verified claims (must contain both PÅSTÅENDE: and VERIFIERING: with HÖG or MEDEL confidence)
-        verified_count = sum(1 for line in claim_verification.split('\n') 
-                           if 'PÅSTÅENDE:' in line and 'VERIFIERING:' in line 
-                           and ('KONFIDENS: HÖG' in line or 'KONFIDENS: MEDEL' in line))
-        
-        # Count corrected claims (must contain both PÅSTÅENDE: and KORRIGERING: with non-empty correction)
-        corrected_count = (
-            sum(1 for line in claim_verification.split('\n') 
-                if 'PÅSTÅENDE:' in line and 'KORRIGERING:' in line 
-                and not line.split('KORRIGERING:')[1].strip() == '') +
-            sum(1 for line in unsupported_assertions.split('\n')
-                if 'PÅSTÅENDE:' in line and 'KORRIGERING:' in line 
-                and not line.split('KORRIGERING:')[1].strip() == '')
-        )
-        
-        article.verified_claims = verified_count
-        article.corrected_claims = corrected_count
-        
-        article.analysis_sources = json.dumps(analysis.get("sources", []), ensure_ascii=False)
-        article.analyzed_at = datetime.utcnow()
-        article.last_updated_at = datetime.utcnow()
-        
-        # Keep old fields for backward compatibility
-        article.balanced_title = analysis.get("main_facts", "")[:300]  # Truncate to match column size
-        article.balanced_summary = analysis.get("context", "")
-        article.bias_score = 0  # No longer used but keeping for compatibility
-        article.bias_label = "nyanserad"
-        article.bias_explanation = analysis.get("perspectives", "")
-        article.openai_tokens = analysis.get("tokens", 0)
-        
-        # Store the full analysis
-        article.nuanced_perspective = json.dumps(analysis, ensure_ascii=False)
+        # Recent enough: serve the stored analysis without calling OpenAI
+        fresh = is_fresh(article)
+        metrics.cache_result("analysis", fresh)
+        if fresh:
+            payload = {
+                'status': 'done',
+                'cached': True,
+                'article_id': article.id,
+                'analysis': current_analyses(sess, [article]).get(article.id),
+                'verified_claims': article.verified_claims,
+                'corrected_claims': article.corrected_claims,
+            }
+            return jsonify(payload)
         
+        # Reader demand raises the article's backlog priority (scheduler.py);
+        # committed now, so the SQLite write lock is not held while enqueue
+        # waits for its file lock (locks are taken file lock first)
+        record_demand(sess, article.id)
         sess.commit()
-        sess.close()
-        
-        return jsonify({
-            'success': True,
-            'analysis': analysis,
-            'verified_claims': verified_count,
-            'corrected_claims': corrected_count
-        })
+
+        # The OpenAI call happens in the worker, not in this request;
+        # requests for an article already in the queue join that job
+        job, created = enqueue(sess, article.id)
+        metrics.cache_result("analysis_job", not created)
+        payload = job_to_dict(job)
+        payload['coalesced'] = not created
+        payload['status_url'] = url_for('.api_job', job_id=payload['job_id'])
+        return jsonify(payload), 202
         
     except Exception as e:
-        if 'sess' in locals():
-            sess.close()
         return jsonify({'error': str(e)}), 500
 
+@bp.get('/api/jobs/<int:job_id>')
+@query_budget(2)
+def api_job(job_id: int):
+    """Status of a queued analysis (queued / running / done / failed)."""
+    sess = db()
+    job = sess.get(AnalysisJob, job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    article = sess.get(Article, job.article_id) if job.status == 'done' else None
+    return jsonify(job_to_dict(job, article))
+
+@bp.get('/api/articles/<int:article_id>/analyses')
+@query_budget(2)
+@read_only
+def api_article_analyses(article_id: int):
+    """Every analysis of an article, newest first (model, prompt version, scores)."""
+    sess = db()
+    article = sess.get(Article, article_id)
+    if not article:
+        return jsonify({'error': 'Article not found'}), 404
+    return jsonify({
+        'article_id': article.id,
+        'current': article.analysis_id,
+        'analyses': [{
+            'id': a.id,
+            'created_at': a.created_at.isoformat(),
+            'model': a.model,
+            'prompt_version': a.prompt_version,
+            'content_type': a.content_type,
+            'tokens': a.tokens,
+            'verified_claims': a.verified_claims,
+            'corrected_claims': a.corrected_claims,
+            'scores': {n: getattr(a, f'{n}_score') for n in ('objectivity', 'depth', 'evidence', 'clarity')},
+            'analysis': a.payload,
+        } for a in analysis_history(sess, article.id)],
+    })
+
 # ----------------------------------------------------------------------
 # Analytics – verification metrics per outlet
 # ----------------------------------------------------------------------
-@app.route("/analytics")
+@bp.route("/analytics")
+@query_budget(5)
+@read_only
 def analytics():
     query = request.args.get('q', '').strip()
-    sess = Session()
+    if not parse_terms(query):
+        query = ''
+    sess = db()
     
+    # Per-worker NumPy copy of the scores: filters, percentiles, histograms
+    from score_store import store as score_store   # NumPy loads on first use
+    snap = score_store.snapshot(sess)
+    hits, comparison = None, None
     if query:
-        # Search in title and summary
-        rows = (
-            sess.query(
-                Article.site,
-                Article.verified_claims,
-                Article.corrected_claims,
-                Article.nuanced_perspective,
-                Article.analyzed_at
-            )
-            .filter(Article.nuanced_perspective.is_not(None))
-            .filter(or_(
-                Article.title.ilike(f'%{query}%'),
-                Article.summary.ilike(f'%{query}%')
-            ))
-            .all()
-        )
+        # Full-text filter on title and summary, aggregated over the arrays
+        hits = snap.mask(ids=sess.execute(match_ids(sess, query)).scalars().all())
+        site_stats = snap.site_metrics(hits)
+        comparison = snap.compare(hits)
     else:
-        rows = (
-            sess.query(
-                Article.site,
-                Article.verified_claims,
-                Article.corrected_claims,
-                Article.nuanced_perspective,
-                Article.analyzed_at
-            )
-            .filter(Article.nuanced_perspective.is_not(None))
-            .all()
-        )
-    
-    # Debug: Print raw data
-    print("Raw rows:", rows)
-    
-    # Aggregate per site
-    metrics = defaultdict(lambda: {
-        "verified": 0,
-        "corrected": 0,
-        "total_articles": 0,
-        "avg_objectivity": 0,
-        "avg_depth": 0,
-        "avg_evidence": 0,
-        "avg_clarity": 0
-    })
-    
-    for site, v, c, analysis_json, analyzed_at in rows:
-        metrics[site]["verified"] += v or 0
-        metrics[site]["corrected"] += c or 0
-        metrics[site]["total_articles"] += 1
-        
-        try:
-            analysis = json.loads(analysis_json)
-            quality = analysis.get("reporting_quality", {})
-            if quality:
-                metrics[site]["avg_objectivity"] += quality.get("objectivity_score", 0) or 0
-                metrics[site]["avg_depth"] += quality.get("depth_score", 0) or 0
-                metrics[site]["avg_evidence"] += quality.get("evidence_score", 0) or 0
-                metrics[site]["avg_clarity"] += quality.get("clarity_score", 0) or 0
-        except (json.JSONDecodeError, TypeError) as e:
-            print(f"Error parsing analysis for {site}:", e)
-            continue
-
-    # Calculate averages
-    for site in metrics:
-        total = metrics[site]["total_articles"]
-        if total > 0:
-            metrics[site]["avg_objectivity"] = min(100, max(0, round(metrics[site]["avg_objectivity"] / total, 1)))
-            metrics[site]["avg_depth"] = min(100, max(0, round(metrics[site]["avg_depth"] / total, 1)))
-            metrics[site]["avg_evidence"] = min(100, max(0, round(metrics[site]["avg_evidence"] / total, 1)))
-            metrics[site]["avg_clarity"] = min(100, max(0, round(metrics[site]["avg_clarity"] / total, 1)))
+        # Pre-aggregated running totals: one row per site
+        site_stats = site_metrics(sess)
+    distribution = {
+        "percentiles": snap.percentiles(hits),
+        "histograms": snap.histograms(hits),
+    }
+
+    # Daily rollup for the trend chart: one row per site and day shown
+    days = min(max(request.args.get('days', 30, type=int), 7), 365)
+    trends = daily_trends(sess, days)
 
     # Prepare data for chart
     labels, v_data, c_data = [], [], []
     for slug, meta in SITES.items():
-        if slug in metrics:
+        if slug in site_stats:
             labels.append(meta["name"])
-            v_data.append(metrics[slug]["verified"])
-            c_data.append(metrics[slug]["corrected"])
+            v_data.append(site_stats[slug]["verified"])
+            c_data.append(site_stats[slug]["corrected"])
 
     payload = {
         "labels": labels,
         "verified": v_data,
         "corrected": c_data,
-        "metrics": {site: data for site, data in metrics.items()}
+        "metrics": site_stats
     }
-    
-    # Debug: Print final payload
-    print("Final payload:", json.dumps(payload, indent=2))
-    
-    sess.close()
 
     return render_template(
         "analytics.html",
         verification_data=payload,
+        trends=trends,
+        trend_days=days,
+        distribution=distribution,
+        comparison=comparison,
+        site_names={slug: meta["name"] for slug, meta in SITES.items()},
         sites=SITES,
         now=datetime.utcnow(),
         search_query=query
@@ -455,7 +437,8 @@ def analytics():
 
 
 # ---------- dev reset -------------------------------------------------
-@app.route('/reset-analytics', methods=['POST'])
+@bp.route('/reset-analytics', methods=['POST'])
+@query_budget(12)
 def reset_analytics():
     data = request.get_json()
     if not data or 'password' not in data or data['password'] != ADMIN_PASSWORD:
@@ -463,22 +446,15 @@ def reset_analytics():
         
     try:
         # Reset all analysis data
-        sess = Session()
-        sess.query(Article).update({
-            'nuanced_perspective': None,
-            'analyzed_at': None,
-            'last_updated_at': None,
-            'verified_claims': 0,
-            'corrected_claims': 0
-        })
+        sess = db()
+        reset_analyses(sess)
         sess.commit()
-        sess.close()
         return jsonify({'status': 'ok'})
     except Exception as e:
-        sess.rollback()
-        return jsonify({'error': str(e)}), 500
+        return jsonify({'error': str(e)}), 500   # teardown rolls back
 
-@app.post("/reset-all")
+@bp.post("/reset-all")
+@query_budget(12)
 @rate_limit("3 per hour")
 def reset_all():
     # Get password from request
@@ -495,66 +471,118 @@ def reset_all():
         return jsonify({'error': 'Invalid password'}), 401
     
     # If password is correct, proceed with reset
-    sess = Session()
-    sess.query(Article).delete()
+    sess = db()
+    delete_articles(sess)
     sess.commit()
-    sess.close()
     return ("", 204)
 
 # ---------- fetch news -------------------------------------------------
-@app.post("/api/fetch-news")
+@bp.post("/api/fetch-news")
+@query_budget(8)
 @rate_limit("10 per hour")
 def api_fetch_news():
+    """Start (or join) a background fetch run and return its status at once."""
     try:
-        # Check rate limits
-        can_fetch, message = check_fetch_limits()
-        if not can_fetch:
+        run, started, message = claim_run(db(), "web")
+        if run is None:
             return jsonify({"status": "error", "message": message}), 429
         
-        # Fetch news from all sources
-        news = collect_news(NEWS_PER_SITE, NEWS_SUMMARY_LEN)
-        sess = Session()
-        
-        # Store new articles
-        for site, items in news.items():
-            for art in items:
-                # Check if article already exists
-                existing = sess.query(Article).filter_by(site=site, url=art["url"]).first()
-                if not existing:
-                    row = Article(
-                        site=site,
-                        title=art["title"],
-                        summary=art["summary"],
-                        url=art["url"],
-                        fetched_at=datetime.utcnow(),
-                        # Initialize new fields as None/0
-                        nuanced_perspective=None,
-                        verified_claims=0,
-                        corrected_claims=0,
-                        analysis_sources=None,
-                        analyzed_at=None,
-                        last_updated_at=None,
-                        # Legacy fields
-                        balanced_title=None,
-                        balanced_summary=None,
-                        bias_score=None,
-                        bias_label=None,
-                        bias_explanation=None,
-                        openai_tokens=0,
-                    )
-                    sess.add(row)
-        
-        sess.commit()
-        sess.close()
-        return jsonify({"status": "ok", "message": "News fetched successfully"})
+        payload = run_to_dict(run)
+        if started:
+            start_background(payload["id"])
+        payload.update({
+            "run_id": payload["id"],
+            "coalesced": not started,
+            "message": message,
+            "status_url": url_for(".api_fetch_run", run_id=payload["id"]),
+        })
+        return jsonify(payload), 202
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
-@app.route('/about')
+@bp.get("/api/fetch-runs/<int:run_id>")
+@query_budget(1)
+def api_fetch_run(run_id: int):
+    run = db().get(FetchRun, run_id)
+    if not run:
+        return jsonify({"error": "Run not found"}), 404
+    return jsonify(run_to_dict(run))
+
+@bp.get("/api/fetch-runs")
+@query_budget(1)
+@read_only
+def api_fetch_runs():
+    """Recent fetch runs for ops: timing, per-site counts, status."""
+    limit = max(1, min(request.args.get('limit', 20, type=int), 200))
+    return jsonify({"runs": recent_runs(db(), limit)})
+
+# ---------- metrics ---------------------------------------------------
+@bp.get("/metrics")
+@query_budget(0)
+def prometheus_metrics():
+    """Prometheus text exposition, aggregated across gunicorn workers."""
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        abort(401)
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+@bp.route('/about')
+@query_budget(0)
+@read_only
 def about():
     return render_template('about.html', 
                          sites=SITES,
                          now=datetime.utcnow())
 
+
+# ---------- application factory ---------------------------------------
+def create_app() -> Flask:
+    app = Flask(__name__)
+    app.config.from_prefixed_env()
+
+    # Security headers - configured for both dev and prod
+    Talisman(app,
+        force_https=FLASK_ENV == 'production',  # Only force HTTPS in production
+        strict_transport_security=FLASK_ENV == 'production',  # Only HSTS in production
+        session_cookie_secure=FLASK_ENV == 'production',  # Only secure cookies in production
+        content_security_policy={
+            'default-src': "'self'",
+            'script-src': "'self' 'unsafe-inline' https://cdn.jsdelivr.net",
+            'style-src': "'self' 'unsafe-inline'",
+            'img-src': "'self' data: https:",
+            'connect-src': "'self'",
+        },
+        feature_policy={
+            'geolocation': "'none'",
+            'camera': "'none'",
+            'microphone': "'none'",
+        }
+    )
+    if limiter is not None:
+        limiter.init_app(app)
+        log.info("Rate limiter initialized")
+
+    app.register_blueprint(bp)
+
+    # One Session per request, closed (and rolled back if uncommitted) at
+    # the end of the app context – error paths included
+    @app.teardown_appcontext
+    def remove_session(exc):
+        db_session.remove()
+        read_session.remove()
+
+    @app.cli.command("init-db")
+    def init_db_command():
+        """Apply pending schema migrations (migrate.py)."""
+        init_db()
+        log.info("Database initialised")
+
+    if INIT_DB_ON_STARTUP:
+        init_db()
+
+    metrics.record_startup(time.perf_counter() - _import_started)
+    return app
+
+
 if __name__ == "__main__":
-    app.run()
+    create_app().run()
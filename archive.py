@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Archive tier for aged-out articles.
+
+fetch_news.py keeps the newest KEEP_ARTICLES articles in the database.  With
+ARCHIVE_DIR set, older ones – and every analysis of them – are first written
+to Parquet files (zstd-compressed, columnar) partitioned by the day the
+article was fetched:
+
+    ARCHIVE_DIR/articles/day=2024-05-01/part-<first id>-<last id>.parquet
+    ARCHIVE_DIR/analyses/day=2024-05-01/part-<first id>-<last id>.parquet
+
+Files are only ever added; one is named after the article ids it holds, so
+re-archiving the same batch after a failed delete replaces it instead of
+duplicating rows.  The reader functions below memory-map the partitions and
+never touch the live database.
+
+pyarrow is optional, but with ARCHIVE_DIR set prune() refuses to run
+without it (RuntimeError) – rows are archived before they are deleted, or
+not deleted at all.
+
+    python archive.py --list                   # partitions and row counts
+    python archive.py --trends --since 2024-01-01
+"""
+from __future__ import annotations
+import argparse, json, logging, os, sys
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from config import ARCHIVE_DIR
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:          # optional: archiving is off without it
+    pa = pc = pq = None
+
+log = logging.getLogger("archive")
+
+KINDS = ("articles", "analyses")
+BATCH = 1000
+SCORES = ("objectivity", "depth", "evidence", "clarity")
+
+
+def available() -> bool:
+    return pq is not None
+
+
+def _schemas() -> dict:
+    scores = [(f"{n}_score", pa.float64()) for n in SCORES]
+    return {
+        "articles": pa.schema([
+            ("id", pa.int64()), ("site", pa.string()), ("title", pa.string()),
+            ("summary", pa.string()), ("url", pa.string()),
+            ("fetched_at", pa.timestamp("us")), ("analyzed_at", pa.timestamp("us")),
+            ("analysis_id", pa.int64()),
+            ("verified_claims", pa.int32()), ("corrected_claims", pa.int32()),
+            *scores,
+        ]),
+        "analyses": pa.schema([
+            ("id", pa.int64()), ("article_id", pa.int64()), ("site", pa.string()),
+            ("created_at", pa.timestamp("us")), ("model", pa.string()),
+            ("prompt_version", pa.string()), ("content_type", pa.string()),
+            ("tokens", pa.int32()), ("payload", pa.string()),     # JSON text
+            ("verified_claims", pa.int32()), ("corrected_claims", pa.int32()),
+            *scores,
+        ]),
+    }
+
+
+# ---------- writing ------------------------------------------------------
+def _day(ts: Optional[datetime]) -> str:
+    return (ts or datetime.utcnow()).date().isoformat()
+
+
+def _write(kind: str, day: str, rows: List[dict], first_id: int, last_id: int) -> str:
+    folder = os.path.join(ARCHIVE_DIR, kind, f"day={day}")
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"part-{first_id:010d}-{last_id:010d}.parquet")
+    table = pa.Table.from_pylist(rows, schema=_schemas()[kind])
+    tmp = path + ".tmp"
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, path)          # readers never see half a file
+    return path
+
+
+def archive_articles(sess, *criteria) -> int:
+    """Write articles matching `criteria` and their analyses to the archive."""
+    from models import Article, ArticleAnalysis
+
+    art_cols = [c.name for c in _schemas()["articles"]]
+    ana_cols = [c.name for c in _schemas()["analyses"] if c.name not in ("site", "payload")]
+    archived, after = 0, 0
+    while True:
+        articles = (
+            sess.query(Article).filter(Article.id > after, *criteria)
+            .order_by(Article.id).limit(BATCH).all()
+        )
+        if not articles:
+            break
+        after = articles[-1].id
+        first_id, last_id = articles[0].id, articles[-1].id
+        by_id = {a.id: a for a in articles}
+
+        art_rows, ana_rows = defaultdict(list), defaultdict(list)
+        for a in articles:
+            art_rows[_day(a.fetched_at)].append({c: getattr(a, c) for c in art_cols})
+        for an in sess.scalars(
+            select(ArticleAnalysis).where(ArticleAnalysis.article_id.in_(list(by_id)))
+            .order_by(ArticleAnalysis.id)
+        ):
+            art = by_id[an.article_id]
+            row = {c: getattr(an, c) for c in ana_cols}
+            row["site"] = art.site
+            row["payload"] = json.dumps(an.payload, ensure_ascii=False)
+            ana_rows[_day(art.fetched_at)].append(row)
+
+        for day, rows in art_rows.items():
+            _write("articles", day, rows, first_id, last_id)
+        for day, rows in ana_rows.items():
+            _write("analyses", day, rows, first_id, last_id)
+        archived += len(articles)
+    if archived:
+        log.info("Archived %d articles to %s", archived, ARCHIVE_DIR)
+    return archived
+
+
+def prune(sess, keep: int) -> int:
+    """
+    Delete all but the `keep` newest articles, archiving them first when
+    ARCHIVE_DIR is set (RuntimeError, nothing deleted, if pyarrow is
+    missing then).  Returns the number of articles deleted.
+    """
+    from models import Article
+    from store import delete_articles
+
+    cutoff = sess.query(Article.id).order_by(Article.fetched_at.desc()).offset(keep).first()
+    if not cutoff:
+        return 0
+    criteria = (Article.id < cutoff[0],)
+    if ARCHIVE_DIR:
+        if not available():
+            raise RuntimeError("ARCHIVE_DIR is set but pyarrow is not installed – "
+                               "not pruning, install pyarrow or unset ARCHIVE_DIR")
+        archive_articles(sess, *criteria)
+    deleted = delete_articles(sess, *criteria)
+    sess.commit()
+    return deleted
+
+
+# ---------- reading ------------------------------------------------------
+def partitions(kind: str = "articles", start: Optional[date] = None,
+               end: Optional[date] = None, root: Optional[str] = None
+               ) -> Iterator[Tuple[date, str]]:
+    """(day, file path) of archived files, oldest first, within [start, end]."""
+    base = os.path.join(root or ARCHIVE_DIR, kind)
+    if not os.path.isdir(base):
+        return
+    for folder in sorted(os.listdir(base)):
+        if not folder.startswith("day="):
+            continue
+        day = date.fromisoformat(folder[4:])
+        if (start and day < start) or (end and day > end):
+            continue
+        for name in sorted(os.listdir(os.path.join(base, folder))):
+            if name.endswith(".parquet"):
+                yield day, os.path.join(base, folder, name)
+
+
+def scan(kind: str = "articles", start: Optional[date] = None, end: Optional[date] = None,
+         columns: Optional[List[str]] = None, root: Optional[str] = None):
+    """Archived rows as one pyarrow Table (files are memory-mapped)."""
+    if not available():
+        raise RuntimeError("reading the archive needs pyarrow")
+    tables = [pq.read_table(path, columns=columns, memory_map=True)
+              for _, path in partitions(kind, start, end, root)]
+    if not tables:
+        schema = _schemas()[kind]
+        return schema.empty_table().select(columns) if columns else schema.empty_table()
+    return pa.concat_tables(tables)
+
+
+def daily_site_scores(start: Optional[date] = None, end: Optional[date] = None,
+                      root: Optional[str] = None) -> Dict[Tuple[date, str], dict]:
+    """{(day, site): {"articles", "analysed", "<score>_avg"...}} from the archive,
+    grouped and averaged by pyarrow.compute (scores that are null are skipped)."""
+    columns = ["site", "analyzed_at", *[f"{n}_score" for n in SCORES]]
+    tables = []
+    for day, path in partitions("articles", start, end, root):
+        table = pq.read_table(path, memory_map=True, columns=columns)
+        tables.append(table.append_column(
+            "day", pa.repeat(pa.scalar(day, pa.date32()), table.num_rows)))
+    if not tables:
+        return {}
+    grouped = pa.concat_tables(tables).group_by(["day", "site"]).aggregate([
+        ("site", "count", pc.CountOptions(mode="all")),
+        ("analyzed_at", "count"),                       # non-null only
+        *[(f"{n}_score", "mean") for n in SCORES],
+    ]).sort_by([("day", "ascending"), ("site", "ascending")])
+    result = {}
+    for row in grouped.to_pylist():
+        result[(row["day"], row["site"])] = {
+            "articles": row["site_count"], "analysed": row["analyzed_at_count"],
+            **{f"{n}_avg": row[f"{n}_score_mean"] for n in SCORES},
+        }
+    return result
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Inspect the Parquet archive.")
+    p.add_argument("--root", default=ARCHIVE_DIR, help="archive directory (ARCHIVE_DIR)")
+    p.add_argument("--list", action="store_true", help="partitions and row counts")
+    p.add_argument("--trends", action="store_true", help="articles and mean scores per day/site")
+    p.add_argument("--since", type=date.fromisoformat)
+    p.add_argument("--until", type=date.fromisoformat)
+    args = p.parse_args()
+    if not args.root:
+        raise SystemExit("Set ARCHIVE_DIR or pass --root")
+    if not available():
+        raise SystemExit("pyarrow is not installed")
+
+    if args.trends:
+        for (day, site), s in daily_site_scores(args.since, args.until, args.root).items():
+            avg = "  ".join(f"{n[:3]} {s[f'{n}_avg']:5.1f}" if s[f"{n}_avg"] is not None
+                            else f"{n[:3]}     –" for n in SCORES)
+            print(f"{day}  {site:<12} {s['articles']:>5} articles {s['analysed']:>5} analysed  {avg}")
+        return 0
+
+    for kind in KINDS:
+        days = defaultdict(int)
+        for day, path in partitions(kind, args.since, args.until, args.root):
+            days[day] += pq.ParquetFile(path).metadata.num_rows
+        print(f"{kind}: {sum(days.values())} rows in {len(days)} day partitions")
+        for day, n in sorted(days.items()):
+            print(f"  {day}  {n}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
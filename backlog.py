@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Analysis backlog: stored articles without an analysis, split between any
+number of workers (`fetch_news.py --analyse`, `python backlog.py`, threads
+of either) so no article is paid for twice.
+
+A worker claims articles by writing its id and a lease expiry onto them:
+
+  • PostgreSQL → SELECT … FOR UPDATE SKIP LOCKED, then UPDATE the rows it
+                 locked; concurrent claimers skip each other's rows
+  • SQLite     → one UPDATE … WHERE id IN (claimable subquery); SQLite runs
+                 it under the database write lock, so it is atomic
+
+/api/analyse jobs (jobs.py) take the same lease on their article with
+claim_article(), so a job and a backlog worker never pay for it twice.
+
+An article is claimable while it has no analysis and no live lease; the
+highest `priority` (scheduler.py) is claimed first.  The
+lease (ANALYSIS_LEASE_SECONDS) is re-checked and extended just before the
+result is saved; a worker that crashed simply lets it expire and the
+article is claimed again.  When OpenAI gives no analysis (AnalysisFailed)
+nothing is saved and the lease is released; other failures keep their
+lease, which doubles as the retry delay.  A run stops after
+MAX_CONSECUTIVE_FAILURES in a row.
+
+Analysed articles whose title or summary a feed has since edited are
+marked `analysis_stale` by ingest (store.content_hash); `--stale` claims
+those instead, newest first, and re-analyses them.  A result is only saved
+if the content it was made from is still the stored one.
+
+    python backlog.py                       # analyse the whole backlog
+    python backlog.py --threads 4 -n 100    # 4 workers, 100 articles
+    python backlog.py --token-budget 200000
+    python backlog.py --stale               # re-analyse edited articles
+    python backlog.py --status
+"""
+from __future__ import annotations
+import argparse, logging, threading, time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select, update
+
+import scheduler
+from models import Article, Session
+from scheduler import TokenBudget
+from config import ANALYSIS_LEASE_SECONDS, ANALYSIS_TOKEN_BUDGET
+
+log = logging.getLogger("backlog")
+
+MAX_CONSECUTIVE_FAILURES = 3     # OpenAI down or out of quota: stop, don't burn the backlog
+
+
+def claimable(now: datetime):
+    """Un-analysed articles nobody holds a live lease on."""
+    return and_(
+        Article.analyzed_at.is_(None),
+        or_(Article.claim_expires_at.is_(None), Article.claim_expires_at < now),
+    )
+
+
+def stale_claimable(now: datetime):
+    """Articles edited since their analysis that nobody holds a live lease on."""
+    return and_(
+        Article.analysis_stale == True,   # noqa: E712 – matches ix_balanced_news_stale
+        or_(Article.claim_expires_at.is_(None), Article.claim_expires_at < now),
+    )
+
+
+def next_candidates(now: datetime, n: int, site: Optional[str] = None, *, stale: bool = False):
+    """SELECT of the `n` claimable article ids with the highest priority
+    (`stale`: the newest stale ones)."""
+    if stale:
+        query = select(Article.id).where(stale_claimable(now))
+        order = (Article.fetched_at.desc(),)
+    else:
+        query = select(Article.id).where(claimable(now))
+        order = (Article.priority.desc(), Article.fetched_at.desc())
+    if site:
+        query = query.where(Article.site == site)
+    return query.order_by(*order).limit(n)
+
+
+def claim(sess, worker: str, n: int = 1, *, site: Optional[str] = None, stale: bool = False,
+          lease: int = ANALYSIS_LEASE_SECONDS) -> List[int]:
+    """Lease up to `n` backlog articles (highest priority first) – or with
+    `stale`, articles to re-analyse – to `worker`; returns their ids."""
+    now = datetime.utcnow()
+    expires = now + timedelta(seconds=lease)
+    candidates = next_candidates(now, n, site, stale=stale)
+
+    if sess.get_bind().dialect.name == "postgresql":
+        ids = sess.execute(candidates.with_for_update(skip_locked=True)).scalars().all()
+        if ids:
+            sess.execute(update(Article).where(Article.id.in_(ids))
+                         .values(claim_owner=worker, claim_expires_at=expires))
+        sess.commit()
+        return list(ids)
+
+    # the subquery is evaluated inside the UPDATE, under SQLite's write lock
+    sess.execute(update(Article).where(Article.id.in_(candidates.scalar_subquery()))
+                 .values(claim_owner=worker, claim_expires_at=expires),
+                 execution_options={"synchronize_session": False})
+    sess.commit()
+    return sess.execute(select(Article.id).where(
+        Article.claim_owner == worker, Article.claim_expires_at == expires)).scalars().all()
+
+
+def claim_article(sess, article_id: int, worker: str,
+                  lease: int = ANALYSIS_LEASE_SECONDS) -> bool:
+    """Lease one given article to `worker` whatever its analysis state (web
+    jobs re-analyse on request); False while another worker's lease is live."""
+    now = datetime.utcnow()
+    claimed = sess.execute(
+        update(Article)
+        .where(Article.id == article_id,
+               or_(Article.claim_owner.is_(None), Article.claim_owner == worker,
+                   Article.claim_expires_at < now))
+        .values(claim_owner=worker, claim_expires_at=now + timedelta(seconds=lease)),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+    sess.commit()
+    return bool(claimed)
+
+
+def extend(sess, article_id: int, worker: str, lease: int = ANALYSIS_LEASE_SECONDS, *,
+           content_hash: Optional[str] = None, reanalyse: bool = False) -> bool:
+    """Renew `worker`'s lease; False if it lost the article (expired and
+    re-claimed, analysed meanwhile unless `reanalyse`, or – given
+    `content_hash` – edited)."""
+    query = update(Article).where(Article.id == article_id, Article.claim_owner == worker)
+    if not reanalyse:
+        query = query.where(
+            or_(Article.analyzed_at.is_(None), Article.analysis_stale == True))   # noqa: E712
+    if content_hash is not None:
+        query = query.where(Article.content_hash == content_hash)
+    renewed = sess.execute(
+        query.values(claim_expires_at=datetime.utcnow() + timedelta(seconds=lease)),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+    return bool(renewed)
+
+
+def release(sess, article_id: int, worker: str) -> None:
+    """Give a claimed article back before its lease runs out."""
+    sess.execute(
+        update(Article)
+        .where(Article.id == article_id, Article.claim_owner == worker)
+        .values(claim_owner=None, claim_expires_at=None),
+        execution_options={"synchronize_session": False},
+    )
+    sess.commit()
+
+
+def analyse_claimed(sess, article_id: int, worker: str, *, reanalyse: bool = False,
+                    **analyse_kwargs) -> Optional[int]:
+    """Analyse one article `worker` holds and save it; returns the tokens
+    used, or None if the lease was lost before the result could be saved.
+    Raises AnalysisFailed, with the lease released, when OpenAI fails."""
+    from analysis import AnalysisFailed, analyse_article   # pulls in the OpenAI client
+    from store import content_hash, save_analysis
+
+    article = sess.get(Article, article_id)
+    title, summary = article.title, article.summary
+    fingerprint = article.content_hash or content_hash(title, summary)
+    sess.commit()                           # no transaction open during the call
+    try:
+        analysis = analyse_article({"title": title, "summary": summary}, **analyse_kwargs)
+    except AnalysisFailed:
+        release(sess, article_id, worker)
+        raise
+
+    if not extend(sess, article_id, worker, content_hash=fingerprint, reanalyse=reanalyse):
+        sess.rollback()
+        log.warning("Lost the claim on article %d, or it was edited – analysis discarded",
+                    article_id)
+        return None
+    article = sess.get(Article, article_id)
+    save_analysis(sess, article, analysis)
+    article.claim_owner = article.claim_expires_at = None
+    sess.commit()
+    return analysis.get("tokens", 0)
+
+
+def drain(sess, worker: str, *, limit: Optional[int] = None, site: Optional[str] = None,
+          stale: bool = False, budget: Optional[TokenBudget] = None,
+          **analyse_kwargs) -> Tuple[int, int]:
+    """Claim and analyse backlog articles in priority order (`stale`: re-analyse
+    edited ones), one at a time, until they, `limit` or the token `budget` run
+    out; returns (analysed, tokens)."""
+    analysed = tokens = failures = 0
+    while limit is None or analysed < limit:
+        scheduler.maybe_rescore(sess)
+        if budget is not None and not budget.reserve():
+            log.info("Token budget reached (%d of %d)", budget.spent, budget.limit)
+            break
+        ids = claim(sess, worker, site=site, stale=stale)
+        if not ids:
+            if budget is not None:
+                budget.settle(0)
+            break
+        try:
+            used = analyse_claimed(sess, ids[0], worker, **analyse_kwargs)
+        except Exception as e:
+            sess.rollback()
+            if budget is not None:
+                budget.settle(0)
+            log.error("Analysis of article %d failed (%s)", ids[0], e)
+            failures += 1
+            if failures >= MAX_CONSECUTIVE_FAILURES:
+                log.error("%d failures in a row – giving up for now", failures)
+                break
+            continue
+        failures = 0
+        if budget is not None:
+            budget.settle(used or 0)
+        if used is not None:
+            analysed += 1
+            tokens += used
+    return analysed, tokens
+
+
+def status(sess) -> dict:
+    """Backlog size: unclaimed, leased and expired-lease articles, and
+    analyses gone stale."""
+    now = datetime.utcnow()
+    rows = sess.execute(
+        select(
+            func.count(),
+            func.count(Article.claim_owner).filter(Article.claim_expires_at >= now),
+            func.count(Article.claim_owner).filter(Article.claim_expires_at < now),
+        ).where(Article.analyzed_at.is_(None))
+    ).one()
+    stale = sess.execute(select(func.count()).where(Article.analysis_stale == True)).scalar()  # noqa: E712
+    return {"backlog": rows[0], "leased": rows[1], "expired": rows[2], "stale": stale}
+
+
+# -----------------------------------------------------------------------------
+def main() -> None:
+    from dotenv import load_dotenv
+    from jobs import worker_id
+    from models import init_db
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s  %(levelname)-8s %(message)s",
+                        datefmt="%H:%M:%S")
+    p = argparse.ArgumentParser(description="Analyse stored articles that have no analysis yet.")
+    p.add_argument("-n", "--limit", type=int, help="articles per worker thread (default: all)")
+    p.add_argument("--site", help="only this outlet")
+    p.add_argument("--threads", type=int, default=1, help="worker threads in this process")
+    p.add_argument("--token-budget", type=int, default=ANALYSIS_TOKEN_BUDGET,
+                   help=f"stop before spending more tokens, all threads together "
+                        f"(default: {ANALYSIS_TOKEN_BUDGET or 'no limit'})")
+    p.add_argument("--stale", action="store_true",
+                   help="re-analyse articles edited since their analysis instead")
+    p.add_argument("--status", action="store_true", help="show the backlog and exit")
+    args = p.parse_args()
+
+    init_db()
+    if args.status:
+        sess = Session()
+        try:
+            print(status(sess))
+        finally:
+            sess.close()
+        return
+
+    sess = Session()
+    try:
+        budget = TokenBudget(args.token_budget, scheduler.expected_tokens(sess))
+    finally:
+        sess.close()
+    totals = []
+
+    def work():
+        sess = Session()
+        try:
+            totals.append(drain(sess, worker_id(), limit=args.limit, site=args.site,
+                                stale=args.stale, budget=budget))
+        finally:
+            sess.close()
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=work, name=f"backlog-{i}") for i in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    log.info("Analysed %d articles (%d tokens) in %.1f s with %d worker(s)",
+             sum(a for a, _ in totals), sum(t for _, t in totals),
+             time.monotonic() - started, args.threads)
+
+
+if __name__ == "__main__":
+    main()
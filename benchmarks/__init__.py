@@ -0,0 +1 @@
+"""Micro-benchmarks for the hot paths (see benchmarks/run.py)."""
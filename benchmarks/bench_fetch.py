@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Fetch-side benchmarks: feed parsing per outlet (recorded fixtures, no
+network), truncate_words, classify_content and bulk ingest into a fresh
+database (DATABASE_URL, set by run.py).
+
+`fetch.soup[site, …]` isolates the tree building behind parse_html: the
+whole page with html.parser (how pages were parsed before adapters.py)
+against the outlet's adapter – adapters.PARSER restricted to its
+SoupStrainer.
+"""
+from __future__ import annotations
+import itertools
+
+from bs4 import BeautifulSoup
+
+from benchmarks.fixtures import load, WORDS
+from benchmarks.harness import emit, measure, once
+from sources import SITES
+
+
+def main() -> None:
+    import adapters
+    from analysis import classify_content
+    from fetch_news import ingest_news, parse_html, parse_rss, truncate_words
+    from migrate import upgrade
+    from models import Session
+
+    results = {}
+    parsed = {}
+    for site in SITES:
+        rss, page = load(site)
+        results[f"fetch.parse_rss[{site}]"] = measure(lambda: parse_rss(rss, 10, 70))
+        results[f"fetch.parse_html[{site}]"] = measure(lambda: parse_html(site, page, 10, 70))
+        strainer = adapters.get(site).parse_only
+        results[f"fetch.soup[{site}, html.parser]"] = measure(
+            lambda: BeautifulSoup(page, "html.parser"))
+        results[f"fetch.soup[{site}, {adapters.PARSER}+strainer]"] = measure(
+            lambda: BeautifulSoup(page, adapters.PARSER, parse_only=strainer))
+        parsed[site] = parse_rss(rss, 60, 70)
+
+    long_text = " ".join(itertools.islice(itertools.cycle(WORDS), 400))
+    results["fetch.truncate_words[400→70]"] = measure(lambda: truncate_words(long_text, 70))
+
+    items = [a for site_items in parsed.values() for a in site_items]
+    results["classify.classify_content"] = measure(
+        lambda: [classify_content(a["title"], a["summary"]) for a in items[:50]])
+    results["classify.classify_content"]["note"] = "50 headlines per call"
+
+    upgrade()
+    batch = itertools.count()
+
+    def ingest():
+        n = next(batch)
+        news = {site: [{**a, "url": f"{a['url']}?b={n}"} for a in site_items]
+                for site, site_items in parsed.items()}
+        sess = Session()
+        try:
+            ingest_news(sess, news)
+        finally:
+            sess.close()
+
+    results["fetch.ingest_news[300 new]"] = once(ingest, repeat=5)
+    emit(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Web-side benchmarks against a synthetic database (DATABASE_URL, filled by
+benchmarks.synth): the front page render with analysed articles and the
+/analytics aggregations.  `--rows` only labels the results.
+"""
+from __future__ import annotations
+import argparse
+
+from benchmarks.harness import emit, measure, once
+
+
+def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("--rows", type=int, required=True)
+    args = p.parse_args()
+    n = args.rows
+
+    import aggregates
+    from app import create_app
+    from models import Session
+    from score_store import ScoreStore, load
+
+    app = create_app()
+    client = app.test_client()
+
+    def get(url):
+        def call():
+            r = client.get(url)
+            assert r.status_code == 200, (url, r.status_code)
+        return call
+
+    results = {
+        f"render.index[{n}]": measure(get("/")),
+        f"analytics.route[{n}]": measure(get("/analytics")),
+        f"analytics.route_filtered[{n}]": measure(get("/analytics?q=regeringen")),
+    }
+
+    sess = Session()
+    try:
+        results[f"analytics.site_metrics[{n}]"] = measure(lambda: aggregates.site_metrics(sess))
+        results[f"analytics.totals_by_site_sql[{n}]"] = measure(
+            lambda: aggregates.totals_by_site(sess))
+        results[f"analytics.score_store_load[{n}]"] = once(
+            lambda: load(sess, 0), repeat=5)
+        snap = ScoreStore().snapshot(sess)
+        results[f"analytics.snapshot_site_metrics[{n}]"] = measure(lambda: snap.site_metrics())
+        results[f"analytics.snapshot_percentiles[{n}]"] = measure(lambda: snap.percentiles())
+        results[f"analytics.snapshot_histograms[{n}]"] = measure(lambda: snap.histograms())
+        hits = snap.mask(ids=snap.ids[::7].tolist())
+        results[f"analytics.snapshot_filtered[{n}]"] = measure(
+            lambda: (snap.site_metrics(hits), snap.compare(hits)))
+    finally:
+        sess.close()
+    emit(results)
+
+
+if __name__ == "__main__":
+    main()
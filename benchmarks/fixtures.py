@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Feed fixtures for the parsing benchmarks: one RSS feed and one front page
+per outlet in sources.py, stored in benchmarks/fixtures/.
+
+The committed files are synthetic but shaped like the real feeds – HTML in
+summaries, named entities, naked ampersands and stray control bytes – and
+generated deterministically, so timings stay comparable across commits.
+`--record` replaces them with live captures instead.
+
+    python -m benchmarks.fixtures             # regenerate synthetic fixtures
+    python -m benchmarks.fixtures --record    # download the real feeds
+"""
+from __future__ import annotations
+import argparse, os, random
+from datetime import datetime, timedelta
+from email.utils import format_datetime
+
+from sources import SITES
+
+DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+ITEMS = 60
+
+WORDS = (
+    "regeringen riksdagen kommunen polisen ekonomi inflation räntan kronan "
+    "kriget Ukraina Nato vården skolan klimatet elpriset bostäder valet partiet "
+    "ministern utredningen åklagaren domstolen matchen laget tränaren festivalen "
+    "konserten premiären uppgifter enligt kritik förslag beslut miljarder "
+    "höjer sänker varnar kräver stoppar öppnar säger visar"
+).split()
+
+
+def rss_path(site: str) -> str:
+    return os.path.join(DIR, f"{site}.rss.xml")
+
+
+def html_path(site: str) -> str:
+    return os.path.join(DIR, f"{site}.html")
+
+
+def _sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize()
+
+
+def synthetic_rss(site: str, items: int = ITEMS) -> bytes:
+    rng = random.Random(f"rss-{site}")
+    start = datetime(2024, 5, 1, 12, 0)
+    out = ['<?xml version="1.0" encoding="UTF-8"?>',
+           '<rss version="2.0"><channel>',
+           f"<title>{SITES[site]['name']} &aring;terblick</title>",
+           f"<link>{SITES[site]['html']}</link>"]
+    for i in range(items):
+        title = _sentence(rng, rng.randint(5, 12))
+        if i % 7 == 0:
+            title += " & mer"                       # naked ampersand
+        summary = "".join(f"<p>{_sentence(rng, rng.randint(12, 30))}.</p>"
+                          for _ in range(rng.randint(1, 3)))
+        if i % 5 == 0:
+            summary += "<p>L&auml;s mer&nbsp;h&auml;r</p>"  # HTML entities
+        out.append(
+            "<item>"
+            f"<title>{title}</title>"
+            f"<link>{SITES[site]['html']}artikel-{i}</link>"
+            f"<guid>{site}-{i}</guid>"
+            f"<pubDate>{format_datetime(start - timedelta(minutes=7 * i))}</pubDate>"
+            f"<description><![CDATA[{summary}]]></description>"
+            "</item>"
+        )
+    out.append("</channel></rss>")
+    raw = "\n".join(out).encode("utf-8")
+    return raw.replace(b"<channel>", b"<channel>\x0b", 1)   # stray control byte
+
+
+def synthetic_html(site: str, items: int = ITEMS) -> str:
+    rng = random.Random(f"html-{site}")
+    body = []
+    for i in range(items):
+        title = _sentence(rng, rng.randint(5, 12))
+        if site == "dagens":
+            body.append(f'<div class="front__item"><a class="front__article-link" '
+                        f'href="/nyheter/artikel-{i}/">{title}</a></div>')
+        else:
+            body.append(f'<article class="teaser"><div class="media"><img src="/i/{i}.jpg"></div>'
+                        f'<h2><a href="{SITES[site]["html"]}artikel-{i}">{title}</a></h2>'
+                        f'<p>{_sentence(rng, 20)}</p></article>')
+        if i % 4 == 0:
+            body.append(f'<aside><h3>Annons</h3><p>{_sentence(rng, 8)}</p></aside>')
+    return ("<!doctype html><html><head><meta charset='utf-8'><title>"
+            f"{SITES[site]['name']}</title></head><body><main>"
+            + "\n".join(body) + "</main></body></html>")
+
+
+def load(site: str):
+    """(rss bytes, html text) for `site`."""
+    with open(rss_path(site), "rb") as fh:
+        rss = fh.read()
+    with open(html_path(site), encoding="utf-8") as fh:
+        page = fh.read()
+    return rss, page
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Write feed fixtures for the benchmarks.")
+    p.add_argument("--record", action="store_true", help="download the live feeds instead")
+    args = p.parse_args()
+    os.makedirs(DIR, exist_ok=True)
+    for site, meta in SITES.items():
+        if args.record:
+            import requests
+            headers = {"User-Agent": "Mozilla/5.0 (benchmark fixture recorder)"}
+            rss = requests.get(meta["rss"], headers=headers, timeout=20).content
+            page = requests.get(meta["html"], headers=headers, timeout=20).text
+        else:
+            rss, page = synthetic_rss(site), synthetic_html(site)
+        with open(rss_path(site), "wb") as fh:
+            fh.write(rss)
+        with open(html_path(site), "w", encoding="utf-8") as fh:
+            fh.write(page)
+        print(f"{site}: {len(rss):,} bytes RSS, {len(page):,} chars HTML")
+
+
+if __name__ == "__main__":
+    main()
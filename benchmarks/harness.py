@@ -0,0 +1,108 @@
+"""
+Timing and result bookkeeping shared by the benchmark modules.
+
+Each benchmark is timed as `repeat` rounds of `number` calls, `number`
+calibrated so a round takes about ROUND_SECONDS; the reported figure is the
+median per-call time across rounds (min and max are kept for context).
+"""
+from __future__ import annotations
+import json, os, platform, statistics, subprocess, sys, time
+from typing import Callable, Dict, List, Optional
+
+ROUND_SECONDS = 0.1
+REPEAT = 7
+
+
+def measure(fn: Callable[[], object], *, repeat: int = REPEAT,
+            round_seconds: float = ROUND_SECONDS, setup: Optional[Callable] = None) -> dict:
+    """Per-call timings of `fn` in microseconds: {"median_us", "min_us", "max_us", "calls"}."""
+    if setup:
+        setup()
+    fn()                                             # warm caches / imports
+    number, elapsed = 1, 0.0
+    while True:                                      # calibrate
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= round_seconds / 4 or number >= 1 << 20:
+            break
+        number *= 4
+    number = max(1, int(number * round_seconds / max(elapsed, 1e-9)))
+
+    per_call = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_call.append((time.perf_counter() - started) / number * 1e6)
+    return {"median_us": round(statistics.median(per_call), 3),
+            "min_us": round(min(per_call), 3), "max_us": round(max(per_call), 3),
+            "calls": number * repeat}
+
+
+def once(fn: Callable[[], object], *, repeat: int = 3) -> dict:
+    """For slow operations (seconds): `repeat` single calls, no calibration."""
+    per_call = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        per_call.append((time.perf_counter() - started) * 1e6)
+    return {"median_us": round(statistics.median(per_call), 3),
+            "min_us": round(min(per_call), 3), "max_us": round(max(per_call), 3),
+            "calls": repeat}
+
+
+def emit(results: Dict[str, dict]) -> None:
+    """Child processes print their results as one JSON line on stdout."""
+    print("BENCH-RESULTS " + json.dumps(results), flush=True)
+
+
+def collect(cmd: List[str], env: dict, *, results: bool = True) -> Dict[str, dict]:
+    """Run a benchmark child process and parse its results line."""
+    proc = subprocess.run(cmd, env={**os.environ, **env}, capture_output=True, text=True)
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stdout + proc.stderr)
+        raise SystemExit(f"{' '.join(cmd)} failed")
+    if not results:
+        return {}
+    for line in proc.stdout.splitlines():
+        if line.startswith("BENCH-RESULTS "):
+            return json.loads(line[len("BENCH-RESULTS "):])
+    raise SystemExit(f"{' '.join(cmd)} printed no results")
+
+
+def metadata() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {
+        "commit": git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} ({os.cpu_count()} CPUs)",
+    }
+
+
+def compare(current: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[tuple]:
+    """(name, baseline µs, current µs, ratio) for every shared benchmark, slowest first."""
+    rows = []
+    for name, stats in current.items():
+        if name in baseline:
+            before, now = baseline[name]["median_us"], stats["median_us"]
+            rows.append((name, before, now, now / before if before else float("inf")))
+    return sorted(rows, key=lambda r: -r[3])
+
+
+def fmt_us(us: float) -> str:
+    if us >= 1e6:
+        return f"{us / 1e6:8.2f} s "
+    if us >= 1e3:
+        return f"{us / 1e3:8.2f} ms"
+    return f"{us:8.2f} µs"
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Query-budget check: request every read route of app.py against a synthetic
+database with QUERY_BUDGET_STRICT=1 and compare its SQL statement count with
+the route's @query_budget.  Exits 1 when a route is over budget or declares
+none, so an N+1 (a lazy load in a template, a query per item in a view)
+fails the run instead of showing up in production latency.
+
+    python -m benchmarks.query_budgets                # 1k and 10k rows
+    python -m benchmarks.query_budgets --sizes 1000
+
+Counts must not grow with the row count; checking two sizes catches loops
+over articles that a small database hides.  tests/test_query_budgets.py
+runs the same REQUESTS, plus the write routes, under pytest.
+"""
+from __future__ import annotations
+import argparse, os, sys
+
+from benchmarks.harness import collect, emit
+from benchmarks.run import ROOT, _env, synthetic_db
+
+# (method, url, json body); ids resolve against the synthetic data
+REQUESTS = [
+    ("GET", "/", None),
+    ("GET", "/?q=regeringen", None),
+    ("GET", "/site/svt", None),
+    ("GET", "/api/articles", None),
+    ("GET", "/api/articles?site=dn&q=regeringen", None),
+    ("GET", "/api/articles/{analysed}/analyses", None),
+    ("POST", "/api/analyse", {"article_id": "{analysed}"}),
+    ("GET", "/api/jobs/1", None),
+    ("GET", "/api/fetch-runs", None),
+    ("GET", "/api/fetch-runs/1", None),
+    ("GET", "/analytics", None),
+    ("GET", "/analytics?q=regeringen&days=90", None),
+    ("GET", "/about", None),
+    ("GET", "/metrics", None),
+    ("GET", "/no-such-page", None),
+]
+
+
+def child() -> None:
+    from werkzeug.exceptions import HTTPException
+    from app import create_app
+    from metrics import QueryBudgetExceeded
+    from models import Article, Session
+
+    sess = Session()
+    try:
+        analysed = sess.query(Article.id).filter(Article.analysis_id.isnot(None)) \
+            .order_by(Article.id.desc()).limit(1).scalar()
+    finally:
+        sess.close()
+
+    app = create_app()
+    app.testing = True
+    client = app.test_client()
+    results = {}
+    for method, url, body in REQUESTS:
+        url = url.format(analysed=analysed)
+        if body:
+            body = {k: int(v.format(analysed=analysed)) if isinstance(v, str) else v
+                    for k, v in body.items()}
+        try:
+            endpoint, _ = app.url_map.bind("localhost").match(url.split("?")[0], method=method)
+            budget = getattr(app.view_functions[endpoint], "query_budget", None)
+        except HTTPException:
+            endpoint, budget = None, None
+        try:
+            r = client.open(url, method=method, json=body)
+            queries, error = int(r.headers.get("X-DB-Queries", -1)), None
+        except QueryBudgetExceeded as e:
+            queries, error = None, str(e)
+        results[f"{method} {url}"] = {"endpoint": endpoint, "budget": budget,
+                                      "queries": queries, "error": error}
+    for rule in app.url_map.iter_rules():
+        view = app.view_functions[rule.endpoint]
+        if rule.endpoint != "static" and getattr(view, "query_budget", None) is None:
+            results[f"route {rule.rule}"] = {"endpoint": rule.endpoint, "budget": None,
+                                            "queries": None, "error": None}
+    emit(results)
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Check per-route SQL query budgets.")
+    p.add_argument("--sizes", default="1000,10000")
+    p.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = p.parse_args()
+    if args.child:
+        child()
+        return 0
+
+    os.chdir(ROOT)
+    failed = 0
+    for rows in (int(s) for s in args.sizes.split(",") if s):
+        env = {**_env(synthetic_db(rows)), "QUERY_BUDGET_STRICT": "1", "QUERY_DEBUG_HEADERS": "1",
+               "ANALYSIS_MAX_AGE_HOURS": "1000000"}   # /api/analyse serves the stored one
+        results = collect([sys.executable, "-m", "benchmarks.query_budgets", "--child"], env)
+        print(f"\n{rows} rows:")
+        for name, r in results.items():
+            if r["error"]:
+                status = "OVER BUDGET"
+            elif r["endpoint"] and r["budget"] is None:
+                status = "NO BUDGET"
+            else:
+                status = ""
+            failed += bool(status)
+            queries = "-" if r["queries"] is None else r["queries"]
+            print(f"  {name:<48} {queries:>3} / {r['budget'] if r['budget'] is not None else '-':<3} {status}")
+    print("\nAll routes within budget" if not failed else f"\n{failed} failure(s)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Run the micro-benchmarks and compare them with a baseline.
+
+    python -m benchmarks.run                                  # all, 1k/10k/100k rows
+    python -m benchmarks.run --sizes 1000 --out before.json   # quicker
+    python -m benchmarks.run --baseline before.json           # exit 1 on regression
+
+Every suite runs in its own process against its own SQLite database, so a
+run does not depend on (or touch) DATABASE_URL.  Synthetic databases are
+cached in benchmarks/.cache per row count and schema version.  Results are
+written as JSON with the commit they were measured on; `--baseline` fails
+when a benchmark's median is more than `--threshold` times its baseline.
+Compare runs made on the same machine.
+"""
+from __future__ import annotations
+import argparse, json, os, sys
+
+from benchmarks.harness import collect, compare, fmt_us, metadata
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+CACHE = os.path.join(HERE, ".cache")
+
+
+def _env(db_path: str) -> dict:
+    return {"DATABASE_URL": f"sqlite:///{db_path}", "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "benchmark"),
+            "JOB_BACKEND": "inline", "LOG_SAMPLE_RATE": "0", "PYTHONPATH": ROOT,
+            "ANALYSIS_COMPRESSION": "", "ARCHIVE_DIR": ""}
+
+
+def synthetic_db(rows: int) -> str:
+    from migrate import MIGRATIONS
+    path = os.path.join(CACHE, f"synth-{rows}-v{len(MIGRATIONS)}.db")
+    if not os.path.exists(path):
+        os.makedirs(CACHE, exist_ok=True)
+        tmp = path + ".tmp"
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(tmp + suffix):
+                os.remove(tmp + suffix)
+        collect([sys.executable, "-m", "benchmarks.synth", "--rows", str(rows)], _env(tmp),
+                results=False)
+        os.replace(tmp, path)
+    return path
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Run the benchmark suite.")
+    p.add_argument("--sizes", default="1000,10000,100000",
+                   help="synthetic database sizes for the web suite")
+    p.add_argument("--only", choices=["fetch", "web"])
+    p.add_argument("--out", default=os.path.join(HERE, "results", "latest.json"))
+    p.add_argument("--baseline", help="results JSON to compare against")
+    p.add_argument("--threshold", type=float, default=1.25,
+                   help="fail when median > threshold × baseline (default 1.25)")
+    args = p.parse_args()
+    os.chdir(ROOT)
+
+    results = {}
+    if args.only in (None, "fetch"):
+        db = os.path.join(CACHE, "ingest.db")
+        os.makedirs(CACHE, exist_ok=True)
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db + suffix):
+                os.remove(db + suffix)
+        print("fetch suite …", flush=True)
+        results.update(collect([sys.executable, "-m", "benchmarks.bench_fetch"], _env(db)))
+    if args.only in (None, "web"):
+        for rows in (int(s) for s in args.sizes.split(",") if s):
+            print(f"web suite, {rows} rows …", flush=True)
+            results.update(collect([sys.executable, "-m", "benchmarks.bench_web", "--rows", str(rows)],
+                                   _env(synthetic_db(rows))))
+
+    print()
+    for name, stats in results.items():
+        print(f"{name:<48} {fmt_us(stats['median_us'])}  "
+              f"(min {fmt_us(stats['min_us']).strip()}, {stats['calls']} calls)")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as fh:
+        json.dump({"meta": metadata(), "results": results}, fh, indent=1, sort_keys=True)
+    print(f"\nWrote {args.out}")
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as fh:
+        base = json.load(fh)
+    rows = compare(results, base["results"], args.threshold)
+    print(f"\nAgainst {args.baseline} ({base['meta'].get('commit')}), threshold {args.threshold}×:")
+    failed = [r for r in rows if r[3] > args.threshold]
+    for name, before, now, ratio in rows:
+        flag = "REGRESSION" if ratio > args.threshold else ""
+        print(f"{name:<48} {fmt_us(before)} → {fmt_us(now)}  {ratio:5.2f}×  {flag}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Synthetic database generator for the benchmarks.
+
+Creates `rows` articles spread over the outlets in sources.py and the last
+year, about 80 % of them analysed with scores and claim counts, then builds
+the aggregates.  The newest FULL_PAYLOADS analyses carry a full-size payload
+(what the front page renders); older ones a small one, to keep large
+databases small.  Deterministic for a given row count.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.synth --rows 10000
+"""
+from __future__ import annotations
+import argparse, random, time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+import aggregates
+from migrate import upgrade
+from models import Article, ArticleAnalysis, Session, engine
+from sources import SITES
+from store import content_hash
+from benchmarks.fixtures import WORDS
+
+FULL_PAYLOADS = 60
+CHUNK = 5000
+NOW = datetime(2024, 6, 1, 12, 0)
+
+
+def _text(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def full_payload(rng: random.Random, scores: dict) -> dict:
+    """Shaped like analyse_article() output."""
+    claims = "\n".join(
+        f"PÅSTÅENDE: {_text(rng, 8)} | VERIFIERING: {_text(rng, 10)} | "
+        f"KONFIDENS: {rng.choice(['HÖG', 'MEDEL', 'LÅG'])} | KORRIGERING: "
+        + (_text(rng, 6) if rng.random() < 0.3 else "")
+        for _ in range(rng.randint(2, 5))
+    )
+    return {
+        "content_type": rng.choice(["geopolitics", "economics", "policy", "default"]),
+        "model_used": "gpt-4.1-mini", "prompt_version": "synthetic", "tokens": rng.randint(800, 3000),
+        "nuanced_perspective": {
+            "balanced_summary": _text(rng, 90),
+            "perspectives": [{"actor": _text(rng, 2), "view": _text(rng, 40)} for _ in range(3)],
+            "context": _text(rng, 60),
+        },
+        "factual_accuracy": {"claim_verification": claims,
+                             "unsupported_assertions": _text(rng, 30)},
+        "source_credibility": {"assessment": _text(rng, 50)},
+        "reporting_quality": {**{f"{k}_score": v for k, v in scores.items()},
+                              "comments": _text(rng, 40)},
+    }
+
+
+def generate(rows: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    upgrade()
+    sites = list(SITES)
+    started = time.perf_counter()
+    articles, analyses = [], []
+    for i in range(1, rows + 1):
+        fetched = NOW - timedelta(minutes=int((rows - i) * 525600 / rows))
+        title, summary = _text(rng, rng.randint(5, 12)).capitalize(), _text(rng, rng.randint(20, 60))
+        art = {"id": i, "site": rng.choice(sites), "title": title, "summary": summary,
+               "url": f"https://example.se/a/{i}", "content_hash": content_hash(title, summary),
+               "fetched_at": fetched, "analysis_id": None, "analyzed_at": None,
+               "last_updated_at": None, "verified_claims": 0, "corrected_claims": 0,
+               **{f"{n}_score": None for n in aggregates.SCORES}}
+        if rng.random() < 0.8:
+            scores = {n: round(rng.gauss(65, 15), 1) for n in aggregates.SCORES}
+            scores = {n: min(100.0, max(0.0, v)) for n, v in scores.items()}
+            payload = (full_payload(rng, scores) if i > rows - FULL_PAYLOADS
+                       else {"reporting_quality": {f"{k}_score": v for k, v in scores.items()}})
+            analysed_at = fetched + timedelta(minutes=rng.randint(1, 120))
+            verified, corrected = rng.randint(0, 6), rng.randint(0, 3)
+            art.update(analysis_id=i, analyzed_at=analysed_at, last_updated_at=analysed_at,
+                       verified_claims=verified, corrected_claims=corrected,
+                       **{f"{n}_score": v for n, v in scores.items()})
+            analyses.append({"id": i, "article_id": i, "created_at": analysed_at,
+                             "model": "gpt-4.1-mini", "prompt_version": "synthetic",
+                             "content_type": "default", "tokens": rng.randint(800, 3000),
+                             "payload": payload, "verified_claims": verified,
+                             "corrected_claims": corrected,
+                             **{f"{n}_score": v for n, v in scores.items()}})
+        articles.append(art)
+
+    with engine.begin() as conn:
+        for start in range(0, len(articles), CHUNK):
+            conn.execute(insert(Article), articles[start:start + CHUNK])
+        for start in range(0, len(analyses), CHUNK):
+            conn.execute(insert(ArticleAnalysis), analyses[start:start + CHUNK])
+    sess = Session()
+    try:
+        aggregates.rebuild(sess)
+        aggregates.rebuild_daily(sess)
+        sess.commit()
+    finally:
+        sess.close()
+    print(f"Generated {rows} articles ({len(analyses)} analysed) "
+          f"in {time.perf_counter() - started:.1f} s")
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Fill DATABASE_URL with synthetic articles.")
+    p.add_argument("--rows", type=int, default=10000)
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args()
+    generate(args.rows, args.seed)
+
+
+if __name__ == "__main__":
+    main()
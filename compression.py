@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Compressed JSON for analysis payloads.
+
+`CompressedJSON` is a column type that stores a JSON document as
+
+    codec (1 byte) | dictionary id (4 bytes, 0 = none) | compressed JSON
+
+with zlib (stdlib) or zstd (the optional zstandard package).  Analyses share
+most of their keys and boilerplate, so both codecs use a shared dictionary
+trained on stored payloads; dictionaries live in `compression_dicts` and are
+loaded once per process.  Writing compressed rows is opt-in
+(ANALYSIS_COMPRESSION); reading works whatever the setting.
+
+    python compression.py --train            # dictionary from recent analyses
+    python compression.py --backfill         # rewrite rows to the current setting
+    python compression.py --report           # bytes saved, decode cost per row
+"""
+from __future__ import annotations
+import argparse, json, logging, struct, sys, threading, time, zlib
+from typing import Optional, Tuple
+
+from sqlalchemy import LargeBinary, select
+from sqlalchemy.types import TypeDecorator
+
+from config import ANALYSIS_COMPRESSION
+
+try:
+    import zstandard
+except ImportError:          # optional: zlib still works
+    zstandard = None
+
+log = logging.getLogger("compression")
+
+CODECS = {"zlib": 1, "zstd": 2}
+CODEC_NAMES = {v: k for k, v in CODECS.items()}
+HEADER = struct.Struct(">BI")
+ZLIB_LEVEL = 9
+ZSTD_LEVEL = 10
+ZLIB_DICT_SIZE = 32 * 1024     # zlib only looks back 32 KiB
+ZSTD_DICT_SIZE = 64 * 1024
+
+_dicts: dict = {}              # id -> (codec, bytes)
+_active: dict = {}             # codec -> dictionary id used for writing
+_guard = threading.Lock()
+_zstd_warned = False           # write_codec() runs per row written; say it once
+
+
+def write_codec() -> Optional[str]:
+    """Codec for new payloads, or None to store plain JSON."""
+    global _zstd_warned
+    if not ANALYSIS_COMPRESSION:
+        return None
+    if ANALYSIS_COMPRESSION not in CODECS:
+        raise RuntimeError(f"ANALYSIS_COMPRESSION must be zlib or zstd, not {ANALYSIS_COMPRESSION!r}")
+    if ANALYSIS_COMPRESSION == "zstd" and zstandard is None:
+        if not _zstd_warned:
+            _zstd_warned = True
+            log.warning("zstandard not installed – compressing analyses with zlib")
+        return "zlib"
+    return ANALYSIS_COMPRESSION
+
+
+# ---------- dictionaries -----------------------------------------------
+def _load(dict_id: int) -> Tuple[str, bytes]:
+    from models import CompressionDict, engine
+    with _guard:
+        if dict_id not in _dicts:
+            with engine.connect() as conn:
+                row = conn.execute(
+                    select(CompressionDict.codec, CompressionDict.data)
+                    .where(CompressionDict.id == dict_id)
+                ).first()
+            if row is None:
+                raise LookupError(f"compression dictionary {dict_id} not found")
+            _dicts[dict_id] = (row.codec, row.data)
+    return _dicts[dict_id]
+
+
+def active_dict(codec: str) -> int:
+    """Id of the newest dictionary for `codec` (0 if none); read once per process."""
+    from models import CompressionDict, engine
+    if codec not in _active:
+        with engine.connect() as conn:
+            row = conn.execute(
+                select(CompressionDict.id, CompressionDict.data)
+                .where(CompressionDict.codec == codec)
+                .order_by(CompressionDict.id.desc()).limit(1)
+            ).first()
+        with _guard:
+            if row is not None:
+                _dicts[row.id] = (codec, row.data)
+            _active[codec] = row.id if row is not None else 0
+    return _active[codec]
+
+
+def train(sess, codec: str, samples: int = 2000) -> int:
+    """Build a dictionary from the newest `samples` payloads; returns its id."""
+    from models import ArticleAnalysis, CompressionDict
+    docs = [
+        encode_json(a.payload)
+        for a in sess.query(ArticleAnalysis)
+        .order_by(ArticleAnalysis.id.desc()).limit(samples)
+        if a.payload is not None
+    ]
+    if not docs:
+        raise ValueError("no analyses to train on")
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd dictionaries need the zstandard package")
+        data = zstandard.train_dictionary(ZSTD_DICT_SIZE, docs).as_bytes()
+    else:
+        # zlib has no trainer: the tail of the concatenated samples (zlib
+        # prefers matches near the end of the dictionary) is a fair stand-in
+        data = b"".join(reversed(docs))[-ZLIB_DICT_SIZE:]
+    row = CompressionDict(codec=codec, samples=len(docs), data=data)
+    sess.add(row)
+    sess.flush()
+    with _guard:
+        _dicts[row.id] = (codec, data)
+        _active[codec] = row.id
+    return row.id
+
+
+# ---------- codec --------------------------------------------------------
+def encode_json(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def compress(value, codec: Optional[str] = None) -> bytes:
+    codec = codec or write_codec() or "zlib"
+    dict_id = active_dict(codec)
+    zdict = _dicts[dict_id][1] if dict_id else None
+    raw = encode_json(value)
+    if codec == "zstd":
+        cdict = zstandard.ZstdCompressionDict(zdict) if zdict else None
+        body = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=cdict).compress(raw)
+    else:
+        c = zlib.compressobj(ZLIB_LEVEL, zdict=zdict) if zdict else zlib.compressobj(ZLIB_LEVEL)
+        body = c.compress(raw) + c.flush()
+    return HEADER.pack(CODECS[codec], dict_id) + body
+
+
+def header(blob: bytes) -> Tuple[str, int]:
+    """(codec, dictionary id) of a compressed payload."""
+    codec_id, dict_id = HEADER.unpack_from(blob)
+    return CODEC_NAMES[codec_id], dict_id
+
+
+def decompress(blob: bytes):
+    codec, dict_id = header(blob)
+    zdict = _load(dict_id)[1] if dict_id else None
+    body = memoryview(blob)[HEADER.size:]
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("payload is zstd-compressed but zstandard is not installed")
+        ddict = zstandard.ZstdCompressionDict(zdict) if zdict else None
+        raw = zstandard.ZstdDecompressor(dict_data=ddict).decompress(body)
+    else:
+        d = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+        raw = d.decompress(body) + d.flush()
+    return json.loads(raw)
+
+
+class CompressedJSON(TypeDecorator):
+    """JSON document stored compressed in a binary column."""
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else compress(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else decompress(bytes(value))
+
+
+# ---------- backfill & report --------------------------------------------
+def _raw_rows(sess, after: int, batch: int):
+    """(id, stored plain JSON, raw compressed bytes) without decoding."""
+    from sqlalchemy import type_coerce
+    from models import ArticleAnalysis
+    return sess.execute(
+        select(ArticleAnalysis.id, ArticleAnalysis.payload_json,
+               type_coerce(ArticleAnalysis.payload_z, LargeBinary))
+        .where(ArticleAnalysis.id > after)
+        .order_by(ArticleAnalysis.id).limit(batch)
+    ).all()
+
+
+def backfill(sess, batch: int = 200) -> int:
+    """Rewrite payloads that don't match ANALYSIS_COMPRESSION; returns rows changed."""
+    from sqlalchemy.orm.attributes import flag_modified
+    from models import ArticleAnalysis
+    codec = write_codec()
+    target = (codec, active_dict(codec)) if codec else None
+    changed, after = 0, 0
+    while True:
+        rows = _raw_rows(sess, after, batch)
+        if not rows:
+            break
+        after = rows[-1][0]
+        stale = [i for i, _, blob in rows
+                 if (header(bytes(blob)) if blob is not None else None) != target]
+        for row in sess.query(ArticleAnalysis).filter(ArticleAnalysis.id.in_(stale)):
+            row.payload = row.payload          # the setter picks the format
+            flag_modified(row, "payload_z")    # same dict, new encoding
+        sess.commit()
+        changed += len(stale)
+        if stale:
+            log.info("Rewrote %d payloads (up to id %d)", changed, after)
+    return changed
+
+
+def report(sess, batch: int = 500) -> dict:
+    """Stored vs plain JSON bytes, and decode time per row for each format."""
+    out = {"rows": 0, "compressed": 0, "json_bytes": 0, "stored_bytes": 0,
+           "decode_seconds": 0.0, "plain_rows": 0, "plain_decode_seconds": 0.0}
+    after = 0
+    while True:
+        rows = _raw_rows(sess, after, batch)
+        if not rows:
+            break
+        after = rows[-1][0]
+        for _, plain, blob in rows:
+            out["rows"] += 1
+            if blob is not None:
+                blob = bytes(blob)
+                started = time.perf_counter()
+                value = decompress(blob)
+                out["decode_seconds"] += time.perf_counter() - started
+                out["compressed"] += 1
+                out["stored_bytes"] += len(blob)
+                out["json_bytes"] += len(encode_json(value))
+            elif plain is not None:
+                raw = encode_json(plain)
+                started = time.perf_counter()
+                json.loads(raw)
+                out["plain_decode_seconds"] += time.perf_counter() - started
+                out["plain_rows"] += 1
+                out["stored_bytes"] += len(raw)
+                out["json_bytes"] += len(raw)
+    return out
+
+
+def main() -> int:
+    from models import Session
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    p = argparse.ArgumentParser(description="Compress stored analysis payloads.")
+    p.add_argument("--train", action="store_true", help="train a shared dictionary")
+    p.add_argument("--codec", choices=sorted(CODECS), default=write_codec() or "zlib")
+    p.add_argument("--samples", type=int, default=2000)
+    p.add_argument("--backfill", action="store_true",
+                   help="rewrite existing rows to ANALYSIS_COMPRESSION in batches")
+    p.add_argument("--batch", type=int, default=200)
+    p.add_argument("--report", action="store_true", help="bytes saved and decode cost")
+    args = p.parse_args()
+
+    sess = Session()
+    try:
+        if args.train:
+            dict_id = train(sess, args.codec, args.samples)
+            sess.commit()
+            print(f"Dictionary {dict_id} ({args.codec}) stored; "
+                  f"restart the app so new analyses use it")
+        if args.backfill:
+            print(f"Rewrote {backfill(sess, args.batch)} payloads "
+                  f"(target: {write_codec() or 'plain JSON'})")
+        if args.report or not (args.train or args.backfill):
+            r = report(sess)
+            saved = r["json_bytes"] - r["stored_bytes"]
+            print(f"rows            {r['rows']} ({r['compressed']} compressed)")
+            print(f"JSON bytes      {r['json_bytes']:,}")
+            print(f"stored bytes    {r['stored_bytes']:,}")
+            print(f"saved           {saved:,} ({saved / max(r['json_bytes'], 1):.0%})")
+            if r["compressed"]:
+                print(f"decode/row      {r['decode_seconds'] / r['compressed'] * 1e6:.1f} µs "
+                      f"(decompress + json.loads)")
+            if r["plain_rows"]:
+                print(f"plain parse/row {r['plain_decode_seconds'] / r['plain_rows'] * 1e6:.1f} µs "
+                      f"(json.loads only)")
+    finally:
+        sess.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
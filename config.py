@@ -3,12 +3,14 @@ Configuration settings for the application.
 Values can be overridden by environment variables.
 """
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # OpenAI settings
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60"))  # per request; a hung call would pin a worker thread
 
 # Model configurations
 MODELS = {
@@ -45,21 +47,92 @@ MODELS = {
 }
 
 # Analysis settings
-ANALYSE_LIMIT = int(os.getenv("ANALYSE_LIMIT", "1"))  # Default articles to analyze per site
+ANALYSE_LIMIT = int(os.getenv("ANALYSE_LIMIT", "1"))  # fetch_news --analyse: up to this × number of sites per run
 
 # News fetching settings
 NEWS_PER_SITE = int(os.getenv("NEWS_PER_SITE", "10"))  # Headlines to fetch per site
 NEWS_SUMMARY_LEN = int(os.getenv("NEWS_SUMMARY_LEN", "200"))  # Max words in news summary
+FETCH_COOLDOWN_MINUTES = int(os.getenv("FETCH_COOLDOWN_MINUTES", "15"))  # Minimum minutes between fetches
+MAX_FETCHES_PER_DAY = int(os.getenv("MAX_FETCHES_PER_DAY", "48"))  # Maximum fetches per day
+FETCH_RUN_TIMEOUT_SECONDS = int(os.getenv("FETCH_RUN_TIMEOUT_SECONDS", "600"))  # running longer = abandoned
+KEEP_ARTICLES = int(os.getenv("KEEP_ARTICLES", "1000"))  # newest articles kept in the database
+
+# Older articles are written here (Parquet, needs pyarrow) before they are
+# deleted; unset = delete without archiving
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")
+
+# Cross-process lock files (SQLite deployments; PostgreSQL uses advisory locks)
+LOCK_DIR = os.getenv("LOCK_DIR", tempfile.gettempdir())
 
 # Database settings
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///balanced_news.db")
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+# Optional read replica for page views (defaults to DATABASE_URL, own pool)
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+if DATABASE_READ_URL and DATABASE_READ_URL.startswith("postgres://"):
+    DATABASE_READ_URL = DATABASE_READ_URL.replace("postgres://", "postgresql://", 1)
+# Connection pool (per process; gthread workers share one pool across threads)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "10"))     # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))   # PostgreSQL: reconnect after this many seconds
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"  # PostgreSQL: test connections on checkout
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
 
 # Flask settings
 FLASK_ENV = os.getenv("FLASK_ENV", "development")
 SECRET_KEY = os.getenv("SECRET_KEY")
 
+# Create/upgrade the schema when the web app starts.  Production runs
+# `flask --app app init-db` in the release phase instead.
+INIT_DB_ON_STARTUP = os.getenv("INIT_DB_ON_STARTUP", "1" if FLASK_ENV == "development" else "0") == "1"
+
+# Analysis job queue: "db" (worker.py polls the jobs table), "redis" (worker.py
+# blocks on a Redis list, jobs table keeps status) or "inline" (background
+# thread in the web process – handy for `flask run`, not for production)
+JOB_BACKEND = os.getenv("JOB_BACKEND", "inline" if FLASK_ENV == "development" else "db")
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))  # worker idle poll interval (db backend)
+JOB_TIMEOUT_SECONDS = int(os.getenv("JOB_TIMEOUT_SECONDS", "300"))  # running jobs older than this are requeued
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+REDIS_URL = os.getenv("REDIS_URL")
+# Analyses younger than this are served from the DB instead of calling OpenAI
+# again (0 = always re-analyse on request)
+ANALYSIS_MAX_AGE_HOURS = float(os.getenv("ANALYSIS_MAX_AGE_HOURS", "24"))
+# Backlog workers (backlog.py) hold a claimed article this long; a worker
+# that dies releases its claims when they expire
+ANALYSIS_LEASE_SECONDS = int(os.getenv("ANALYSIS_LEASE_SECONDS", "600"))
+# Backlog priority (scheduler.py): a headline's recency weight halves every
+# PRIORITY_HALF_LIFE_HOURS; a batch run stops before spending more than
+# ANALYSIS_TOKEN_BUDGET OpenAI tokens (0 = no token limit)
+PRIORITY_HALF_LIFE_HOURS = float(os.getenv("PRIORITY_HALF_LIFE_HOURS", "6"))
+ANALYSIS_TOKEN_BUDGET = int(os.getenv("ANALYSIS_TOKEN_BUDGET", "0"))
+
+# Store new analysis payloads compressed: "" (plain JSON), "zlib" or "zstd"
+# (needs the zstandard package).  `python compression.py --backfill` rewrites
+# existing rows to match.
+ANALYSIS_COMPRESSION = os.getenv("ANALYSIS_COMPRESSION", "").strip().lower()
+
+# Instrumentation: request logs are JSON lines; only this fraction of normal
+# requests is logged, slow (>= SLOW_REQUEST_MS) and failing ones always are
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+SLOW_REQUEST_MS = int(os.getenv("SLOW_REQUEST_MS", "1000"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # if set, /metrics requires "Authorization: Bearer <token>"
+# Per-request SQL accounting: X-DB-Queries / Server-Timing response headers,
+# and whether a route exceeding its @query_budget raises instead of logging
+QUERY_DEBUG_HEADERS = os.getenv("QUERY_DEBUG_HEADERS", "1" if FLASK_ENV == "development" else "0") == "1"
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "0") == "1"
+
+# On-demand profiling (profiling.py): "sample" (stack sampler, collapsed
+# stacks for flamegraphs) or "cprofile" (.prof files for pstats/snakeviz);
+# empty = off, except for requests sending "X-Profile: <ADMIN_PASSWORD>"
+PROFILE_MODE = os.getenv("PROFILE_MODE", "").strip().lower()
+PROFILE_SLOW_MS = int(os.getenv("PROFILE_SLOW_MS", str(SLOW_REQUEST_MS)))  # requests faster than this are discarded
+PROFILE_FETCH_MS = int(os.getenv("PROFILE_FETCH_MS", "0"))       # same for fetch runs (0 = keep every run)
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "balanced-news-profiles"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))              # newest files kept in PROFILE_DIR
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))  # sampler period
+
 # Admin settings
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")  # Required for admin actions 
 
@@ -79,7 +152,10 @@ config = {
     "NEWS_PER_SITE": NEWS_PER_SITE,
     "NEWS_SUMMARY_LEN": NEWS_SUMMARY_LEN,
     "ANALYSE_LIMIT": ANALYSE_LIMIT,
+    "FETCH_COOLDOWN_MINUTES": FETCH_COOLDOWN_MINUTES,
+    "MAX_FETCHES_PER_DAY": MAX_FETCHES_PER_DAY,
     "MODELS": MODELS,
+    "JOB_BACKEND": JOB_BACKEND,
     "OPENAI_API_KEY": OPENAI_API_KEY,
     "ADMIN_PASSWORD": ADMIN_PASSWORD
 } 
\ No newline at end of file
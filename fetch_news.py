@@ -4,19 +4,28 @@ Collect latest headlines (10 / site), optionally analyse with OpenAI,
 store everything in SQLite.  Run manually or via cron/GitHub Action.
 """
 from __future__ import annotations
-import argparse, json, logging, os, random, sys, time
+import argparse, logging, os, random, sys, time
 from datetime import datetime
 from typing import Dict, List
 
 import re, html, feedparser, requests
 from bs4 import BeautifulSoup
+from sqlalchemy import insert, update
 from dotenv import load_dotenv
 
 from models import Session, Article, init_db
-from analysis import analyse_article
+import adapters
+from store import content_hash
+import archive
+import backlog
+import scheduler
+import metrics
+import profiling
+from jobs import worker_id
+from runs import claim_run, finish_run
 from sources import SITES
 from config import (
-    NEWS_PER_SITE, NEWS_SUMMARY_LEN, MODELS, ANALYSE_LIMIT
+    NEWS_PER_SITE, NEWS_SUMMARY_LEN, MODELS, ANALYSE_LIMIT, ANALYSIS_TOKEN_BUDGET, KEEP_ARTICLES
 )
 
 load_dotenv()
@@ -53,9 +62,12 @@ def rss_top(site: str, n: int, news_len: int) -> list[dict]:
       • naked " & " inside text or attributes
     Works even when feedparser sets bozo=True, as long as entries[] exist.
     """
-    url = SITES[site]["rss"]
-    raw = requests.get(url, timeout=10).content
+    raw = requests.get(adapters.get(site).rss_url, timeout=10).content
+    return parse_rss(raw, n, news_len)
 
+
+def parse_rss(raw: bytes, n: int, news_len: int) -> List[Dict]:
+    """The parsing half of rss_top (no network)."""
     # 1) strip control bytes
     tmp = CTRL_RE.sub(b"", raw)
 
@@ -91,9 +103,8 @@ def html_top(site: str, n: int, news_len: int) -> List[Dict]:
     """
     Fallback scraping for sites whose front page is server‑rendered.
     """
-    url = SITES[site]["html"]
     r = requests.get(
-        url,
+        adapters.get(site).html_url,
         headers={
             "User-Agent": random.choice(UA),
             "Accept-Language": "sv-SE,sv;q=0.9,en;q=0.5",
@@ -101,57 +112,87 @@ def html_top(site: str, n: int, news_len: int) -> List[Dict]:
         timeout=10,
     )
     r.raise_for_status()
-    soup = BeautifulSoup(r.text, "html.parser")
-    stories = []
-
-    if site == "dagens":
-        for a in soup.select("a.front__article-link")[:n]:
-                stories.append(
-                    {
-                        "title": a.get_text(strip=True),
-                        "summary": "",
-                        "url": "https://dagens.se" + a["href"],   # ← absolute
-                    }
-                )
-
-    else:  # generic <article><h2> fallback
-        for art in soup.find_all("article"):
-            if len(stories) >= n:
-                break
-            h = art.find(["h2", "h3"])
-            if not h:
-                continue
-            stories.append(
-                {
-                    "title": h.get_text(strip=True),
-                    "summary": "",
-                    "url": h.find("a")["href"] if h.find("a") else url,
-                }
-            )
-
-    # Trim words if we filled summary later
+    return parse_html(site, r.text, n, news_len)
+
+
+def parse_html(site: str, text: str, n: int, news_len: int) -> List[Dict]:
+    """The parsing half of html_top (no network); selectors per outlet live
+    in adapters.py."""
+    stories = adapters.get(site).parse_html(text, n)
     for s in stories:
         s["summary"] = truncate_words(s["summary"], news_len)
-    return stories[:n]
+    return stories
+
+
+FETCHERS = {"rss": rss_top, "html": html_top}
 
 
 def collect_news(n: int, news_len: int) -> Dict[str, List[Dict]]:
-    """Return dict {site: [articles…]}"""
+    """Return dict {site: [articles…]}, trying each outlet's strategies in order."""
     all_sites = {}
     for site in SITES:
-        try:
-            all_sites[site] = rss_top(site, n, news_len)
-            log.info("%s: %d from RSS", site, len(all_sites[site]))
-        except Exception as e:
-            log.warning("%s RSS failed (%s). Falling back to HTML.", site, e)
+        all_sites[site] = []
+        for strategy in adapters.get(site).strategies:
             try:
-                all_sites[site] = html_top(site, n, news_len)
-                log.info("%s: %d from HTML", site, len(all_sites[site]))
-            except Exception as ee:
-                log.error("%s HTML failed (%s).", site, ee)
-                all_sites[site] = []
+                all_sites[site] = FETCHERS[strategy](site, n, news_len)
+                log.info("%s: %d from %s", site, len(all_sites[site]), strategy.upper())
+                break
+            except Exception as e:
+                log.warning("%s %s failed (%s).", site, strategy.upper(), e)
     return all_sites
 
+def existing_articles(session, site: str, items: List[Dict]) -> Dict[str, Article]:
+    """{url: Article} for the stored headlines among `items` – one query per
+    site instead of one per headline."""
+    urls = list({art["url"] for art in items})
+    if not urls:
+        return {}
+    rows = session.query(Article).filter(Article.site == site, Article.url.in_(urls)).all()
+    return {row.url: row for row in rows}
+
+def ingest_news(session, news: Dict[str, List[Dict]]) -> Dict[str, dict]:
+    """Store headlines not seen before and the edits feeds made to stored ones;
+    returns {site: {"fetched", "added", "updated"}}.  An edited article that
+    has an analysis is marked `analysis_stale` for `backlog.py --stale`."""
+    counts = {}
+    for site, items in news.items():
+        stored = existing_articles(session, site, items)
+        seen = set(stored)
+        rows, changed = [], []
+        for art in items:
+            fingerprint = content_hash(art["title"], art["summary"])
+            old = stored.pop(art["url"], None)
+            if old is not None:
+                if fingerprint != (old.content_hash or content_hash(old.title, old.summary)):
+                    changed.append({"id": old.id, "title": art["title"],
+                                    "summary": art["summary"], "content_hash": fingerprint,
+                                    "analysis_stale": bool(old.analysis_id or old.analysis_stale)})
+                continue
+            if art["url"] in seen:
+                continue
+            seen.add(art["url"])            # feeds repeat items now and then
+            rows.append({
+                "site": site,
+                "title": art["title"],
+                "summary": art["summary"],
+                "url": art["url"],
+                "content_hash": fingerprint,
+                "fetched_at": datetime.utcnow(),
+                "verified_claims": 0,
+                "corrected_claims": 0,
+            })
+        if rows:
+            # one executemany; ORM adds would INSERT … RETURNING row by row
+            session.execute(insert(Article), rows)
+        if changed:
+            session.execute(update(Article), changed)
+        counts[site] = {"fetched": len(items), "added": len(rows), "updated": len(changed)}
+    session.commit()
+    # new headlines join the backlog, and change the coverage of older ones
+    scheduler.rescore(session)
+    session.commit()
+    return counts
+
 # -----------------------------------------------------------------------------
 def build_cli() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(description="Fetch & optionally analyse Swedish headlines.")
@@ -164,135 +205,70 @@ def build_cli() -> argparse.ArgumentParser:
     p.add_argument("--max-tokens",       type=int, default=MODELS["default"]["max_tokens"],
                    help=f"OpenAI max_tokens (default: {MODELS['default']['max_tokens']})")
     p.add_argument("--analyse", action="store_true",
-                   help="call OpenAI right away (otherwise only fetch headlines)")
+                   help="analyse stored articles that have no analysis yet, newest first "
+                        "(otherwise only fetch headlines)")
     p.add_argument("--analyse-limit", type=int, default=ANALYSE_LIMIT,
-                   help=f"max articles to analyse per site (default: {ANALYSE_LIMIT})")
+                   help=f"analyse up to this many articles × number of sites, highest "
+                        f"priority first, from any outlet (default: {ANALYSE_LIMIT})")
+    p.add_argument("--token-budget", type=int, default=ANALYSIS_TOKEN_BUDGET,
+                   help=f"stop analysing before spending more OpenAI tokens "
+                        f"(default: {ANALYSIS_TOKEN_BUDGET or 'no limit'})")
     return p
 
 # -----------------------------------------------------------------------------
+def fetch_and_store(session, args) -> tuple:
+    """Collect headlines, store new ones and edits, then (with --analyse)
+    re-analyse edited articles and work through the analysis backlog in
+    priority order (scheduler.py) – sharing both with any other analysing
+    process via backlog leases."""
+    news = collect_news(args.per_site, args.news_len)
+    site_counts = ingest_news(session, news)
+    pulled = sum(len(items) for items in news.values())
+    analysed = tokens = 0
+    if args.analyse:
+        budget = scheduler.TokenBudget(args.token_budget, scheduler.expected_tokens(session))
+        limit = args.analyse_limit * len(SITES)
+        for stale in (True, False):         # edits first: readers already see those
+            done, used = backlog.drain(
+                session, worker_id(), limit=limit - analysed, stale=stale, budget=budget,
+                max_words=args.balanced_len, max_tokens=args.max_tokens)
+            analysed, tokens = analysed + done, tokens + used
+    return pulled, analysed, tokens, site_counts
+
+
 def main() -> None:
     args = build_cli().parse_args()
     init_db()
     session = Session()
+    run, started, _ = claim_run(session, "cli", enforce_limits=False)
+    if not started:
+        log.info("Fetch run #%d is already in progress – nothing to do", run.id)
+        session.close()
+        return
+    try:
+        with metrics.count_queries() as db_stats, profiling.profiled("fetch_news"):
+            pulled, analysed, tokens, site_counts = fetch_and_store(session, args)
+    except Exception as e:
+        session.rollback()
+        finish_run(session, run, {}, error=str(e))
+        session.close()
+        raise
+    finish_run(session, run, site_counts)
 
-    pulled = analysed = tokens = 0
-    news = collect_news(args.per_site, args.news_len)
-
-    for site, items in news.items():
-        pulled += len(items)
-        site_analysed = 0  # Track how many articles we've analyzed for this site
-        for art in items:
-            # Check if article exists and needs analysis
-            existing = session.query(Article).filter_by(site=site, url=art["url"]).first()
-            if existing:
-                if args.analyse and not existing.nuanced_perspective and site_analysed < args.analyse_limit:
-                    # Article exists but needs analysis
-                    analysis = analyse_article(
-                        art,
-                        max_words=args.balanced_len,
-                        max_tokens=args.max_tokens,
-                    )
-                    analysed += 1
-                    site_analysed += 1
-                    tokens += analysis.get("tokens", 0)
-                    
-                    # Update existing article with analysis
-                    now = datetime.utcnow()
-                    existing.nuanced_perspective = json.dumps(analysis, ensure_ascii=False)
-                    existing.verified_claims = len(analysis.get("verification", {}).get("verified_claims", []))
-                    existing.corrected_claims = len(analysis.get("verification", {}).get("corrected_claims", []))
-                    existing.analysis_sources = json.dumps(analysis.get("sources", []), ensure_ascii=False)
-                    existing.analyzed_at = now
-                    existing.last_updated_at = now
-                    
-                    # Legacy fields
-                    existing.balanced_title = analysis.get("main_facts", "")[:300]
-                    existing.balanced_summary = json.dumps(analysis.get("context", {}), ensure_ascii=False)
-                    existing.bias_score = 0
-                    existing.bias_label = "nyanserad"
-                    existing.bias_explanation = json.dumps(analysis.get("perspectives", {}), ensure_ascii=False)
-                    existing.openai_tokens = analysis.get("tokens", 0)
-                    
-                    session.commit()
-                continue
-            
-            if args.analyse and site_analysed < args.analyse_limit:
-                analysis = analyse_article(
-                    art,
-                    max_words=args.balanced_len,
-                    max_tokens=args.max_tokens,
-                )
-                analysed += 1
-                site_analysed += 1
-                tokens += analysis.get("tokens", 0)
-                
-                # Store nuanced analysis results
-                now = datetime.utcnow()
-                row = Article(
-                    site=site,
-                    title=art["title"],
-                    summary=art["summary"],
-                    url=art["url"],
-                    fetched_at=now,
-                    # New fields
-                    nuanced_perspective=json.dumps(analysis, ensure_ascii=False),
-                    verified_claims=len(analysis.get("verification", {}).get("verified_claims", [])),
-                    corrected_claims=len(analysis.get("verification", {}).get("corrected_claims", [])),
-                    analysis_sources=json.dumps(analysis.get("sources", []), ensure_ascii=False),
-                    analyzed_at=now,
-                    last_updated_at=now,
-                    # Legacy fields
-                    balanced_title=analysis.get("main_facts", "")[:300],
-                    balanced_summary=json.dumps(analysis.get("context", {}), ensure_ascii=False),
-                    bias_score=0,
-                    bias_label="nyanserad",
-                    bias_explanation=json.dumps(analysis.get("perspectives", {}), ensure_ascii=False),
-                    openai_tokens=analysis.get("tokens", 0),
-                )
-            else:
-                row = Article(
-                    site=site,
-                    title=art["title"],
-                    summary=art["summary"],
-                    url=art["url"],
-                    fetched_at=datetime.utcnow(),
-                    # Initialize new fields as None/0
-                    nuanced_perspective=None,
-                    verified_claims=0,
-                    corrected_claims=0,
-                    analysis_sources=None,
-                    analyzed_at=None,
-                    last_updated_at=None,
-                    # Legacy fields
-                    balanced_title=None,
-                    balanced_summary=None,
-                    bias_score=None,
-                    bias_label=None,
-                    bias_explanation=None,
-                    openai_tokens=0,
-                )
-
-            session.add(row)
-            session.commit()
-            log.debug("Saved: %s | %s", site, art["title"][:60])
-
-    # Keep only the 1000 most recent articles
+    # Keep only the KEEP_ARTICLES most recent articles (archived first if configured)
     try:
-        # Get the ID of the 1000th most recent article
-        oldest_article = session.query(Article.id).order_by(Article.fetched_at.desc()).offset(1000).first()
-        if oldest_article:
-            # Delete all articles older than the 1000th most recent
-            session.query(Article).filter(Article.id < oldest_article[0]).delete()
-            session.commit()
-            log.info("Deleted articles older than the 1000 most recent")
+        deleted = archive.prune(session, KEEP_ARTICLES)
+        if deleted:
+            log.info("Deleted %d articles older than the %d most recent", deleted, KEEP_ARTICLES)
     except Exception as e:
         log.error("Error while cleaning up old articles: %s", e)
         session.rollback()
 
     session.close()
     log.info(
-        "Pulled %d headlines | analysed %d | tokens %d (≈ %.2f SEK)",
-        pulled, analysed, tokens, tokens * 0.006  # 0.6 öre / token @ gpt-3.5
+        "Pulled %d headlines | analysed %d | tokens %d (≈ %.2f SEK) | %d queries, %.0f ms in DB",
+        pulled, analysed, tokens, tokens * 0.006,  # 0.6 öre / token @ gpt-3.5
+        db_stats["queries"], db_stats["db_seconds"] * 1000,
     )
 
 
@@ -0,0 +1,81 @@
+"""
+gunicorn settings (picked up automatically from the working directory).
+
+The slow requests here wait on the network (OpenAI, news sites, Redis), so
+workers are concurrent: `gthread` by default, `gevent` if installed and
+asked for.  Process count follows CPU and the memory available to the dyno
+or container; WEB_CONCURRENCY (set by Heroku) overrides it.
+
+    GUNICORN_WORKER_CLASS   gthread | gevent | sync           (gthread)
+    GUNICORN_THREADS        threads per gthread worker        (8)
+    GUNICORN_CONNECTIONS    greenlets per gevent worker       (100)
+    WORKER_MEMORY_MB        budget per worker process         (160)
+
+Prometheus multiprocess mode: when PROMETHEUS_MULTIPROC_DIR is set the
+directory is emptied on start, and samples of exited workers are reaped.
+"""
+import multiprocessing, os, shutil
+
+
+def _memory_limit_mb():
+    """Memory available to this container (cgroup limit, else physical RAM)."""
+    for path in ("/sys/fs/cgroup/memory.max",                      # cgroup v2
+                 "/sys/fs/cgroup/memory/memory.limit_in_bytes"):   # cgroup v1
+        try:
+            with open(path) as fh:
+                raw = fh.read().strip()
+        except OSError:
+            continue
+        if raw.isdigit() and int(raw) < 1 << 60:   # "max" / huge = unlimited
+            return int(raw) // 2 ** 20
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2 ** 20
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def _default_workers():
+    by_cpu = multiprocessing.cpu_count() * 2 + 1
+    memory = _memory_limit_mb()
+    if memory is None:
+        return by_cpu
+    by_memory = memory // int(os.getenv("WORKER_MEMORY_MB", "160"))
+    return max(1, min(by_cpu, by_memory))
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.getenv("WEB_CONCURRENCY", _default_workers()))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+worker_connections = int(os.getenv("GUNICORN_CONNECTIONS", "100"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+keepalive = 5
+# recycle workers now and then so slow leaks can't accumulate
+max_requests = 2000
+max_requests_jitter = 200
+accesslog = None        # request logs come from metrics.py (sampled)
+
+
+def on_starting(server):
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+    server.log.info("Serving with %d %s workers (threads %d, connections %d)",
+                    workers, worker_class, threads, worker_connections)
+
+
+def post_fork(server, worker):
+    if worker_class == "gevent":
+        # psycopg2 blocks the whole hub unless it is told to yield
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            server.log.warning("psycogreen not installed – PostgreSQL calls will block gevent workers")
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from metrics import mark_process_dead
+        mark_process_dead(worker.pid)
@@ -0,0 +1,257 @@
+"""
+Analysis job queue.
+
+/api/analyse only records an `analysis_jobs` row and returns 202; the OpenAI
+call (and its retry back-off) happens in worker.py, so web workers stay free
+for page views.  The page polls /api/jobs/<id> until the job is done.
+
+Backends (JOB_BACKEND):
+  • db     – worker.py polls the table; claims are conditional UPDATEs
+             (FOR UPDATE SKIP LOCKED on PostgreSQL)
+  • redis  – job ids are pushed on a Redis list and the worker blocks on it;
+             the table is still the source of truth for status
+  • inline – a background thread in the web process (development only)
+
+Duplicate requests coalesce: while an article has a queued or running job,
+further requests get that job back (checked under a cross-process lock), and
+analyses younger than ANALYSIS_MAX_AGE_HOURS are served without a new call.
+Inside one process, concurrent runs for the same article share one OpenAI
+call via SingleFlight; the leader commits the analysis before the others
+are released, so no job is marked done ahead of its result.  A failed call
+(AnalysisFailed) fails every job sharing it, and each is retried up to
+JOB_MAX_ATTEMPTS.
+"""
+from __future__ import annotations
+import logging, os, socket, threading, time
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from sqlalchemy import or_, and_, select, update
+
+import backlog
+import metrics
+from models import Session, Article, AnalysisJob
+from locks import SingleFlight, named_lock
+from config import (
+    JOB_BACKEND, JOB_TIMEOUT_SECONDS, JOB_MAX_ATTEMPTS, JOB_POLL_SECONDS, REDIS_URL,
+    ANALYSIS_MAX_AGE_HOURS,
+)
+
+log = logging.getLogger("jobs")
+
+REDIS_QUEUE = "analysis_jobs"
+ENQUEUE_LOCK = "analysis-enqueue"
+
+_inflight = SingleFlight()
+
+_redis = None
+
+
+def redis_client():
+    """Lazily connected Redis client (only for JOB_BACKEND=redis)."""
+    global _redis
+    if _redis is None:
+        import redis
+        kwargs = {"socket_timeout": 30, "socket_connect_timeout": 5}
+        if REDIS_URL and REDIS_URL.startswith("rediss://"):
+            kwargs["ssl_cert_reqs"] = None  # Heroku Redis uses self-signed certs
+        _redis = redis.from_url(REDIS_URL, **kwargs)
+    return _redis
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+# ---------- producer side ---------------------------------------------
+def is_fresh(article: Article, now: Optional[datetime] = None) -> bool:
+    """True if the stored analysis is recent enough to serve as-is."""
+    if not article.analyzed_at or ANALYSIS_MAX_AGE_HOURS <= 0:
+        return False
+    now = now or datetime.utcnow()
+    return now - article.analyzed_at < timedelta(hours=ANALYSIS_MAX_AGE_HOURS)
+
+
+def _active(now: datetime):
+    """Jobs that will still produce a result: queued, or running on a live worker."""
+    stale = now - timedelta(seconds=JOB_TIMEOUT_SECONDS)
+    return or_(
+        AnalysisJob.status == "queued",
+        and_(AnalysisJob.status == "running", AnalysisJob.started_at >= stale),
+    )
+
+
+def enqueue(sess, article_id: int) -> Tuple[AnalysisJob, bool]:
+    """
+    Queue an analysis of `article_id` and hand it to the backend.
+    Returns (job, created); `created` is False when an in-flight job for the
+    same article was returned instead.
+    """
+    with named_lock(sess, ENQUEUE_LOCK):
+        now = datetime.utcnow()
+        active = (
+            sess.query(AnalysisJob)
+            .filter(AnalysisJob.article_id == article_id, _active(now))
+            .order_by(AnalysisJob.created_at.desc())
+            .first()
+        )
+        if active:
+            sess.commit()
+            return active, False
+
+        job = AnalysisJob(article_id=article_id, status="queued", created_at=now)
+        sess.add(job)
+        sess.commit()
+
+    if JOB_BACKEND == "redis":
+        redis_client().lpush(REDIS_QUEUE, job.id)
+    elif JOB_BACKEND == "inline":
+        threading.Thread(target=run_job, args=(job.id,), daemon=True,
+                         name=f"analysis-job-{job.id}").start()
+    return job, True
+
+
+def job_to_dict(job: AnalysisJob, article: Optional[Article] = None) -> dict:
+    out = {
+        "job_id": job.id,
+        "article_id": job.article_id,
+        "status": job.status,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "error": job.error,
+    }
+    if job.status == "done" and article is not None:
+        out["verified_claims"] = article.verified_claims
+        out["corrected_claims"] = article.corrected_claims
+    return out
+
+
+# ---------- consumer side ---------------------------------------------
+def _claimable(now: datetime):
+    """Queued jobs, plus running jobs whose worker has gone quiet."""
+    stale = now - timedelta(seconds=JOB_TIMEOUT_SECONDS)
+    return or_(
+        AnalysisJob.status == "queued",
+        and_(AnalysisJob.status == "running", AnalysisJob.started_at < stale),
+    )
+
+
+def claim(sess, job_id: int, worker: str) -> bool:
+    """Atomically move one job to running; False if another worker has it."""
+    now = datetime.utcnow()
+    claimed = sess.execute(
+        update(AnalysisJob)
+        .where(AnalysisJob.id == job_id, _claimable(now))
+        .values(status="running", started_at=now, worker=worker,
+                attempts=AnalysisJob.attempts + 1)
+    ).rowcount
+    sess.commit()
+    return bool(claimed)
+
+
+def claim_next(sess, worker: str) -> Optional[int]:
+    """Claim the oldest claimable job from the table; returns its id."""
+    now = datetime.utcnow()
+    query = (
+        select(AnalysisJob.id)
+        .where(_claimable(now))
+        .order_by(AnalysisJob.created_at)
+        .limit(1)
+    )
+    if sess.get_bind().dialect.name == "postgresql":
+        job_id = sess.execute(query.with_for_update(skip_locked=True)).scalar()
+        if job_id is None:
+            sess.rollback()
+            return None
+        sess.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.id == job_id)
+            .values(status="running", started_at=now, worker=worker,
+                    attempts=AnalysisJob.attempts + 1)
+        )
+        sess.commit()
+        return job_id
+
+    # SQLite & co: pick a candidate, win it with a conditional UPDATE
+    for _ in range(5):
+        job_id = sess.execute(query).scalar()
+        sess.rollback()
+        if job_id is None:
+            return None
+        if claim(sess, job_id, worker):
+            return job_id
+    return None
+
+
+def next_job(sess, worker: str, timeout: float) -> Optional[int]:
+    """Block up to `timeout` seconds for the next job id (backend aware)."""
+    if JOB_BACKEND == "redis":
+        item = redis_client().brpop(REDIS_QUEUE, timeout=max(1, int(timeout)))
+        if item is not None and claim(sess, int(item[1]), worker):
+            return int(item[1])
+        # fall through: also pick up stale/orphaned jobs from the table
+    return claim_next(sess, worker)
+
+
+def run_job(job_id: int, worker: Optional[str] = None) -> None:
+    """Analyse the job's article and record the outcome."""
+    sess = Session()
+    try:
+        job = sess.get(AnalysisJob, job_id)
+        if job is None:
+            return
+        if job.status != "running":
+            # inline backend hands over unclaimed jobs
+            if not claim(sess, job_id, worker or worker_id()):
+                return
+            sess.refresh(job)
+
+        article = sess.get(Article, job.article_id)
+        if article is None:
+            job.status, job.error = "failed", "Article not found"
+        elif article.analyzed_at and article.analyzed_at >= job.created_at:
+            # analysed after this job was queued (batch run, earlier job)
+            metrics.cache_result("analysis", True)
+            job.status, job.error = "done", None
+        else:
+            def analyse_and_save():
+                # under the article's backlog lease; committed before do()
+                # returns, so followers find it stored
+                owner = job.worker or worker_id()
+                deadline = time.monotonic() + JOB_TIMEOUT_SECONDS / 2
+                while not backlog.claim_article(sess, article.id, owner):
+                    if time.monotonic() > deadline:
+                        raise RuntimeError("Article is leased by another analyser")
+                    time.sleep(JOB_POLL_SECONDS)
+                sess.refresh(article)
+                if article.analyzed_at and article.analyzed_at >= job.created_at:
+                    backlog.release(sess, article.id, owner)   # the lease holder analysed it
+                    return
+                if backlog.analyse_claimed(sess, article.id, owner, reanalyse=True) is None:
+                    raise RuntimeError("Lost the article's lease, or it was edited")
+
+            _, leader = _inflight.do(article.id, analyse_and_save)
+            metrics.cache_result("analysis_inflight", not leader)
+            if not leader:
+                sess.refresh(article)
+                if not (article.analyzed_at and article.analyzed_at >= job.created_at):
+                    raise RuntimeError("Shared analysis was not stored")
+            job.status, job.error = "done", None
+        job.finished_at = datetime.utcnow()
+        sess.commit()
+    except Exception as e:
+        log.exception("Analysis job %s failed", job_id)
+        sess.rollback()
+        job = sess.get(AnalysisJob, job_id)
+        if job is not None:
+            retry = job.attempts < JOB_MAX_ATTEMPTS
+            job.status = "queued" if retry else "failed"
+            job.error = str(e)
+            job.finished_at = None if retry else datetime.utcnow()
+            sess.commit()
+            if retry and JOB_BACKEND == "redis":
+                redis_client().lpush(REDIS_QUEUE, job_id)
+            elif retry and JOB_BACKEND == "inline":
+                threading.Thread(target=run_job, args=(job_id,), daemon=True).start()
+    finally:
+        sess.close()
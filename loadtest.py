@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Page-view latency while analyses are in flight.
+
+Measures GET latency on the listing pages alone (baseline), then again while
+`--analyses` concurrent clients keep POSTing /api/analyse and polling their
+jobs.  With concurrent workers (gunicorn.conf.py) the two should match.
+
+    gunicorn "app:create_app()" &
+    python loadtest.py --url http://127.0.0.1:8000 --analyses 20
+
+Every /api/analyse call may cost OpenAI tokens – point it at a dev server
+(JOB_BACKEND=inline, ANALYSIS_MAX_AGE_HOURS=0) unless that is intended.
+"""
+from __future__ import annotations
+import argparse, statistics, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+PAGES = ["/", "/analytics", "/api/articles?limit=30"]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return float("nan")
+    k = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def page_views(base: str, seconds: float, clients: int) -> list:
+    """Hit PAGES round-robin from `clients` threads; returns latencies in ms."""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client(offset: int):
+        s = requests.Session()
+        i = offset
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                ok = s.get(base + PAGES[i % len(PAGES)], timeout=30).ok
+            except requests.RequestException:
+                ok = False
+            ms = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(ms)
+                errors[0] += not ok
+            i += 1
+
+    with ThreadPoolExecutor(clients) as pool:
+        list(pool.map(client, range(clients)))
+    if errors[0]:
+        print(f"  {errors[0]} failed page requests")
+    return latencies
+
+
+def analysis_load(base: str, article_ids: list, stop: threading.Event, counts: dict):
+    s = requests.Session()
+    i = 0
+    while not stop.is_set():
+        article_id = article_ids[i % len(article_ids)]
+        i += 1
+        try:
+            r = s.post(base + "/api/analyse", json={"article_id": article_id}, timeout=30)
+            counts["posted"] += 1
+            status_url = r.json().get("status_url") if r.status_code == 202 else None
+            while status_url and not stop.is_set():
+                if s.get(base + status_url, timeout=30).json().get("status") in ("done", "failed"):
+                    break
+                stop.wait(0.5)
+        except (requests.RequestException, ValueError):
+            counts["errors"] += 1
+            stop.wait(1)
+
+
+def report(label: str, latencies: list) -> None:
+    print(f"{label:<22} n={len(latencies):<6} "
+          f"p50={percentile(latencies, 50):7.1f}ms  p95={percentile(latencies, 95):7.1f}ms  "
+          f"p99={percentile(latencies, 99):7.1f}ms  mean={statistics.fmean(latencies) if latencies else 0:7.1f}ms")
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    p.add_argument("--url", default="http://127.0.0.1:8000")
+    p.add_argument("--seconds", type=float, default=20, help="duration of each phase")
+    p.add_argument("--readers", type=int, default=4, help="concurrent page-view clients")
+    p.add_argument("--analyses", type=int, default=20, help="concurrent analysis clients")
+    args = p.parse_args()
+    base = args.url.rstrip("/")
+
+    articles = requests.get(base + "/api/articles?limit=100", timeout=30).json()["articles"]
+    if not articles:
+        raise SystemExit("No articles – run fetch_news.py first")
+    ids = [a["id"] for a in articles]
+
+    baseline = page_views(base, args.seconds, args.readers)
+    report("page views (idle)", baseline)
+
+    stop, counts = threading.Event(), {"posted": 0, "errors": 0}
+    load = [threading.Thread(target=analysis_load, args=(base, ids, stop, counts), daemon=True)
+            for _ in range(args.analyses)]
+    for t in load:
+        t.start()
+    try:
+        loaded = page_views(base, args.seconds, args.readers)
+    finally:
+        stop.set()
+        for t in load:
+            t.join(timeout=35)
+    report(f"page views ({args.analyses} analysing)", loaded)
+    print(f"analysis requests: {counts['posted']} posted, {counts['errors']} errors")
+
+    ratio = percentile(loaded, 95) / max(percentile(baseline, 95), 1e-9)
+    print(f"p95 ratio under load: {ratio:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Cross-process named locks.
+
+  • PostgreSQL → transaction-scoped advisory lock (pg_advisory_xact_lock),
+                 released when the caller's transaction commits or rolls back
+  • otherwise  → fcntl lock file in LOCK_DIR, released on exiting the block
+
+Used to make check-then-insert sequences atomic across gunicorn workers,
+cron and worker processes.  `SingleFlight` coalesces identical calls made
+concurrently by threads of one process.
+"""
+from __future__ import annotations
+import logging, os, re, threading, zlib
+from contextlib import contextmanager
+
+from sqlalchemy import text
+
+from config import LOCK_DIR
+
+try:
+    import fcntl
+except ImportError:          # Windows dev boxes: in-process locking only
+    fcntl = None
+
+log = logging.getLogger("locks")
+
+_local_locks: dict = {}
+_local_guard = threading.Lock()
+
+
+def lock_key(name: str) -> int:
+    """Stable signed 64-bit key for pg advisory locks."""
+    return zlib.crc32(name.encode()) - 2 ** 31
+
+
+@contextmanager
+def named_lock(sess, name: str):
+    """Hold the lock `name` for the duration of the block."""
+    if sess.get_bind().dialect.name == "postgresql":
+        sess.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": lock_key(name)})
+        yield
+        return
+
+    if fcntl is None:
+        with _local_guard:
+            lock = _local_locks.setdefault(name, threading.Lock())
+        with lock:
+            yield
+        return
+
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    path = os.path.join(LOCK_DIR, f"balanced_news-{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}.lock")
+    with open(path, "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+class SingleFlight:
+    """
+    In-process call coalescing: concurrent `do(key, fn)` calls for the same
+    key share one execution of `fn`.  Returns (result, leader) where
+    `leader` is True only for the caller that actually ran `fn`.
+    """
+
+    class _Call:
+        __slots__ = ("event", "result", "error")
+
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._calls: dict = {}
+
+    def do(self, key, fn):
+        with self._guard:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._guard:
+                del self._calls[key]
+            call.event.set()
+        return call.result, True
@@ -0,0 +1,253 @@
+"""
+Instrumentation: Prometheus metrics and sampled structured logs.
+
+  • request duration per route, plus DB query count / time per request
+    (SQLAlchemy cursor events on every engine) checked against the route's
+    declared query budget; `count_queries()` does the same for CLI runs
+  • OpenAI call latency and tokens per model
+  • cache hits and misses (stored analyses, coalesced analysis runs)
+  • startup time and resident memory of each web worker
+
+/metrics renders everything in the Prometheus text format.  Under gunicorn
+set PROMETHEUS_MULTIPROC_DIR to an empty, writable directory: every worker
+process then writes its samples there and /metrics aggregates them
+(gunicorn.conf.py clears the directory on start and reaps dead workers).
+Without it each process only reports itself, which is fine for `flask run`.
+"""
+from __future__ import annotations
+import json, logging, os, random, sys, threading, time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY,
+    generate_latest,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import LOG_SAMPLE_RATE, QUERY_BUDGET_STRICT, SLOW_REQUEST_MS
+
+log = logging.getLogger("metrics")
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+OPENAI_BUCKETS = (.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency per route",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries", "SQL statements executed per request",
+    ["route"], buckets=QUERY_BUCKETS)
+REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Time spent in SQL per request",
+    ["route"], buckets=LATENCY_BUCKETS)
+DB_POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time waiting for a pooled DB connection",
+    ["pool"], buckets=(.0005, .001, .005, .01, .05, .1, .5, 1, 5, 30))
+DB_QUERIES = Counter(
+    "db_queries_total", "SQL statements executed (all processes)", ["kind"])
+OPENAI_SECONDS = Histogram(
+    "openai_request_duration_seconds", "OpenAI chat completion latency",
+    ["model", "outcome"], buckets=OPENAI_BUCKETS)
+OPENAI_TOKENS = Counter(
+    "openai_tokens_total", "Tokens billed by OpenAI", ["model"])
+CACHE = Counter(
+    "cache_requests_total", "Cache lookups by outcome", ["cache", "result"])
+RATE_LIMITED = Counter(
+    "rate_limit_breaches_total", "Requests rejected by the rate limiter")
+QUERY_BUDGET_EXCEEDED = Counter(
+    "query_budget_exceeded_total", "Requests that ran more SQL than their route allows",
+    ["route"])
+STARTUP_SECONDS = Gauge(
+    "app_startup_seconds", "Import + create_app() time of this worker",
+    multiprocess_mode="liveall")
+RSS_BYTES = Gauge(
+    "app_rss_bytes", "Resident memory of this worker", multiprocess_mode="liveall")
+
+RSS_REFRESH_SECONDS = 30
+_rss_checked = 0.0
+
+
+# ---------- structured, sampled logging ---------------------------------
+def log_event(logger: logging.Logger, event_name: str, *, level=logging.INFO,
+              sample: float = 1.0, **fields) -> None:
+    """Log `event_name` as one JSON line, keeping only a `sample` fraction."""
+    if sample < 1.0 and random.random() >= sample:
+        return
+    if not logger.isEnabledFor(level):
+        return
+    logger.log(level, json.dumps({"event": event_name, **fields},
+                                 ensure_ascii=False, default=str))
+
+
+# ---------- per-request DB accounting -----------------------------------
+_current = threading.local()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_start"].pop()
+    DB_QUERIES.labels(statement.lstrip()[:6].upper() or "OTHER").inc()
+    stats = getattr(_current, "stats", None)
+    if stats is not None:
+        stats["queries"] += 1
+        stats["db_seconds"] += time.perf_counter() - started
+
+
+@event.listens_for(Engine, "handle_error")
+def _cursor_error(exception_context):
+    # a failed statement never reaches after_cursor_execute: drop its start
+    # time, or the next statement on this pooled connection is timed from it
+    conn = exception_context.connection
+    if (conn is not None and exception_context.execution_context is not None
+            and conn.info.get("query_start")):
+        conn.info["query_start"].pop()
+
+
+def begin_request() -> None:
+    _current.stats = {"start": time.perf_counter(), "queries": 0, "db_seconds": 0.0}
+
+
+def end_request(method: str, route: str, status: int):
+    """Record the finished request; returns its stats (or None)."""
+    stats = getattr(_current, "stats", None)
+    _current.stats = None
+    if stats is None:
+        return None
+    elapsed = time.perf_counter() - stats["start"]
+    REQUEST_SECONDS.labels(method, route, str(status)).observe(elapsed)
+    REQUEST_QUERIES.labels(route).observe(stats["queries"])
+    REQUEST_DB_SECONDS.labels(route).observe(stats["db_seconds"])
+
+    slow = elapsed * 1000 >= SLOW_REQUEST_MS
+    log_event(
+        log, "request",
+        level=logging.WARNING if slow or status >= 500 else logging.INFO,
+        sample=1.0 if slow or status >= 500 else LOG_SAMPLE_RATE,
+        method=method, route=route, status=status,
+        ms=round(elapsed * 1000, 1), queries=stats["queries"],
+        db_ms=round(stats["db_seconds"] * 1000, 1),
+    )
+    stats["seconds"] = elapsed
+    _refresh_rss()
+    return stats
+
+
+def current_stats():
+    """Query count / DB time of the request running on this thread."""
+    return getattr(_current, "stats", None)
+
+
+@contextmanager
+def count_queries():
+    """Count the SQL run on this thread inside the block (CLI runs, checks).
+
+    Yields the live stats dict; an enclosing request or block is restored
+    afterwards and does not see the inner statements.
+    """
+    outer = getattr(_current, "stats", None)
+    _current.stats = stats = {"start": time.perf_counter(), "queries": 0, "db_seconds": 0.0}
+    try:
+        yield stats
+    finally:
+        stats["seconds"] = time.perf_counter() - stats["start"]
+        _current.stats = outer
+
+
+# ---------- query budgets -------------------------------------------------
+class QueryBudgetExceeded(AssertionError):
+    """A route ran more SQL statements than its @query_budget (strict mode)."""
+
+
+def check_budget(route: str, queries: int, budget) -> bool:
+    """False (and a warning, or QueryBudgetExceeded under QUERY_BUDGET_STRICT)
+    when `queries` is over `budget`; None means no budget declared."""
+    if budget is None or queries <= budget:
+        return True
+    QUERY_BUDGET_EXCEEDED.labels(route).inc()
+    log_event(log, "query_budget_exceeded", level=logging.WARNING,
+              route=route, queries=queries, budget=budget)
+    if QUERY_BUDGET_STRICT:
+        raise QueryBudgetExceeded(f"{route}: {queries} queries, budget {budget}")
+    return False
+
+
+# ---------- process footprint -------------------------------------------
+def rss_bytes() -> int:
+    """Current resident set size (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _refresh_rss() -> None:
+    global _rss_checked
+    now = time.monotonic()
+    if now - _rss_checked >= RSS_REFRESH_SECONDS:
+        _rss_checked = now
+        RSS_BYTES.set(rss_bytes())
+
+
+def record_startup(seconds: float) -> None:
+    """Called once per process when the app is ready to serve."""
+    global _rss_checked
+    _rss_checked = time.monotonic()
+    rss = rss_bytes()
+    STARTUP_SECONDS.set(seconds)
+    RSS_BYTES.set(rss)
+    log.info("App ready in %.0f ms (pid %d, rss %.1f MB)",
+             seconds * 1000, os.getpid(), rss / 2 ** 20)
+
+
+# ---------- OpenAI & caches -----------------------------------------------
+@contextmanager
+def openai_call(model: str):
+    """Time one OpenAI request; the block sets `call["tokens"]` on success."""
+    call = {"tokens": 0}
+    started = time.perf_counter()
+    try:
+        yield call
+    except Exception:
+        OPENAI_SECONDS.labels(model, "error").observe(time.perf_counter() - started)
+        raise
+    OPENAI_SECONDS.labels(model, "ok").observe(time.perf_counter() - started)
+    OPENAI_TOKENS.labels(model).inc(call["tokens"])
+
+
+def cache_result(cache: str, hit: bool) -> None:
+    CACHE.labels(cache, "hit" if hit else "miss").inc()
+
+
+# ---------- exposition ----------------------------------------------------
+def render():
+    """(body, content_type) for /metrics, aggregated across processes."""
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    """gunicorn child_exit hook: drop a dead worker's startup/RSS gauges."""
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
@@ -1,77 +1,316 @@
 #!/usr/bin/env python3
 """
-Add new columns for nuanced analysis
+Versioned schema migrations (SQLite and PostgreSQL).
+
+Applied versions are recorded in `schema_migrations`; `upgrade()` runs the
+missing ones in order under a cross-process lock.  `flask init-db`, the
+Heroku release phase and INIT_DB_ON_STARTUP all end up here.  Steps are
+idempotent (IF NOT EXISTS / checkfirst), so databases created by earlier
+versions – which have no `schema_migrations` table yet – simply replay them.
+
+Add a schema change by appending a step to MIGRATIONS; never edit or reorder
+a step that has shipped.
+
+    python migrate.py            # apply pending migrations
+    python migrate.py --status   # applied / pending versions
+    python migrate.py --check    # EXPLAIN the hot queries, expect their indexes
 """
-import sqlite3
-import logging
+from __future__ import annotations
+import argparse, logging, sys
+from datetime import datetime
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import (
+    Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text,
+)
+
+from models import Base, FetchRun, Session, engine
+
+log = logging.getLogger("migrate")
+
+MIGRATE_LOCK = "schema-migrate"
+
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _meta,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable   # apply(engine)
+
+
+# ---------- steps ------------------------------------------------------
+def _create_tables(eng) -> None:
+    Base.metadata.create_all(eng)
+
+
+def _add_columns(eng) -> None:
+    from models import add_missing_columns
+    add_missing_columns()
+
+
+def _create_indexes(eng, names=None) -> None:
+    """Model indexes (create_all skips them on tables that already exist)."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if names is None or index.name in names:
+                index.create(eng, checkfirst=True)
+
+
+def _listing_indexes(eng) -> None:
+    _create_indexes(eng, {"ix_balanced_news_fetched_id",
+                          "ix_balanced_news_site_fetched_id",
+                          "ix_fetch_runs_started_at"})
+
+
+def _search_index(eng) -> None:
+    from search import ensure_search_index
+    ensure_search_index(eng)
+
+
+def _legacy_analyses(eng) -> None:
+    import aggregates, store
+    sess = Session(bind=eng)
+    try:
+        store.migrate_legacy_analyses(sess)
+        aggregates.rebuild(sess)      # seed site_analytics from what is there
+        sess.commit()
+    finally:
+        sess.close()
+
+
+def _analysed_partial_index(eng) -> None:
+    # WHERE analyzed_at IS NOT NULL on SQLite/PostgreSQL; a plain index elsewhere
+    _create_indexes(eng, {"ix_balanced_news_site_analyzed"})
+
+
+def _drop_stray_articles(eng) -> None:
+    """The old migrate.py created an unused `articles` table; drop it if empty."""
+    if not inspect(eng).has_table("articles"):
+        return
+    with eng.begin() as conn:
+        rows = conn.execute(text("SELECT count(*) FROM articles")).scalar()
+        if rows:
+            log.warning("Leaving table 'articles' in place: it has %d rows", rows)
+            return
+        conn.execute(text("DROP TABLE articles"))
+
+
+def _compressed_payloads(eng) -> None:
+    from models import CompressionDict, add_missing_columns
+    CompressionDict.__table__.create(eng, checkfirst=True)
+    add_missing_columns()         # article_analysis.payload_z
+
+
+def _daily_rollup(eng) -> None:
+    import aggregates
+    from models import SiteDailyStats
+    SiteDailyStats.__table__.create(eng, checkfirst=True)
+    sess = Session(bind=eng)
+    try:
+        aggregates.rebuild_daily(sess)
+        sess.commit()
+    finally:
+        sess.close()
+
+
+def _change_generations(eng) -> None:
+    from models import ChangeGeneration
+    ChangeGeneration.__table__.create(eng, checkfirst=True)
+
+
+def _claim_leases(eng) -> None:
+    from models import add_missing_columns
+    add_missing_columns()         # claim_owner, claim_expires_at
+    _create_indexes(eng, {"ix_balanced_news_backlog"})
+
+
+def _backlog_priority(eng) -> None:
+    from models import add_missing_columns
+    add_missing_columns()         # priority, demand
+    with eng.begin() as conn:
+        conn.execute(text("UPDATE balanced_news_articles SET priority = 0 WHERE priority IS NULL"))
+        conn.execute(text("UPDATE balanced_news_articles SET demand = 0 WHERE demand IS NULL"))
+    _create_indexes(eng, {"ix_balanced_news_backlog_priority"})
+    with eng.begin() as conn:     # superseded: claims go by priority now
+        conn.execute(text("DROP INDEX IF EXISTS ix_balanced_news_backlog"))
+
+
+def _content_fingerprints(eng) -> None:
+    import store
+    from models import add_missing_columns
+    add_missing_columns()         # content_hash, analysis_stale
+    with eng.begin() as conn:
+        conn.execute(text("UPDATE balanced_news_articles SET analysis_stale = :f "
+                          "WHERE analysis_stale IS NULL"), {"f": False})
+    _create_indexes(eng, {"ix_balanced_news_stale"})
+    sess = Session(bind=eng)
+    try:
+        store.backfill_content_hashes(sess)
+    finally:
+        sess.close()
+
+
+def _backlog_indexes(eng) -> None:
+    """
+    Settle the backlog indexes whichever of 11/12 a database ran, and with
+    which models.py: the per-site index gone, the priority one present.
+    """
+    with eng.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_balanced_news_backlog"))
+    _create_indexes(eng, {"ix_balanced_news_backlog_priority"})
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "create tables", _create_tables),
+    Migration(2, "add missing columns", _add_columns),
+    Migration(3, "listing indexes", _listing_indexes),
+    Migration(4, "full-text search index", _search_index),
+    Migration(5, "move inline analyses to article_analysis", _legacy_analyses),
+    Migration(6, "partial index on analysed articles", _analysed_partial_index),
+    Migration(7, "drop stray articles table", _drop_stray_articles),
+    Migration(8, "compressed analysis payloads", _compressed_payloads),
+    Migration(9, "daily per-site rollup", _daily_rollup),
+    Migration(10, "change generation counters", _change_generations),
+    Migration(11, "backlog claim leases", _claim_leases),
+    Migration(12, "backlog priority", _backlog_priority),
+    Migration(13, "content fingerprints", _content_fingerprints),
+    Migration(14, "backlog index cleanup", _backlog_indexes),
+]
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
 
-def migrate():
+# ---------- runner -----------------------------------------------------
+def applied_versions(eng=None) -> dict:
+    """{version: applied_at} of the migrations already run."""
+    eng = eng or engine
+    if not inspect(eng).has_table(schema_migrations.name):
+        return {}
+    with eng.connect() as conn:
+        return dict(conn.execute(
+            select(schema_migrations.c.version, schema_migrations.c.applied_at)).all())
+
+
+def upgrade(eng=None) -> List[int]:
+    """Apply pending migrations in order; returns the versions applied."""
+    from locks import named_lock
+    eng = eng or engine
+    schema_migrations.create(eng, checkfirst=True)
+    done = []
+    lock_sess = Session(bind=eng)
+    try:
+        # held until the session ends, so concurrent releases/workers queue up
+        with named_lock(lock_sess, MIGRATE_LOCK):
+            applied = applied_versions(eng)
+            for m in MIGRATIONS:
+                if m.version in applied:
+                    continue
+                log.info("Applying migration %d: %s", m.version, m.name)
+                m.apply(eng)
+                with eng.begin() as conn:
+                    conn.execute(schema_migrations.insert().values(
+                        version=m.version, name=m.name, applied_at=datetime.utcnow()))
+                done.append(m.version)
+            lock_sess.commit()
+    finally:
+        lock_sess.close()
+    return done
+
+
+# ---------- index check ------------------------------------------------
+def hot_queries():
+    """(label, statement, expected index) for the queries behind the main routes."""
+    from aggregates import totals_select
+    from backlog import next_candidates
+    from pagination import listing_query
+
+    sess = Session()
     try:
-        # Connect to the database
-        conn = sqlite3.connect('balanced_news.db')
-        cursor = conn.cursor()
-        
-        # Create articles table if it doesn't exist
-        logger.info("Creating articles table if it doesn't exist...")
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS articles (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            site TEXT NOT NULL,
-            title TEXT NOT NULL,
-            summary TEXT,
-            url TEXT UNIQUE NOT NULL,
-            fetched_at DATETIME NOT NULL,
-            balanced_title TEXT,
-            balanced_summary TEXT,
-            bias_score FLOAT,
-            bias_label TEXT,
-            bias_explanation TEXT,
-            openai_tokens INTEGER DEFAULT 0,
-            nuanced_perspective TEXT,
-            verified_claims INTEGER DEFAULT 0,
-            corrected_claims INTEGER DEFAULT 0,
-            analysis_sources TEXT,
-            analyzed_at DATETIME,
-            last_updated_at DATETIME,
-            elon_musk_perspective TEXT
-        )
-        """)
-        
-        # Add indices for common queries
-        logger.info("Creating indices...")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_articles_site ON articles(site)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_articles_url ON articles(url)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_articles_fetched_at ON articles(fetched_at)")
-        
-        # Add elon_musk_perspective column if it doesn't exist
-        logger.info("Adding elon_musk_perspective column if it doesn't exist...")
-        try:
-            cursor.execute("ALTER TABLE articles ADD COLUMN elon_musk_perspective TEXT")
-            logger.info("Added elon_musk_perspective column")
-        except sqlite3.OperationalError as e:
-            if "duplicate column name" in str(e):
-                logger.info("elon_musk_perspective column already exists")
-            else:
-                raise
-        
-        # Commit changes
-        conn.commit()
-        logger.info("Migration completed successfully!")
-        
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e):
-            logger.info("Columns already exist, skipping...")
-        else:
-            logger.error(f"Error during migration: {e}")
-            raise
-    except Exception as e:
-        logger.error(f"Unexpected error during migration: {e}")
-        raise
+        newest = (datetime(2024, 1, 1), 1)
+        return [
+            ("front page", listing_query(sess).limit(31).statement,
+             "ix_balanced_news_fetched_id"),
+            ("front page, next page", listing_query(sess, after=newest).limit(31).statement,
+             "ix_balanced_news_fetched_id"),
+            ("site page", listing_query(sess, site="svt").limit(31).statement,
+             "ix_balanced_news_site_fetched_id"),
+            ("site page, next page",
+             listing_query(sess, site="svt", after=newest).limit(31).statement,
+             "ix_balanced_news_site_fetched_id"),
+            ("analytics totals", totals_select(), "ix_balanced_news_site_analyzed"),
+            ("fetch cooldown", select(func.max(FetchRun.started_at)),
+             "ix_fetch_runs_started_at"),
+            ("analysis backlog", next_candidates(datetime(2024, 1, 1), 1),
+             "ix_balanced_news_backlog_priority"),
+            ("stale analyses", next_candidates(datetime(2024, 1, 1), 1, stale=True),
+             "ix_balanced_news_stale"),
+        ]
     finally:
-        conn.close()
+        sess.close()
+
+
+def explain(conn, stmt) -> str:
+    """The backend's query plan for `stmt` as text."""
+    compiled = stmt.compile(dialect=conn.dialect)
+    sql = str(compiled)
+    if conn.dialect.name == "sqlite":
+        params = tuple(compiled.params[k] for k in compiled.positiontup or ())
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, params).all()
+        return "\n".join(row[-1] for row in rows)
+    if conn.dialect.name == "postgresql":
+        # small dev tables are cheaper to scan; ask whether an index *can* serve
+        conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        rows = conn.exec_driver_sql("EXPLAIN " + sql, compiled.params).all()
+        return "\n".join(row[0] for row in rows)
+    raise RuntimeError(f"--check does not support {conn.dialect.name}")
+
+
+def check(eng=None) -> bool:
+    """Print each hot query's plan; False if one doesn't use its index."""
+    eng = eng or engine
+    ok = True
+    with eng.connect() as conn:
+        for label, stmt, index in hot_queries():
+            trans = conn.begin()
+            try:
+                plan = explain(conn, stmt)
+            finally:
+                trans.rollback()
+            uses = index in plan
+            ok &= uses
+            print(f"{'ok  ' if uses else 'MISS'} {label:<24} expects {index}")
+            if not uses:
+                print("     " + plan.replace("\n", "\n     "))
+    return ok
+
+
+def main() -> int:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    p = argparse.ArgumentParser(description="Apply or inspect schema migrations.")
+    p.add_argument("--status", action="store_true", help="list applied and pending versions")
+    p.add_argument("--check", action="store_true",
+                   help="EXPLAIN the main routes' queries and verify their indexes")
+    args = p.parse_args()
+
+    if args.status:
+        applied = applied_versions()
+        for m in MIGRATIONS:
+            when = applied.get(m.version)
+            state = f"applied {when:%Y-%m-%d %H:%M}" if when else "pending"
+            print(f"{m.version:>3}  {m.name:<44} {state}")
+        return 0
+    if args.check:
+        return 0 if check() else 1
+
+    applied = upgrade()
+    print(f"Applied {len(applied)} migration(s)" if applied else "Schema is up to date")
+    return 0
+
 
 if __name__ == "__main__":
-    migrate() 
\ No newline at end of file
+    sys.exit(main())
@@ -1,18 +1,96 @@
 """
-DB schema (SQLite/PostgreSQL) + session factory
+DB schema (SQLite/PostgreSQL) + session factories
+
+Two engines: `engine` for everything that writes (ingest, analyses, jobs,
+runs, admin) and `read_engine` for page views.  The reader has its own
+connection pool, so page views never queue behind ingest for a connection,
+and points at DATABASE_READ_URL (a replica) when that is set.  Reader
+connections are read-only at the database level.
 """
 from datetime import datetime
 import os
+import time
 from sqlalchemy import (
-    Column, Integer, String, Text, Float, DateTime,
-    create_engine, UniqueConstraint
+    JSON, Boolean, Column, Integer, String, Text, Float, Date, DateTime, ForeignKey,
+    Index, LargeBinary, create_engine, event, inspect, text, UniqueConstraint
+)
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import declarative_base, scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
+import metrics
+from compression import CompressedJSON, write_codec
+from config import (
+    DATABASE_URL, DATABASE_READ_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE, DB_POOL_PRE_PING, SQLITE_BUSY_TIMEOUT_MS,
 )
-from sqlalchemy.orm import declarative_base, sessionmaker
-from config import DATABASE_URL
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports how long checkouts wait for a free connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.DB_POOL_WAIT.labels(self.logging_name or "writer").observe(
+                time.perf_counter() - started)
+
+
+def make_engine(url: str, *, readonly: bool = False):
+    """Engine with pooling tuned for the backend (see config.DB_POOL_*)."""
+    name = "reader" if readonly else "writer"
+    if url.startswith("sqlite"):
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            return create_engine(url, echo=False, future=True)
+        eng = create_engine(
+            url, echo=False, future=True, poolclass=TimedQueuePool,
+            pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT, pool_logging_name=name,
+            connect_args={"check_same_thread": False,
+                          "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+        )
+
+        @event.listens_for(eng, "connect")
+        def _sqlite_pragmas(dbapi_conn, record):
+            # WAL: readers see the last commit instead of waiting for the
+            # fetch/analysis writer; NORMAL sync is safe under WAL
+            cur = dbapi_conn.cursor()
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute("PRAGMA synchronous=NORMAL")
+            cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            cur.execute("PRAGMA temp_store=MEMORY")
+            cur.execute("PRAGMA cache_size=-16000")    # 16 MB page cache
+            if readonly:
+                cur.execute("PRAGMA query_only=ON")
+            cur.close()
+        return eng
+
+    connect_args = {}
+    if readonly and url.startswith("postgresql"):
+        connect_args["options"] = "-c default_transaction_read_only=on"
+    return create_engine(
+        url, echo=False, future=True, poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING, pool_logging_name=name,
+        connect_args=connect_args,
+    )
+
 
 Base = declarative_base()
-engine = create_engine(DATABASE_URL, echo=False, future=True)
+engine = make_engine(DATABASE_URL)
+if DATABASE_URL in ("sqlite://", "sqlite:///:memory:"):
+    read_engine = engine          # a second in-memory engine would be a different DB
+else:
+    read_engine = make_engine(DATABASE_READ_URL or DATABASE_URL, readonly=True)
 Session = sessionmaker(bind=engine)
+ReadSession = sessionmaker(bind=read_engine)
+# Request-scoped sessions for the web app: one per thread/greenlet, removed
+# by the app's teardown_appcontext.  Scripts and background threads keep
+# using Session() directly.
+db_session = scoped_session(Session)
+read_session = scoped_session(ReadSession)
 
 
 class Article(Base):
@@ -25,25 +103,212 @@ class Article(Base):
     url         = Column(String, nullable=False)
     fetched_at  = Column(DateTime, default=datetime.utcnow)
 
-    balanced_title     = Column(String)
-    balanced_summary   = Column(Text)
-    bias_score         = Column(Float)         # -1 = left … +1 = right
-    bias_label         = Column(String)
-    bias_explanation   = Column(Text)          # short "why" sentence
-    
-    nuanced_perspective = Column(Text)         # Structured analysis in Swedish
+    # Summary of the current analysis; the analysis itself (and its history)
+    # lives in article_analysis so listing queries stay narrow
+    analysis_id         = Column(Integer)      # current ArticleAnalysis.id
     verified_claims     = Column(Integer, default=0)      # Count of verified claims
     corrected_claims    = Column(Integer, default=0)      # Count of corrected claims
-    analysis_sources    = Column(Text)         # JSON array of sources
     analyzed_at         = Column(DateTime)     # When the analysis was performed
     last_updated_at     = Column(DateTime)     # When the analysis was last updated
-    elon_musk_perspective = Column(Text)       # Elon Musk's perspective on the news
-    
-    openai_tokens      = Column(Integer, default=0)       # cost accounting
 
-    __table_args__ = (UniqueConstraint("site", "url", name="uix_balanced_news_site_url"),)
+    # Backlog lease (backlog.py): the worker analysing this article, until when
+    claim_owner         = Column(String)
+    claim_expires_at    = Column(DateTime)
+    # Backlog order (scheduler.py): higher is analysed first; demand counts
+    # /api/analyse requests made before the article had an analysis
+    priority            = Column(Float, default=0.0)
+    demand              = Column(Integer, default=0)
+    # Fingerprint of title + summary (store.content_hash); ingest marks the
+    # analysis stale when a feed edits an analysed headline
+    content_hash        = Column(String(16))
+    analysis_stale      = Column(Boolean, default=False)
+
+    # numeric quality scores pulled out of the analysis JSON (0–100)
+    objectivity_score  = Column(Float)
+    depth_score        = Column(Float)
+    evidence_score     = Column(Float)
+    clarity_score      = Column(Float)
+
+    __table_args__ = (
+        UniqueConstraint("site", "url", name="uix_balanced_news_site_url"),
+        # keyset pagination: front page / per-site listings
+        Index("ix_balanced_news_fetched_id", "fetched_at", "id"),
+        Index("ix_balanced_news_site_fetched_id", "site", "fetched_at", "id"),
+        # analytics: only analysed rows (partial index on SQLite ≥ 3.8 / PostgreSQL)
+        Index("ix_balanced_news_site_analyzed", "site", "analyzed_at",
+              sqlite_where=text("analyzed_at IS NOT NULL"),
+              postgresql_where=text("analyzed_at IS NOT NULL")),
+        # analysis backlog in queue order: only un-analysed rows, and covering
+        # the claim query (backlog.next_candidates)
+        Index("ix_balanced_news_backlog_priority", "priority", "fetched_at", "claim_expires_at",
+              sqlite_where=text("analyzed_at IS NULL"),
+              postgresql_where=text("analyzed_at IS NULL")),
+        # re-analysis pass: only analyses whose article changed since
+        Index("ix_balanced_news_stale", "fetched_at", "claim_expires_at",
+              sqlite_where=text("analysis_stale = 1"),
+              postgresql_where=text("analysis_stale")),
+    )
+
+
+class ArticleAnalysis(Base):
+    """
+    One OpenAI analysis of an article.  Re-analyses add rows; the article's
+    `analysis_id` points at the current one.
+    """
+    __tablename__ = "article_analysis"
+
+    id             = Column(Integer, primary_key=True)
+    article_id     = Column(Integer, ForeignKey("balanced_news_articles.id", ondelete="CASCADE"),
+                            nullable=False)
+    created_at     = Column(DateTime, nullable=False, default=datetime.utcnow)
+    model          = Column(String)            # e.g. gpt-4.1-mini
+    prompt_version = Column(String)            # analysis.PROMPT_VERSION at the time
+    content_type   = Column(String)            # classify_content() result
+    tokens         = Column(Integer, default=0)
+    # the analysis JSON: plain, or compressed in payload_z (ANALYSIS_COMPRESSION);
+    # use the `payload` property, which reads and writes whichever applies
+    payload_json   = Column("payload", JSON().with_variant(JSONB(), "postgresql"),
+                            nullable=False)
+    payload_z      = Column(CompressedJSON)
+
+    verified_claims   = Column(Integer, default=0)
+    corrected_claims  = Column(Integer, default=0)
+    objectivity_score = Column(Float)
+    depth_score       = Column(Float)
+    evidence_score    = Column(Float)
+    clarity_score     = Column(Float)
+
+    __table_args__ = (
+        Index("ix_article_analysis_article_created", "article_id", "created_at"),
+    )
+
+    @property
+    def payload(self):
+        return self.payload_z if self.payload_z is not None else self.payload_json
+
+    @payload.setter
+    def payload(self, value):
+        if write_codec():
+            self.payload_z, self.payload_json = value, JSON.NULL
+        else:
+            self.payload_z, self.payload_json = None, value
+
+
+class CompressionDict(Base):
+    """Shared dictionary for compressed payloads (see compression.py)."""
+    __tablename__ = "compression_dicts"
+
+    id         = Column(Integer, primary_key=True)
+    codec      = Column(String, nullable=False)      # zlib / zstd
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    samples    = Column(Integer)                     # payloads it was trained on
+    data       = Column(LargeBinary, nullable=False)
+
+
+class SiteStats(Base):
+    """Running per-site totals behind /analytics (see aggregates.py)."""
+    __tablename__ = "site_analytics"
+
+    site            = Column(String, primary_key=True)
+    analysed        = Column(Integer, nullable=False, default=0)
+    verified        = Column(Integer, nullable=False, default=0)
+    corrected       = Column(Integer, nullable=False, default=0)
+    objectivity_sum = Column(Float,   nullable=False, default=0.0)
+    objectivity_n   = Column(Integer, nullable=False, default=0)
+    depth_sum       = Column(Float,   nullable=False, default=0.0)
+    depth_n         = Column(Integer, nullable=False, default=0)
+    evidence_sum    = Column(Float,   nullable=False, default=0.0)
+    evidence_n      = Column(Integer, nullable=False, default=0)
+    clarity_sum     = Column(Float,   nullable=False, default=0.0)
+    clarity_n       = Column(Integer, nullable=False, default=0)
+
+
+class SiteDailyStats(Base):
+    """
+    Analyses landed per site and day, for trends (see aggregates.py).  Unlike
+    site_analytics it is never decremented, so it outlives pruned articles.
+    """
+    __tablename__ = "site_daily_stats"
+
+    day                = Column(Date,    primary_key=True)
+    site               = Column(String,  primary_key=True)
+    analysed           = Column(Integer, nullable=False, default=0)
+    verified           = Column(Integer, nullable=False, default=0)
+    corrected          = Column(Integer, nullable=False, default=0)
+    tokens             = Column(Integer, nullable=False, default=0)
+    objectivity_n      = Column(Integer, nullable=False, default=0)
+    objectivity_sum    = Column(Float,   nullable=False, default=0.0)
+    objectivity_sum_sq = Column(Float,   nullable=False, default=0.0)
+    depth_n            = Column(Integer, nullable=False, default=0)
+    depth_sum          = Column(Float,   nullable=False, default=0.0)
+    depth_sum_sq       = Column(Float,   nullable=False, default=0.0)
+    evidence_n         = Column(Integer, nullable=False, default=0)
+    evidence_sum       = Column(Float,   nullable=False, default=0.0)
+    evidence_sum_sq    = Column(Float,   nullable=False, default=0.0)
+    clarity_n          = Column(Integer, nullable=False, default=0)
+    clarity_sum        = Column(Float,   nullable=False, default=0.0)
+    clarity_sum_sq     = Column(Float,   nullable=False, default=0.0)
+
+
+class ChangeGeneration(Base):
+    """
+    Counters bumped in the same transaction as a change, so per-process
+    caches (score_store.py) know when to reload.
+    """
+    __tablename__ = "change_generations"
+
+    name  = Column(String,  primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
+class FetchRun(Base):
+    """One news fetch (web button or cron), used for rate limits and ops history."""
+    __tablename__ = "fetch_runs"
+
+    id          = Column(Integer, primary_key=True)
+    started_at  = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    finished_at = Column(DateTime)
+    status      = Column(String, nullable=False, default="running")  # running / ok / error
+    trigger     = Column(String)          # web / cli
+    site_counts = Column(Text)            # JSON {site: {"fetched": n, "added": n}}
+    added       = Column(Integer, default=0)
+    error       = Column(Text)
+
+
+class AnalysisJob(Base):
+    """Queued /api/analyse request, processed by worker.py (see jobs.py)."""
+    __tablename__ = "analysis_jobs"
+
+    id          = Column(Integer, primary_key=True)
+    article_id  = Column(Integer, nullable=False, index=True)
+    status      = Column(String, nullable=False, default="queued")  # queued / running / done / failed
+    created_at  = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at  = Column(DateTime)
+    finished_at = Column(DateTime)
+    attempts    = Column(Integer, nullable=False, default=0)
+    worker      = Column(String)
+    error       = Column(Text)
+
+    __table_args__ = (Index("ix_analysis_jobs_status_created", "status", "created_at"),)
+
+
+def add_missing_columns() -> None:
+    """ALTER TABLE … ADD COLUMN for model columns missing from existing tables."""
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name not in existing:
+                    ddl_type = col.type.compile(dialect=engine.dialect)
+                    conn.execute(text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {col.name} {ddl_type}"
+                    ))
 
 
 def init_db() -> None:
-    """Create tables if they don't exist."""
-    Base.metadata.create_all(engine)
+    """Bring the schema up to date (see migrate.py)."""
+    from migrate import upgrade   # migrate imports the models
+    upgrade()
@@ -0,0 +1,105 @@
+"""
+Keyset (cursor) pagination for article listings.
+
+Listings are ordered by (fetched_at DESC, id DESC) and search results by
+(rank, id); the cursor is the sort key of the last item on the page, so
+page N costs one index range scan no matter how deep N is.
+"""
+from __future__ import annotations
+import base64, binascii, json
+from collections import namedtuple
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import tuple_
+
+from models import Article
+from search import search_articles
+
+PAGE_SIZE = 30
+MAX_PAGE_SIZE = 100
+
+Page = namedtuple("Page", "items next_cursor")
+
+
+class BadCursor(ValueError):
+    pass
+
+
+# ---------- cursor encoding -------------------------------------------
+def encode_cursor(*values) -> str:
+    raw = json.dumps(
+        [v.isoformat() if isinstance(v, datetime) else v for v in values],
+        separators=(",", ":"),
+    ).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError, UnicodeDecodeError) as e:
+        raise BadCursor(str(e)) from e
+    if not isinstance(values, list) or len(values) != 2:
+        raise BadCursor("malformed cursor")
+    return values
+
+
+def clamp_limit(limit: Optional[int]) -> int:
+    if not limit:
+        return PAGE_SIZE
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+# ---------- pages ------------------------------------------------------
+def listing_query(sess, *, site: Optional[str] = None, after=None):
+    """Newest-first listing query, after the (fetched_at, id) key `after`."""
+    q = sess.query(Article)
+    if site:
+        q = q.filter(Article.site == site)
+    if after:
+        q = q.filter(tuple_(Article.fetched_at, Article.id) < tuple_(*after))
+    return q.order_by(Article.fetched_at.desc(), Article.id.desc())
+
+
+def recent_page(sess, *, site: Optional[str] = None,
+                cursor: Optional[str] = None, limit: int = PAGE_SIZE) -> Page:
+    """Newest articles first, optionally for one site."""
+    after = None
+    if cursor:
+        ts, last_id = decode_cursor(cursor)
+        try:
+            ts = datetime.fromisoformat(ts)
+        except (TypeError, ValueError) as e:
+            raise BadCursor(str(e)) from e
+        if not isinstance(last_id, int):
+            raise BadCursor("malformed cursor")
+        after = (ts, last_id)
+
+    rows = listing_query(sess, site=site, after=after).limit(limit + 1).all()
+    items = rows[:limit]
+    next_cursor = (
+        encode_cursor(items[-1].fetched_at, items[-1].id)
+        if len(rows) > limit else None
+    )
+    return Page(items, next_cursor)
+
+
+def search_page(sess, query: str, *, site: Optional[str] = None,
+                cursor: Optional[str] = None, limit: int = PAGE_SIZE) -> Page:
+    """Best-ranked search hits first; the cursor carries (rank, id)."""
+    after = None
+    if cursor:
+        rank, last_id = decode_cursor(cursor)
+        if not isinstance(rank, (int, float)) or not isinstance(last_id, int):
+            raise BadCursor("malformed search cursor")
+        after = (rank, last_id)
+
+    rows = search_articles(sess, query, site=site, limit=limit + 1, after=after)
+    items = rows[:limit]
+    next_cursor = (
+        encode_cursor(items[-1].search_rank, items[-1].id)
+        if len(rows) > limit else None
+    )
+    return Page(items, next_cursor)
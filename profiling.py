@@ -0,0 +1,205 @@
+"""
+On-demand profiling of slow requests and fetch runs.
+
+  • PROFILE_MODE=sample    a background thread samples the stacks of the
+                           profiled threads every PROFILE_INTERVAL_MS and
+                           writes collapsed stacks (`*.collapsed`, one
+                           "frame;frame;frame count" line per stack) – feed
+                           them to flamegraph.pl or speedscope
+  • PROFILE_MODE=cprofile  cProfile on the profiled thread, `*.prof` files
+                           for `python -m pstats` / snakeviz
+
+Every request is profiled while a mode is set, but only those slower than
+PROFILE_SLOW_MS are written (fetch runs: PROFILE_FETCH_MS).  With the mode
+unset a request sending `X-Profile: <ADMIN_PASSWORD>` is still sampled and
+always written; the file name comes back in `X-Profile-File`.  Files go to
+PROFILE_DIR, of which the newest PROFILE_KEEP are kept.  Off, the cost is
+one flag check per request.
+
+    python profiling.py                # list profiles, newest first
+    python profiling.py --top 25 FILE  # hottest frames of one profile
+"""
+from __future__ import annotations
+import argparse, collections, cProfile, glob, logging, os, re, sys, threading, time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional
+
+from config import (
+    PROFILE_DIR, PROFILE_FETCH_MS, PROFILE_INTERVAL_MS, PROFILE_KEEP, PROFILE_MODE,
+)
+
+log = logging.getLogger("profiling")
+
+MODES = ("sample", "cprofile")
+ENABLED = PROFILE_MODE in MODES
+if PROFILE_MODE and not ENABLED:
+    log.warning("Unknown PROFILE_MODE %r – profiling stays off", PROFILE_MODE)
+
+_write_lock = threading.Lock()
+
+
+# ---------- stack sampler -------------------------------------------------
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__") or os.path.basename(code.co_filename)
+    return f"{module}:{code.co_name}".replace(";", ",").replace(" ", "_")
+
+
+class Sampler:
+    """One thread per process sampling whichever threads are registered."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stacks: Dict[int, collections.Counter] = {}
+        self._guard = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, thread_id: int) -> None:
+        with self._guard:
+            self._stacks[thread_id] = collections.Counter()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True,
+                                                name="profile-sampler")
+                self._thread.start()
+
+    def unregister(self, thread_id: int) -> collections.Counter:
+        with self._guard:
+            return self._stacks.pop(thread_id, collections.Counter())
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._guard:
+                if not self._stacks:
+                    self._thread = None        # restarted by the next register()
+                    return
+                frames = sys._current_frames()
+                for thread_id, counts in self._stacks.items():
+                    frame = frames.get(thread_id)
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_label(frame))
+                        frame = frame.f_back
+                    if stack:
+                        counts[";".join(reversed(stack))] += 1
+
+
+_sampler = Sampler(PROFILE_INTERVAL_MS / 1000)
+
+
+# ---------- one profiled unit of work -------------------------------------
+class Profile:
+    """Profile of the calling thread from start() until stop()."""
+
+    def __init__(self, label: str, mode: str):
+        self.label, self.mode = label, mode
+        self.thread_id = threading.get_ident()
+        self.started = time.perf_counter()
+        self._profiler = None
+        if mode == "cprofile":
+            self._profiler = cProfile.Profile()
+            try:
+                self._profiler.enable()
+            except ValueError:          # another profiler is active (3.12+)
+                self._profiler = None
+        else:
+            _sampler.register(self.thread_id)
+
+    def stop(self, *, min_ms: float = 0, directory: str = PROFILE_DIR) -> Optional[str]:
+        """Finish; write the profile if it ran for at least `min_ms` and
+        return the file path (None when discarded)."""
+        elapsed_ms = (time.perf_counter() - self.started) * 1000
+        if self.mode == "cprofile":
+            if self._profiler is None:
+                return None
+            self._profiler.disable()
+        else:
+            stacks = _sampler.unregister(self.thread_id)
+        if elapsed_ms < min_ms:
+            return None
+
+        os.makedirs(directory, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", self.label).strip("_") or "root"
+        name = (f"{datetime.utcnow():%Y%m%dT%H%M%S.%f}-{os.getpid()}-{slug}-{elapsed_ms:.0f}ms"
+                + (".prof" if self.mode == "cprofile" else ".collapsed"))
+        path = os.path.join(directory, name)
+        if self.mode == "cprofile":
+            self._profiler.dump_stats(path)
+        else:
+            with open(path, "w") as fh:
+                fh.writelines(f"{stack} {n}\n" for stack, n in stacks.most_common())
+        rotate(directory)
+        log.info("Profile of %s (%.0f ms) written to %s", self.label, elapsed_ms, path)
+        return path
+
+
+def start(label: str, *, force: bool = False) -> Optional[Profile]:
+    """Profile the current thread if profiling is on (or `force`d); else None."""
+    if ENABLED:
+        return Profile(label, PROFILE_MODE)
+    if force:
+        return Profile(label, "sample")
+    return None
+
+
+@contextmanager
+def profiled(label: str, *, min_ms: float = PROFILE_FETCH_MS):
+    """Profile the block (fetch runs); a no-op with profiling off."""
+    profile = start(label)
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.stop(min_ms=min_ms)
+
+
+def rotate(directory: str, keep: int = PROFILE_KEEP) -> None:
+    """Delete all but the newest `keep` profiles in `directory`."""
+    with _write_lock:
+        files = sorted(listing(directory), key=os.path.getmtime, reverse=True)
+        for path in files[keep:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def listing(directory: str = PROFILE_DIR) -> list:
+    return (glob.glob(os.path.join(directory, "*.collapsed"))
+            + glob.glob(os.path.join(directory, "*.prof")))
+
+
+# ---------- CLI -------------------------------------------------------------
+def top_frames(path: str, n: int) -> None:
+    """Print the frames with the most samples of their own (self time)."""
+    if path.endswith(".prof"):
+        import pstats
+        pstats.Stats(path).sort_stats("cumulative").print_stats(n)
+        return
+    own, total, samples = collections.Counter(), collections.Counter(), 0
+    with open(path) as fh:
+        for line in fh:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            frames, count = stack.split(";"), int(count)
+            samples += count
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+    print(f"{samples} samples\n{'self':>6} {'total':>6}  frame")
+    for frame, count in own.most_common(n):
+        print(f"{count * 100 / samples:5.1f}% {total[frame] * 100 / samples:5.1f}%  {frame}")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Inspect profiles written by profiling.py.")
+    p.add_argument("file", nargs="?", help="profile to summarise")
+    p.add_argument("--top", type=int, default=20)
+    p.add_argument("--dir", default=PROFILE_DIR)
+    args = p.parse_args()
+    if args.file:
+        top_frames(args.file, args.top)
+    else:
+        for path in sorted(listing(args.dir), key=os.path.getmtime, reverse=True):
+            print(f"{datetime.fromtimestamp(os.path.getmtime(path)):%Y-%m-%d %H:%M:%S}  "
+                  f"{os.path.getsize(path):>9,}  {os.path.basename(path)}")
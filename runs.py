@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Ledger of news fetch runs (`fetch_runs`).
+
+Every fetch – the web button or the cron job – records when it started and
+finished, what each site returned and how it ended.  The cooldown and
+daily-limit checks are single indexed lookups on `started_at`.
+
+Runs are single-flight: `claim_run` checks for an in-flight run and inserts
+a new one under a cross-process lock, so concurrent triggers from different
+gunicorn workers (or cron) coalesce onto the same run.  Web triggers execute
+the run on a background thread and return immediately.
+
+    python runs.py            # print the most recent runs
+"""
+from __future__ import annotations
+import argparse, json, logging, threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+
+from models import Session, FetchRun
+from locks import named_lock
+import metrics
+import profiling
+from config import (
+    FETCH_COOLDOWN_MINUTES, MAX_FETCHES_PER_DAY, FETCH_RUN_TIMEOUT_SECONDS,
+    NEWS_PER_SITE, NEWS_SUMMARY_LEN,
+)
+
+log = logging.getLogger("runs")
+
+FETCH_LOCK = "fetch-news"
+
+
+def start_run(sess, trigger: str) -> FetchRun:
+    run = FetchRun(started_at=datetime.utcnow(), status="running", trigger=trigger)
+    sess.add(run)
+    sess.commit()
+    return run
+
+
+def finish_run(sess, run: FetchRun, site_counts: Dict[str, dict],
+               error: Optional[str] = None) -> FetchRun:
+    run.finished_at = datetime.utcnow()
+    run.status = "error" if error else "ok"
+    run.site_counts = json.dumps(site_counts, ensure_ascii=False)
+    run.added = sum(c.get("added", 0) for c in site_counts.values())
+    run.error = error
+    sess.commit()
+    return run
+
+
+def check_fetch_limits(sess) -> Tuple[bool, str]:
+    """Check if we can fetch news based on rate limits.
+    Returns (can_fetch, message)"""
+    now = datetime.utcnow()
+    last_start = sess.query(func.max(FetchRun.started_at)).scalar()
+    if last_start is None:
+        return True, "OK"
+
+    # Check cooldown period
+    cooldown = timedelta(minutes=FETCH_COOLDOWN_MINUTES)
+    if now - last_start < cooldown:
+        remaining = cooldown - (now - last_start)
+        return False, f"Vänta {int(remaining.total_seconds() / 60)} minuter innan nästa uppdatering"
+
+    # Check daily limit
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    today_fetches = (
+        sess.query(func.count(FetchRun.id))
+        .filter(FetchRun.started_at >= today_start)
+        .scalar()
+    )
+    if today_fetches >= MAX_FETCHES_PER_DAY:
+        return False, f"Maximalt antal uppdateringar ({MAX_FETCHES_PER_DAY}) för idag har nåtts"
+
+    return True, "OK"
+
+
+def claim_run(sess, trigger: str, *, enforce_limits: bool = True
+              ) -> Tuple[Optional[FetchRun], bool, str]:
+    """
+    Start a run unless one is already in flight.
+
+    Returns (run, started, message): `started` is False when the caller
+    joined an in-flight run, or when `run` is None because limits apply.
+    """
+    with named_lock(sess, FETCH_LOCK):
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=FETCH_RUN_TIMEOUT_SECONDS)
+        # runs whose process died never finish; stop them blocking new ones
+        sess.query(FetchRun).filter(
+            FetchRun.status == "running", FetchRun.started_at < stale
+        ).update({"status": "error", "finished_at": now, "error": "abandoned"},
+                 synchronize_session=False)
+
+        active = (
+            sess.query(FetchRun)
+            .filter(FetchRun.status == "running")
+            .order_by(FetchRun.started_at.desc())
+            .first()
+        )
+        if active:
+            sess.commit()
+            return active, False, "Uppdatering pågår redan"
+
+        if enforce_limits:
+            can_fetch, message = check_fetch_limits(sess)
+            if not can_fetch:
+                sess.commit()
+                return None, False, message
+
+        run = start_run(sess, trigger)   # commits → releases a pg advisory lock
+        return run, True, "OK"
+
+
+def execute_run(run_id: int) -> None:
+    """Collect headlines and store new ones for an already-claimed run."""
+    from fetch_news import collect_news, ingest_news   # scraping stack
+
+    sess = Session()
+    try:
+        run = sess.get(FetchRun, run_id)
+        try:
+            with profiling.profiled(f"fetch_run_{run_id}"):
+                news = collect_news(NEWS_PER_SITE, NEWS_SUMMARY_LEN)
+                with metrics.count_queries() as db_stats:
+                    site_counts = ingest_news(sess, news)
+        except Exception as e:
+            log.exception("Fetch run %d failed", run_id)
+            sess.rollback()
+            finish_run(sess, run, {}, error=str(e))
+            return
+        finish_run(sess, run, site_counts)
+        log.info("Fetch run %d stored %d headlines, %d edited (%d queries, %.0f ms in DB)",
+                 run_id, sum(c["added"] for c in site_counts.values()),
+                 sum(c["updated"] for c in site_counts.values()),
+                 db_stats["queries"], db_stats["db_seconds"] * 1000)
+    finally:
+        sess.close()
+
+
+def start_background(run_id: int) -> threading.Thread:
+    t = threading.Thread(target=execute_run, args=(run_id,), daemon=True,
+                         name=f"fetch-run-{run_id}")
+    t.start()
+    return t
+
+
+def run_to_dict(run: FetchRun) -> dict:
+    return {
+        "id": run.id,
+        "started_at": run.started_at.isoformat() if run.started_at else None,
+        "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+        "status": run.status,
+        "trigger": run.trigger,
+        "added": run.added or 0,
+        "site_counts": json.loads(run.site_counts) if run.site_counts else {},
+        "error": run.error,
+    }
+
+
+def recent_runs(sess, limit: int = 20) -> List[dict]:
+    rows = (
+        sess.query(FetchRun)
+        .order_by(FetchRun.started_at.desc())
+        .limit(limit)
+        .all()
+    )
+    return [run_to_dict(r) for r in rows]
+
+
+# -----------------------------------------------------------------------------
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Show recent news fetch runs.")
+    p.add_argument("-n", "--limit", type=int, default=20)
+    args = p.parse_args()
+    sess = Session()
+    try:
+        for r in recent_runs(sess, args.limit):
+            took = ""
+            if r["finished_at"]:
+                secs = (datetime.fromisoformat(r["finished_at"])
+                        - datetime.fromisoformat(r["started_at"])).total_seconds()
+                took = f"{secs:6.1f}s"
+            print(f"#{r['id']:<5} {r['started_at'][:19]}  {r['status']:<7} {r['trigger'] or '':<4} "
+                  f"{took:>7}  +{r['added']:<3} {r['error'] or ''}")
+    finally:
+        sess.close()
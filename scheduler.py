@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Priority of the analysis backlog.
+
+Each un-analysed article gets a score in 0–1, a weighted sum of
+
+  • recency   – halves every PRIORITY_HALF_LIFE_HOURS since it was fetched
+  • coverage  – how many other outlets ran a similar headline in the last
+                COVERAGE_HOURS (word overlap of the titles); big stories
+                are covered everywhere
+  • topic     – classify_content(): geopolitics and economics over sports
+  • demand    – /api/analyse requests made while it had no analysis
+
+stored in `Article.priority`, which backlog.claim() orders by.  Scores are
+refreshed by rescore() – after every ingest and every RESCORE_SECONDS while
+a worker drains the backlog – so recency keeps decaying.  TokenBudget caps
+what a batch run may spend; it reserves the expected cost of an analysis
+(the recent average) before the call, so parallel workers stop together.
+
+    python scheduler.py            # the top of the queue with its components
+    python scheduler.py --rescore
+"""
+from __future__ import annotations
+import argparse, math, re, threading, time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select, update
+
+from models import Article, ArticleAnalysis, Session
+from config import PRIORITY_HALF_LIFE_HOURS
+
+WEIGHTS = {"recency": 0.4, "coverage": 0.3, "topic": 0.15, "demand": 0.15}
+TOPIC_WEIGHTS = {"geopolitics": 1.0, "economics": 0.9, "policy": 0.8,
+                 "default": 0.5, "culture": 0.3, "sports": 0.2}
+COVERAGE_HOURS = 24
+COVERAGE_SITES = 3          # this many other outlets = full coverage score
+SIMILARITY = 0.3            # Jaccard overlap of title words for "same story"
+DEMAND_FULL = 5             # requests for a full demand score
+RESCORE_SECONDS = 60
+MAX_RESCORE = 5000          # newest backlog rows rescored per pass
+DEFAULT_TOKENS = 2500       # expected cost of an analysis before there is history
+
+_WORD = re.compile(r"\w{4,}")
+_last_rescore = 0.0
+_rescore_lock = threading.Lock()
+
+
+# ---------- scoring --------------------------------------------------------
+def title_words(title: str) -> frozenset:
+    return frozenset(_WORD.findall(title.lower()))
+
+
+def coverage(words: Dict[int, frozenset], sites: Dict[int, str]) -> Dict[int, int]:
+    """{id: number of *other* outlets with a similar title} over `words`."""
+    by_word = defaultdict(list)            # inverted index: compare only overlapping titles
+    for aid, ws in words.items():
+        for w in ws:
+            by_word[w].append(aid)
+    out = {}
+    for aid, ws in words.items():
+        if not ws:
+            out[aid] = 0
+            continue
+        others = {other for w in ws for other in by_word[w]
+                  if other != aid and sites[other] != sites[aid]}
+        outlets = {sites[o] for o in others
+                   if len(ws & words[o]) / len(ws | words[o]) >= SIMILARITY}
+        out[aid] = len(outlets)
+    return out
+
+
+def components(fetched_at: datetime, now: datetime, covered: int, topic: str,
+               demand: int) -> Dict[str, float]:
+    age_hours = max((now - fetched_at).total_seconds() / 3600, 0.0) if fetched_at else 1e6
+    return {
+        "recency": 0.5 ** (age_hours / PRIORITY_HALF_LIFE_HOURS),
+        "coverage": min(covered, COVERAGE_SITES) / COVERAGE_SITES,
+        "topic": TOPIC_WEIGHTS.get(topic, TOPIC_WEIGHTS["default"]),
+        "demand": min(math.log1p(demand or 0) / math.log1p(DEMAND_FULL), 1.0),
+    }
+
+
+def score(parts: Dict[str, float]) -> float:
+    return round(sum(WEIGHTS[k] * v for k, v in parts.items()), 6)
+
+
+def scored_backlog(sess, now: Optional[datetime] = None, limit: int = MAX_RESCORE) -> List[dict]:
+    """The newest `limit` backlog articles with priority components, best first."""
+    from analysis import classify_content
+
+    now = now or datetime.utcnow()
+    backlog = sess.execute(
+        select(Article.id, Article.site, Article.title, Article.summary,
+               Article.fetched_at, Article.demand)
+        .where(Article.analyzed_at.is_(None))
+        .order_by(Article.fetched_at.desc())
+        .limit(limit)
+    ).all()
+    if not backlog:
+        return []
+    # coverage is judged against every recent headline, analysed or not
+    recent = sess.execute(
+        select(Article.id, Article.site, Article.title)
+        .where(Article.fetched_at >= now - timedelta(hours=COVERAGE_HOURS))
+    ).all()
+    words = {r.id: title_words(r.title) for r in recent}
+    sites = {r.id: r.site for r in recent}
+    for r in backlog:
+        words.setdefault(r.id, title_words(r.title))
+        sites.setdefault(r.id, r.site)
+    covered = coverage(words, sites)
+
+    rows = []
+    for r in backlog:
+        topic = classify_content(r.title, r.summary or "")
+        parts = components(r.fetched_at, now, covered[r.id], topic, r.demand)
+        rows.append({"id": r.id, "site": r.site, "title": r.title, "content_type": topic,
+                     "priority": score(parts), **parts})
+    return sorted(rows, key=lambda row: -row["priority"])
+
+
+def rescore(sess, now: Optional[datetime] = None) -> int:
+    """Recompute and store the priority of the backlog; returns rows scored.
+    The caller commits."""
+    global _last_rescore
+    rows = scored_backlog(sess, now)
+    if rows:
+        sess.execute(update(Article), [{"id": r["id"], "priority": r["priority"]} for r in rows])
+    _last_rescore = time.monotonic()
+    return len(rows)
+
+
+def maybe_rescore(sess) -> None:
+    """rescore() and commit if this process has not done so for RESCORE_SECONDS."""
+    if time.monotonic() - _last_rescore < RESCORE_SECONDS:
+        return
+    with _rescore_lock:                       # one thread per process does it
+        if time.monotonic() - _last_rescore < RESCORE_SECONDS:
+            return
+        rescore(sess)
+        sess.commit()
+
+
+def record_demand(sess, article_id: int) -> None:
+    """Count a reader's request for an article that has no analysis yet."""
+    sess.execute(
+        update(Article)
+        .where(Article.id == article_id, Article.analyzed_at.is_(None))
+        .values(demand=func.coalesce(Article.demand, 0) + 1),
+        execution_options={"synchronize_session": False},
+    )
+
+
+# ---------- token budget ---------------------------------------------------
+def expected_tokens(sess, sample: int = 200) -> int:
+    """Average tokens of the last `sample` analyses (DEFAULT_TOKENS without history)."""
+    recent = (select(ArticleAnalysis.tokens)
+              .where(ArticleAnalysis.tokens > 0)
+              .order_by(ArticleAnalysis.id.desc())
+              .limit(sample).subquery())
+    avg = sess.execute(select(func.avg(recent.c.tokens))).scalar()
+    return int(avg) if avg else DEFAULT_TOKENS
+
+
+class TokenBudget:
+    """Token allowance shared by the workers of one batch run (0 = unlimited)."""
+
+    def __init__(self, limit: int, expected: int = DEFAULT_TOKENS):
+        self.limit, self.expected = limit, expected
+        self.spent = self.reserved = 0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> bool:
+        """Set aside the expected cost of one analysis; False when it won't fit."""
+        with self._lock:
+            if self.limit and self.spent + self.reserved + self.expected > self.limit:
+                return False
+            self.reserved += self.expected
+            return True
+
+    def settle(self, used: int) -> None:
+        """Replace a reservation by what the analysis actually cost."""
+        with self._lock:
+            self.reserved -= self.expected
+            self.spent += used
+
+
+# -----------------------------------------------------------------------------
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Show or refresh the analysis backlog priorities.")
+    p.add_argument("-n", "--limit", type=int, default=20)
+    p.add_argument("--rescore", action="store_true", help="store fresh priorities")
+    args = p.parse_args()
+    sess = Session()
+    try:
+        if args.rescore:
+            print(f"Rescored {rescore(sess)} backlog articles")
+            sess.commit()
+        else:
+            print(f"{'prio':>5} {'rec':>4} {'cov':>4} {'top':>4} {'dem':>4}  "
+                  f"{'site':<12} {'topic':<11} title")
+            for r in scored_backlog(sess)[:args.limit]:
+                print(f"{r['priority']:5.2f} {r['recency']:4.2f} {r['coverage']:4.2f} "
+                      f"{r['topic']:4.2f} {r['demand']:4.2f}  {r['site']:<12} "
+                      f"{r['content_type']:<11} {r['title'][:70]}")
+    finally:
+        sess.close()
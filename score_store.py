@@ -0,0 +1,179 @@
+"""
+In-memory, array-backed copy of the numeric analysis fields.
+
+Each worker keeps one NumPy snapshot of every analysed article – site code,
+fetch/analysis time, the four scores and the claim counts – and answers
+filtered metrics, percentiles and histograms for /analytics with vectorised
+operations instead of SQL round trips or per-row Python loops.
+
+The snapshot is reloaded when the `scores` change generation (bumped by
+aggregates.py in the same transaction as any score change) moves on; the
+generation is read at most once per CHECK_SECONDS.
+"""
+from __future__ import annotations
+import logging, threading, time, warnings
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+import metrics
+from aggregates import SCORES, generation
+from models import Article
+
+log = logging.getLogger("score_store")
+
+CHECK_SECONDS = 1.0
+PERCENTILES = (10, 25, 50, 75, 90)
+HIST_BINS = np.linspace(0, 100, 11)        # 10-point buckets
+
+
+class Snapshot:
+    """Columns of analysed articles at one generation (read-only arrays)."""
+
+    def __init__(self, gen: int, rows: list):
+        self.generation = gen
+        self.sites = tuple(sorted({r[1] for r in rows}))
+        codes = {s: i for i, s in enumerate(self.sites)}
+        n = len(rows)
+        self.ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+        self.site = np.fromiter((codes[r[1]] for r in rows), dtype=np.int16, count=n)
+        self.fetched_at = np.array([r[2] for r in rows], dtype="datetime64[s]")
+        self.analyzed_at = np.array([r[3] for r in rows], dtype="datetime64[s]")
+        self.verified = np.fromiter((r[4] or 0 for r in rows), dtype=np.int32, count=n)
+        self.corrected = np.fromiter((r[5] or 0 for r in rows), dtype=np.int32, count=n)
+        # (n, 4) float32, NaN where the analysis had no score
+        self.scores = np.array([[np.nan if v is None else v for v in r[6:]] for r in rows],
+                               dtype=np.float32).reshape(n, len(SCORES))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ---------- selection ------------------------------------------------
+    def mask(self, ids: Optional[Iterable[int]] = None, site: Optional[str] = None):
+        """Boolean row mask: article ids (e.g. search hits) and/or one site."""
+        m = np.ones(len(self), dtype=bool)
+        if ids is not None:
+            m &= np.isin(self.ids, np.fromiter(ids, dtype=np.int64))
+        if site is not None:
+            m &= self.site == (self.sites.index(site) if site in self.sites else -1)
+        return m
+
+    # ---------- aggregations ---------------------------------------------
+    def site_metrics(self, mask=None) -> Dict[str, dict]:
+        """Same shape as aggregates.site_metrics(), for the rows in `mask`."""
+        m = self.mask() if mask is None else mask
+        k = len(self.sites)
+        site = self.site[m]
+        count = np.bincount(site, minlength=k)
+        verified = np.bincount(site, weights=self.verified[m], minlength=k)
+        corrected = np.bincount(site, weights=self.corrected[m], minlength=k)
+        scores = self.scores[m]
+        present = ~np.isnan(scores)
+        sums = np.stack([np.bincount(site, weights=np.where(present[:, j], scores[:, j], 0),
+                                     minlength=k) for j in range(len(SCORES))], axis=1)
+        ns = np.stack([np.bincount(site, weights=present[:, j], minlength=k)
+                       for j in range(len(SCORES))], axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            avgs = np.clip(np.round(np.where(ns > 0, sums / ns, 0), 1), 0, 100)
+
+        out = {}
+        for i, name in enumerate(self.sites):
+            if not count[i]:
+                continue
+            out[name] = {"verified": int(verified[i]), "corrected": int(corrected[i]),
+                         "total_articles": int(count[i])}
+            for j, score in enumerate(SCORES):
+                out[name][f"avg_{score}"] = float(avgs[i, j])
+        return out
+
+    def percentiles(self, mask=None, qs=PERCENTILES) -> Dict[str, dict]:
+        """{site: {score: [p10, p25, …] or None}} over the rows in `mask`."""
+        m = self.mask() if mask is None else mask
+        out = {}
+        for i, name in enumerate(self.sites):
+            rows = self.scores[m & (self.site == i)]
+            if not len(rows):
+                continue
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)   # all-NaN columns
+                pct = np.nanpercentile(rows, qs, axis=0)           # (len(qs), 4)
+            out[name] = {
+                score: None if np.isnan(pct[0, j]) else [round(float(v), 1) for v in pct[:, j]]
+                for j, score in enumerate(SCORES)
+            }
+        return out
+
+    def histograms(self, mask=None, bins=HIST_BINS) -> dict:
+        """Score histograms per site: {"edges": [...], "sites": {site: {score: counts}}}."""
+        m = self.mask() if mask is None else mask
+        out = {}
+        for i, name in enumerate(self.sites):
+            rows = self.scores[m & (self.site == i)]
+            if not len(rows):
+                continue
+            out[name] = {
+                score: np.histogram(rows[:, j][~np.isnan(rows[:, j])], bins=bins)[0].tolist()
+                for j, score in enumerate(SCORES)
+            }
+        return {"edges": [float(e) for e in bins], "sites": out}
+
+    def compare(self, mask) -> Dict[str, dict]:
+        """Mean of each score for the rows in `mask` against all rows, per site."""
+        out = {}
+        for i, name in enumerate(self.sites):
+            in_site = self.site == i
+            sel = self.scores[mask & in_site]
+            if not len(sel):
+                continue
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                match = np.nanmean(sel, axis=0)
+                base = np.nanmean(self.scores[in_site], axis=0)
+            out[name] = {
+                score: {
+                    "match": None if np.isnan(match[j]) else round(float(match[j]), 1),
+                    "all": None if np.isnan(base[j]) else round(float(base[j]), 1),
+                }
+                for j, score in enumerate(SCORES)
+            }
+            out[name]["articles"] = int(len(sel))
+        return out
+
+
+def load(sess, gen: int) -> Snapshot:
+    cols = [Article.id, Article.site, Article.fetched_at, Article.analyzed_at,
+            Article.verified_claims, Article.corrected_claims,
+            *[getattr(Article, f"{s}_score") for s in SCORES]]
+    rows = sess.query(*cols).filter(Article.analyzed_at.is_not(None)).all()
+    return Snapshot(gen, rows)
+
+
+class ScoreStore:
+    """Per-process holder of the current Snapshot."""
+
+    def __init__(self):
+        self._snap: Optional[Snapshot] = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self, sess) -> Snapshot:
+        """The current snapshot, reloaded first if the data has changed."""
+        snap = self._snap
+        if snap is not None and time.monotonic() - self._checked < CHECK_SECONDS:
+            return snap
+        gen = generation(sess)
+        self._checked = time.monotonic()
+        if snap is not None and snap.generation == gen:
+            metrics.cache_result("score_store", True)
+            return snap
+        with self._lock:
+            if self._snap is None or self._snap.generation != gen:
+                started = time.perf_counter()
+                self._snap = load(sess, gen)
+                log.info("Loaded %d analysed articles (generation %d) in %.1f ms",
+                         len(self._snap), gen, (time.perf_counter() - started) * 1000)
+                metrics.cache_result("score_store", False)
+            return self._snap
+
+
+store = ScoreStore()
@@ -0,0 +1,243 @@
+"""
+Full-text search over article titles and summaries.
+
+  • SQLite     → FTS5 virtual table (external content) kept in sync by triggers
+  • PostgreSQL → generated `search_vector` tsvector column (swedish) + GIN index
+  • anything else falls back to the old ILIKE scan
+
+Both engines rank results (bm25 / ts_rank_cd), match word prefixes and
+return highlighted title + summary snippets.
+"""
+from __future__ import annotations
+import re
+from typing import List, Optional, Tuple
+
+from markupsafe import Markup, escape
+from sqlalchemy import or_, select, text
+
+from models import Article
+
+FTS_TABLE = "articles_fts"
+ARTICLE_TABLE = Article.__tablename__
+
+# Sentinels wrapped around matched terms by the DB; swapped for <mark> after
+# the surrounding text has been HTML-escaped.
+HL_START, HL_STOP = "⟦", "⟧"
+
+TITLE_WEIGHT, SUMMARY_WEIGHT = 10.0, 1.0
+MAX_TERMS = 8
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Light Swedish suffix stripping for SQLite, which has no Swedish stemmer.
+# Longest suffixes first; combined with prefix matching "räntan" → "ränt*".
+SV_SUFFIXES = (
+    "heterna", "hetens", "anden", "heten", "arnas", "ernas", "ornas",
+    "andet", "arna", "erna", "orna", "ande", "ende", "aste", "het",
+    "ast", "ade", "are", "ens", "ets", "an", "en", "et", "ar", "er",
+    "or", "as", "es", "na", "s", "a", "e",
+)
+MIN_STEM = 4
+
+
+# ---------- query parsing --------------------------------------------
+def parse_terms(query: str) -> List[str]:
+    """Lower-cased word tokens from a raw user query (punctuation dropped)."""
+    return [t.lower() for t in WORD_RE.findall(query or "")][:MAX_TERMS]
+
+
+def stem_sv(word: str) -> str:
+    for suffix in SV_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            return word[: -len(suffix)]
+    return word
+
+
+def fts5_query(terms: List[str]) -> str:
+    # Terms only contain \w characters, so quoting them is enough to keep
+    # FTS5 operators (AND/OR/NEAR, column filters) out of user input.
+    return " ".join(f'"{stem_sv(t)}"*' for t in terms)
+
+
+def tsquery(terms: List[str]) -> str:
+    return " & ".join(f"{t}:*" for t in terms)
+
+
+def highlight(value: Optional[str]) -> Markup:
+    """Escape DB text and turn highlight sentinels into <mark> tags."""
+    return Markup(
+        str(escape(value or ""))
+        .replace(HL_START, "<mark>")
+        .replace(HL_STOP, "</mark>")
+    )
+
+
+# ---------- schema -----------------------------------------------------
+def ensure_search_index(engine) -> None:
+    """Create the FTS structures for the current dialect (idempotent)."""
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        _ensure_sqlite(engine)
+    elif dialect == "postgresql":
+        _ensure_postgres(engine)
+
+
+def _ensure_sqlite(engine) -> None:
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:n"),
+            {"n": FTS_TABLE},
+        ).first()
+        conn.execute(text(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+                title, summary,
+                content='{ARTICLE_TABLE}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 0'
+            )"""))
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {ARTICLE_TABLE} BEGIN
+                INSERT INTO {FTS_TABLE}(rowid, title, summary)
+                VALUES (new.id, new.title, new.summary);
+            END"""))
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {ARTICLE_TABLE} BEGIN
+                INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, summary)
+                VALUES ('delete', old.id, old.title, old.summary);
+            END"""))
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, summary ON {ARTICLE_TABLE} BEGIN
+                INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, summary)
+                VALUES ('delete', old.id, old.title, old.summary);
+                INSERT INTO {FTS_TABLE}(rowid, title, summary)
+                VALUES (new.id, new.title, new.summary);
+            END"""))
+        if not exists:
+            # index rows that were stored before the FTS table existed
+            conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def _ensure_postgres(engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            ALTER TABLE {ARTICLE_TABLE}
+            ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('swedish', coalesce(title, '')), 'A') ||
+                setweight(to_tsvector('swedish', coalesce(summary, '')), 'B')
+            ) STORED"""))
+        conn.execute(text(f"""
+            CREATE INDEX IF NOT EXISTS ix_{ARTICLE_TABLE}_search
+            ON {ARTICLE_TABLE} USING GIN (search_vector)"""))
+
+
+# ---------- queries ----------------------------------------------------
+def match_ids(sess, query: str):
+    """
+    Selectable of article ids matching `query`, for use in
+    `Article.id.in_(...)` filters.  Returns None when the query has no terms.
+    """
+    terms = parse_terms(query)
+    if not terms:
+        return None
+    dialect = sess.get_bind().dialect.name
+    if dialect == "sqlite":
+        return text(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :fts"
+        ).bindparams(fts=fts5_query(terms))
+    if dialect == "postgresql":
+        return text(
+            f"SELECT id FROM {ARTICLE_TABLE} "
+            f"WHERE search_vector @@ to_tsquery('swedish', :tsq)"
+        ).bindparams(tsq=tsquery(terms))
+    return select(Article.id).where(*[
+        or_(Article.title.ilike(f"%{t}%"), Article.summary.ilike(f"%{t}%"))
+        for t in terms
+    ])
+
+
+def search_articles(sess, query: str, *, site: Optional[str] = None,
+                    limit: int = 30, after: Optional[Tuple[float, int]] = None
+                    ) -> List[Article]:
+    """
+    Best-ranked articles for `query` (optionally within one site).
+
+    Each returned Article carries `.highlight = {"title", "summary"}` Markup
+    and `.search_rank`; pass the (search_rank, id) of the last hit as `after`
+    to continue from there.
+    """
+    terms = parse_terms(query)
+    if not terms:
+        return []
+
+    dialect = sess.get_bind().dialect.name
+    if dialect == "sqlite":
+        # bm25() is "lower is better"; ties broken by newest id
+        bm25 = f"bm25({FTS_TABLE}, {TITLE_WEIGHT}, {SUMMARY_WEIGHT})"
+        keyset = ""
+        if after:
+            keyset = f"AND ({bm25} > :after_rank OR ({bm25} = :after_rank AND a.id < :after_id))"
+        rows = sess.execute(text(f"""
+            SELECT {FTS_TABLE}.rowid AS id,
+                   {bm25}                                       AS score,
+                   highlight({FTS_TABLE}, 0, :hs, :he)          AS title_hl,
+                   snippet({FTS_TABLE}, 1, :hs, :he, '…', 32)   AS summary_hl
+            FROM {FTS_TABLE}
+            JOIN {ARTICLE_TABLE} a ON a.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH :fts
+              AND (:site IS NULL OR a.site = :site)
+              {keyset}
+            ORDER BY score, a.id DESC
+            LIMIT :limit"""),
+            {"fts": fts5_query(terms), "hs": HL_START, "he": HL_STOP,
+             "site": site, "limit": limit,
+             **_after_params(after)},
+        ).all()
+    elif dialect == "postgresql":
+        keyset = ""
+        if after:
+            keyset = "AND (ts_rank_cd(a.search_vector, q)::float8, a.id) < (:after_rank, :after_id)"
+        opts = f"StartSel={HL_START}, StopSel={HL_STOP}"
+        rows = sess.execute(text(f"""
+            SELECT a.id,
+                   ts_rank_cd(a.search_vector, q)::float8                       AS score,
+                   ts_headline('swedish', a.title, q, :hl_all)                  AS title_hl,
+                   ts_headline('swedish', coalesce(a.summary, ''), q, :hl_snip) AS summary_hl
+            FROM {ARTICLE_TABLE} a, to_tsquery('swedish', :tsq) q
+            WHERE a.search_vector @@ q
+              AND (CAST(:site AS text) IS NULL OR a.site = :site)
+              {keyset}
+            ORDER BY score DESC, a.id DESC
+            LIMIT :limit"""),
+            {"tsq": tsquery(terms), "site": site, "limit": limit,
+             "hl_all": f"{opts}, HighlightAll=true",
+             "hl_snip": f"{opts}, MaxWords=35, MinWords=15",
+             **_after_params(after)},
+        ).all()
+    else:
+        # unranked fallback: newest id first, rank is constant
+        q = sess.query(Article).filter(Article.id.in_(match_ids(sess, query)))
+        if site:
+            q = q.filter_by(site=site)
+        if after:
+            q = q.filter(Article.id < after[1])
+        arts = q.order_by(Article.id.desc()).limit(limit).all()
+        for art in arts:
+            art.search_rank = 0
+        return arts
+
+    by_id = {a.id: a for a in sess.query(Article).filter(Article.id.in_([r.id for r in rows]))}
+    results = []
+    for r in rows:
+        art = by_id.get(r.id)
+        if art is None:
+            continue
+        art.search_rank = r.score
+        art.highlight = {"title": highlight(r.title_hl), "summary": highlight(r.summary_hl)}
+        results.append(art)
+    return results
+
+
+def _after_params(after: Optional[Tuple[float, int]]) -> dict:
+    if not after:
+        return {}
+    return {"after_rank": after[0], "after_id": after[1]}
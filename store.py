@@ -0,0 +1,237 @@
+"""
+Write side for analysis results.
+
+Both app.py (analyse button) and fetch_news.py (batch) persist analyses and
+resets through here, so the per-site aggregates in `site_analytics` change
+in the same transaction as the article rows.  Callers own the commit.
+
+Each analysis is a row in `article_analysis` (JSON payload – optionally
+compressed, see compression.py – typed scores, model and prompt version); re-analysing adds a row and moves the article's
+`analysis_id` pointer, so earlier results stay available as history.
+"""
+from __future__ import annotations
+import hashlib, json, logging, re
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import DateTime, inspect, select, text, update
+
+import aggregates
+from models import Article, ArticleAnalysis
+
+log = logging.getLogger("store")
+
+# Columns older versions filled with (parts of) the analysis JSON
+LEGACY_COLUMNS = (
+    "nuanced_perspective", "analysis_sources", "balanced_title", "balanced_summary",
+    "bias_score", "bias_label", "bias_explanation", "elon_musk_perspective",
+)
+
+
+def count_claims(analysis: dict) -> Tuple[int, int]:
+    """
+    (verified, corrected) from the factual_accuracy section.
+
+    Verified: a PÅSTÅENDE line with VERIFIERING at HÖG or MEDEL confidence.
+    Corrected: a PÅSTÅENDE line with a non-empty KORRIGERING, in either the
+    claim verification or the unsupported assertions text.
+    """
+    accuracy = analysis.get("factual_accuracy") or {}
+    claim_verification = accuracy.get("claim_verification") or ""
+    unsupported_assertions = accuracy.get("unsupported_assertions") or ""
+
+    def corrected(text: str) -> int:
+        return sum(1 for line in text.split("\n")
+                   if "PÅSTÅENDE:" in line and "KORRIGERING:" in line
+                   and line.split("KORRIGERING:")[1].strip() != "")
+
+    verified = sum(1 for line in claim_verification.split("\n")
+                   if "PÅSTÅENDE:" in line and "VERIFIERING:" in line
+                   and ("KONFIDENS: HÖG" in line or "KONFIDENS: MEDEL" in line))
+    return verified, corrected(claim_verification) + corrected(unsupported_assertions)
+
+
+# ---------- change detection ----------------------------------------------
+_SPACE = re.compile(r"\s+")
+
+
+def content_hash(title: str, summary: Optional[str]) -> str:
+    """Fingerprint of what an analysis is based on; whitespace-insensitive."""
+    text_ = _SPACE.sub(" ", f"{title}\n{summary or ''}").strip()
+    return hashlib.blake2b(text_.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def backfill_content_hashes(sess, batch: int = 1000) -> int:
+    """Fingerprint rows stored before content_hash existed; returns the count."""
+    done = 0
+    while True:
+        rows = sess.execute(
+            select(Article.id, Article.title, Article.summary)
+            .where(Article.content_hash.is_(None))
+            .limit(batch)
+        ).all()
+        if not rows:
+            return done
+        sess.execute(update(Article), [{"id": r.id, "content_hash": content_hash(r.title, r.summary)}
+                                       for r in rows])
+        sess.commit()
+        done += len(rows)
+
+
+def build_analysis(article_id: Optional[int], analysis: dict,
+                   created_at: Optional[datetime] = None) -> ArticleAnalysis:
+    """ArticleAnalysis row for an analysis dict as returned by analyse_article."""
+    verified, corrected = count_claims(analysis)
+    return ArticleAnalysis(
+        article_id=article_id,
+        created_at=created_at or datetime.utcnow(),
+        model=analysis.get("model_used"),
+        prompt_version=analysis.get("prompt_version"),
+        content_type=analysis.get("content_type"),
+        tokens=analysis.get("tokens", 0),
+        payload=analysis,
+        verified_claims=verified,
+        corrected_claims=corrected,
+        **aggregates.extract_scores(analysis),
+    )
+
+
+def save_analysis(sess, article: Article, analysis: dict) -> Article:
+    """Store `analysis` as the article's current one and update the site totals."""
+    before = aggregates.contribution(article) if article.analyzed_at else None
+
+    if article.id is None:          # new article from the batch fetch
+        sess.add(article)
+        sess.flush()
+    row = build_analysis(article.id, analysis)
+    sess.add(row)
+    sess.flush()
+
+    article.analysis_id = row.id
+    article.verified_claims = row.verified_claims
+    article.corrected_claims = row.corrected_claims
+    article.analyzed_at = row.created_at
+    article.last_updated_at = row.created_at
+    article.analysis_stale = False
+    for name in aggregates.SCORES:
+        setattr(article, f"{name}_score", getattr(row, f"{name}_score"))
+
+    aggregates.record_analysis(sess, article, before)
+    aggregates.record_daily(sess, article.site, row)
+    return article
+
+
+def current_analyses(sess, articles: Iterable[Article]) -> Dict[int, dict]:
+    """{article_id: payload} for the current analysis of each article (one query)."""
+    ids = [a.analysis_id for a in articles if a.analysis_id]
+    if not ids:
+        return {}
+    rows = sess.execute(
+        select(ArticleAnalysis.article_id, ArticleAnalysis.payload_json,
+               ArticleAnalysis.payload_z)
+        .where(ArticleAnalysis.id.in_(ids))
+    )
+    return {article_id: compressed if compressed is not None else plain
+            for article_id, plain, compressed in rows}
+
+
+def attach_analyses(sess, articles: List[Article]) -> List[Article]:
+    """Set `art.analysis` (dict or None) on each article for the templates."""
+    payloads = current_analyses(sess, articles)
+    for art in articles:
+        art.analysis = payloads.get(art.id)
+    return articles
+
+
+def analysis_history(sess, article_id: int) -> List[ArticleAnalysis]:
+    """All analyses of an article, newest first."""
+    return (
+        sess.query(ArticleAnalysis)
+        .filter(ArticleAnalysis.article_id == article_id)
+        .order_by(ArticleAnalysis.created_at.desc(), ArticleAnalysis.id.desc())
+        .all()
+    )
+
+
+def reset_analyses(sess) -> None:
+    """Drop every stored analysis (articles stay) and zero the site totals."""
+    sess.query(Article).update({
+        'analysis_id': None,
+        'analyzed_at': None,
+        'last_updated_at': None,
+        'verified_claims': 0,
+        'corrected_claims': 0,
+        'objectivity_score': None,
+        'depth_score': None,
+        'evidence_score': None,
+        'clarity_score': None,
+    })
+    sess.query(ArticleAnalysis).delete(synchronize_session=False)
+    aggregates.reset(sess)
+    aggregates.reset_daily(sess)
+
+
+def delete_articles(sess, *criteria) -> int:
+    """Delete articles matching `criteria`, keeping the site totals in step."""
+    aggregates.forget(sess, *criteria)
+    doomed = select(Article.id).where(*criteria)
+    sess.query(ArticleAnalysis).filter(ArticleAnalysis.article_id.in_(doomed)) \
+        .delete(synchronize_session=False)
+    return sess.query(Article).filter(*criteria).delete(synchronize_session=False)
+
+
+# ---------- upgrade from inline JSON --------------------------------------
+def migrate_legacy_analyses(sess, batch: int = 500) -> int:
+    """
+    Move analyses stored in `nuanced_perspective` by older versions into
+    article_analysis and clear the duplicated legacy columns.  A no-op on
+    databases created without those columns.
+    """
+    bind = sess.get_bind()
+    existing = {c["name"] for c in inspect(bind).get_columns(Article.__tablename__)}
+    if "nuanced_perspective" not in existing:
+        return 0
+    legacy = [c for c in LEGACY_COLUMNS if c in existing]
+    tokens = "openai_tokens" if "openai_tokens" in existing else "0"
+
+    moved = 0
+    while True:
+        rows = sess.execute(text(
+            f"SELECT id, nuanced_perspective, analyzed_at, {tokens} AS tokens "
+            f"FROM {Article.__tablename__} WHERE nuanced_perspective IS NOT NULL "
+            f"ORDER BY id LIMIT :n"
+        ).columns(analyzed_at=DateTime), {"n": batch}).all()
+        if not rows:
+            break
+        for art_id, raw, analyzed_at, used in rows:
+            try:
+                analysis = json.loads(raw)
+            except (json.JSONDecodeError, TypeError):
+                analysis = None
+            if isinstance(analysis, dict):
+                analysis.setdefault("tokens", used or 0)
+                analysis.setdefault("prompt_version", "legacy")
+                row = build_analysis(art_id, analysis, analyzed_at or datetime.utcnow())
+                sess.add(row)
+                sess.flush()
+                # the recounted claims and scores too, as save_analysis does
+                scores = [f"{name}_score" for name in aggregates.SCORES]
+                sess.execute(text(
+                    f"UPDATE {Article.__tablename__} SET analysis_id = :a, "
+                    f"verified_claims = :verified_claims, corrected_claims = :corrected_claims, "
+                    + ", ".join(f"{c} = :{c}" for c in scores)
+                    + " WHERE id = :id"
+                ), {"a": row.id, "id": art_id,
+                    "verified_claims": row.verified_claims,
+                    "corrected_claims": row.corrected_claims,
+                    **{c: getattr(row, c) for c in scores}})
+                moved += 1
+            sess.execute(text(
+                f"UPDATE {Article.__tablename__} SET "
+                + ", ".join(f"{c} = NULL" for c in legacy)
+                + " WHERE id = :id"
+            ), {"id": art_id})
+        sess.flush()
+    if moved:
+        log.info("Moved %d inline analyses to article_analysis", moved)
+    return moved
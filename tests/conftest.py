@@ -0,0 +1,22 @@
+"""
+Test settings: config.py reads the environment at import, so it is set here,
+before any module of the app is imported – a throwaway SQLite database,
+strict query budgets and jobs that are only queued (no OpenAI calls).
+"""
+import os, sys, tempfile
+
+_tmp = tempfile.mkdtemp(prefix="balanced-news-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_tmp, 'test.db')}",
+    "OPENAI_API_KEY": "test",
+    "FLASK_ENV": "development",
+    "JOB_BACKEND": "db",
+    "ADMIN_PASSWORD": "test-admin",
+    "QUERY_BUDGET_STRICT": "1",
+    "QUERY_DEBUG_HEADERS": "1",
+    "LOCK_DIR": _tmp,
+    "PROFILE_MODE": "",
+    "ARCHIVE_DIR": "",
+    "ANALYSIS_COMPRESSION": "",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,160 @@
+"""
+The backlog lease protocol (backlog.py) on the test SQLite database: claims
+never overlap, and a result is only saved by the worker still holding a
+live lease on unchanged content.  OpenAI is replaced by a fake
+analyse_article; the PostgreSQL SKIP LOCKED path needs a server and is not
+covered here.
+"""
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+ANALYSIS = {"reporting_quality": {"objectivity_score": 70, "depth_score": 60,
+                                  "evidence_score": 65, "clarity_score": 80},
+            "tokens": 100}
+
+
+@pytest.fixture()
+def articles():
+    """Ids of a handful of fresh, un-analysed articles; all rows go afterwards."""
+    import migrate, store
+    from models import Article, Session
+    from sources import SITES
+
+    migrate.upgrade()
+    site = next(iter(SITES))
+    sess = Session()
+    rows = [Article(site=site, title=f"Rubrik {i}", summary=f"Ingress {i}",
+                    url=f"https://example.se/lease/{i}", fetched_at=datetime.utcnow(),
+                    content_hash=store.content_hash(f"Rubrik {i}", f"Ingress {i}"))
+            for i in range(6)]
+    sess.add_all(rows)
+    sess.commit()
+    yield [a.id for a in rows]
+    sess.rollback()
+    store.delete_articles(sess)
+    sess.commit()
+    sess.close()
+
+
+@pytest.fixture()
+def sess():
+    from models import Session
+
+    s = Session()
+    yield s
+    s.rollback()
+    s.close()
+
+
+def fake_openai(monkeypatch, during=None, fail=False):
+    """Stand-in for analysis.analyse_article; `during()` runs mid-call."""
+    import analysis
+
+    def analyse_article(news, **kwargs):
+        if during:
+            during()
+        if fail:
+            raise analysis.AnalysisFailed("no analysis")
+        return dict(ANALYSIS)
+
+    monkeypatch.setattr(analysis, "analyse_article", analyse_article)
+
+
+def test_two_workers_never_claim_the_same_article(articles):
+    import backlog
+    from models import Article, Session
+
+    claimed = {}
+    start = threading.Barrier(2)
+
+    def work(worker):
+        s = Session()
+        mine = claimed.setdefault(worker, [])
+        try:
+            start.wait()
+            while True:
+                ids = backlog.claim(s, worker, n=2)
+                if not ids:
+                    return
+                mine.extend(ids)
+        finally:
+            s.close()
+
+    threads = [threading.Thread(target=work, args=(w,)) for w in ("a", "b")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not set(claimed["a"]) & set(claimed["b"])
+    assert sorted(claimed["a"] + claimed["b"]) == sorted(articles)
+    s = Session()
+    try:                                     # and nobody took one over afterwards
+        owners = dict(s.query(Article.id, Article.claim_owner).filter(Article.id.in_(articles)))
+    finally:
+        s.close()
+    assert owners == {i: w for w, ids in claimed.items() for i in ids}
+
+
+def test_expired_lease_discards_the_result(articles, sess, monkeypatch):
+    import backlog
+    from models import Article, Session
+
+    article_id = backlog.claim(sess, "slow")[0]
+
+    def lease_runs_out_and_another_worker_claims():
+        other = Session()
+        try:
+            other.get(Article, article_id).claim_expires_at = datetime.utcnow() - timedelta(seconds=1)
+            other.commit()
+            assert backlog.claim_article(other, article_id, "fast")
+        finally:
+            other.close()
+
+    fake_openai(monkeypatch, during=lease_runs_out_and_another_worker_claims)
+    assert backlog.analyse_claimed(sess, article_id, "slow") is None
+    article = sess.get(Article, article_id)
+    assert article.analysis_id is None and article.claim_owner == "fast"
+
+
+def test_changed_fingerprint_blocks_the_save(articles, sess, monkeypatch):
+    import backlog, store
+    from models import Article, Session
+
+    article_id = backlog.claim(sess, "w")[0]
+
+    def feed_edits_the_article():
+        other = Session()
+        try:
+            article = other.get(Article, article_id)
+            article.summary = "Ny ingress"
+            article.content_hash = store.content_hash(article.title, article.summary)
+            other.commit()
+        finally:
+            other.close()
+
+    fake_openai(monkeypatch, during=feed_edits_the_article)
+    assert backlog.analyse_claimed(sess, article_id, "w") is None
+    assert sess.get(Article, article_id).analysis_id is None
+
+    fake_openai(monkeypatch)                 # the edited text is analysed next time
+    assert backlog.analyse_claimed(sess, article_id, "w") == ANALYSIS["tokens"]
+    article = sess.get(Article, article_id)
+    assert article.analysis_id is not None and article.claim_owner is None
+
+
+def test_analysis_failure_releases_the_lease(articles, sess, monkeypatch):
+    import backlog
+    from analysis import AnalysisFailed
+    from models import Article
+
+    article_id = backlog.claim(sess, "w")[0]
+    fake_openai(monkeypatch, fail=True)
+    with pytest.raises(AnalysisFailed):
+        backlog.analyse_claimed(sess, article_id, "w")
+    article = sess.get(Article, article_id)
+    assert article.analysis_id is None and article.analyzed_at is None
+    assert article.claim_owner is None and article.claim_expires_at is None
+    assert article_id in backlog.claim(sess, "other", n=len(articles))
@@ -0,0 +1,116 @@
+"""
+Every route's @query_budget, enforced: each request runs under
+QUERY_BUDGET_STRICT (tests/conftest.py), so a view that issues more SQL than
+its budget raises QueryBudgetExceeded out of the test client.  Read routes
+come from benchmarks.query_budgets.REQUESTS; the write paths – queueing an
+analysis, the resets, starting a fetch – are exercised here.
+"""
+from datetime import datetime
+
+import pytest
+from werkzeug.exceptions import HTTPException
+
+from benchmarks.query_budgets import REQUESTS
+
+ROWS = 300
+
+
+@pytest.fixture(scope="module")
+def app():
+    from benchmarks.synth import generate
+    from app import create_app
+
+    generate(ROWS)
+    app = create_app()
+    app.testing = True
+    return app
+
+
+@pytest.fixture()
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture(scope="module")
+def ids(app):
+    from models import Article, Session
+
+    sess = Session()
+    try:
+        analysed = sess.query(Article.id).filter(Article.analysis_id.isnot(None)) \
+            .order_by(Article.id.desc()).limit(1).scalar()
+        backlog = sess.query(Article.id).filter(Article.analyzed_at.is_(None)) \
+            .order_by(Article.id.desc()).limit(1).scalar()
+        # fresh enough to be served without a job (ANALYSIS_MAX_AGE_HOURS)
+        sess.get(Article, analysed).analyzed_at = datetime.utcnow()
+        sess.commit()
+        return {"analysed": analysed, "backlog": backlog}
+    finally:
+        sess.close()
+
+
+def budget_of(app, method: str, url: str):
+    try:
+        endpoint, _ = app.url_map.bind("localhost").match(url.split("?")[0], method=method)
+    except HTTPException:
+        return None
+    return getattr(app.view_functions[endpoint], "query_budget", None)
+
+
+def request(app, client, method: str, url: str, body=None):
+    """Make the request; a budget overrun raises.  Returns the response."""
+    response = client.open(url, method=method, json=body)
+    assert response.status_code < 500, response.get_data(as_text=True)
+    budget = budget_of(app, method, url)
+    if budget is not None:
+        assert int(response.headers["X-DB-Queries"]) <= budget
+    return response
+
+
+def test_every_route_declares_a_budget(app):
+    missing = [rule.rule for rule in app.url_map.iter_rules()
+               if rule.endpoint != "static"
+               and getattr(app.view_functions[rule.endpoint], "query_budget", None) is None]
+    assert not missing
+
+
+@pytest.mark.parametrize("method,url,body", REQUESTS, ids=[f"{m} {u}" for m, u, _ in REQUESTS])
+def test_read_routes(app, client, ids, method, url, body):
+    url = url.format(**ids)
+    if body:
+        body = {k: int(v.format(**ids)) if isinstance(v, str) else v for k, v in body.items()}
+    request(app, client, method, url, body)
+
+
+def test_analyse_queues_a_job(app, client, ids):
+    first = request(app, client, "POST", "/api/analyse", {"article_id": ids["backlog"]})
+    assert first.status_code == 202 and not first.get_json()["coalesced"]
+    again = request(app, client, "POST", "/api/analyse", {"article_id": ids["backlog"]})
+    assert again.get_json()["coalesced"]
+    request(app, client, "GET", first.get_json()["status_url"])
+
+
+def test_analyse_serves_a_fresh_analysis(app, client, ids):
+    r = request(app, client, "POST", "/api/analyse", {"article_id": ids["analysed"]})
+    assert r.status_code == 200 and r.get_json()["cached"]
+
+
+def test_fetch_news_starts_and_joins_a_run(app, client, monkeypatch):
+    import app as app_module
+    started = []
+    monkeypatch.setattr(app_module, "start_background", started.append)   # no network
+    first = request(app, client, "POST", "/api/fetch-news")
+    assert first.status_code == 202 and started == [first.get_json()["run_id"]]
+    again = request(app, client, "POST", "/api/fetch-news")
+    assert again.get_json()["coalesced"]
+    request(app, client, "GET", first.get_json()["status_url"])
+
+
+def test_reset_analytics(app, client):
+    r = request(app, client, "POST", "/reset-analytics", {"password": "test-admin"})
+    assert r.status_code == 200
+
+
+def test_reset_all(app, client):
+    r = request(app, client, "POST", "/reset-all", {"password": "test-admin"})
+    assert r.status_code == 204
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Analysis worker: drains the job queue filled by /api/analyse.
+
+    python worker.py            # run until SIGTERM/SIGINT
+    python worker.py --once     # process what is queued, then exit
+
+Run as its own process (Procfile `worker:`); any number of workers can share
+the queue – claims are atomic.
+"""
+from __future__ import annotations
+import argparse, logging, signal, time
+
+from dotenv import load_dotenv
+
+from models import Session, init_db
+from jobs import next_job, run_job, worker_id
+from config import JOB_BACKEND, JOB_POLL_SECONDS
+
+load_dotenv()
+
+log = logging.getLogger("worker")
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s  %(levelname)-8s %(message)s",
+    datefmt="%H:%M:%S",
+)
+
+_stop = False
+
+
+def _request_stop(signum, frame):
+    global _stop
+    log.info("Signal %s received – finishing current job", signum)
+    _stop = True
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Process queued article analyses.")
+    p.add_argument("--once", action="store_true",
+                   help="exit when the queue is empty")
+    p.add_argument("--poll", type=float, default=JOB_POLL_SECONDS,
+                   help=f"idle wait between polls in seconds (default: {JOB_POLL_SECONDS})")
+    args = p.parse_args()
+
+    if JOB_BACKEND == "inline":
+        log.warning("JOB_BACKEND=inline: the web process runs jobs itself, "
+                    "this worker only picks up leftovers")
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+    init_db()
+
+    me = worker_id()
+    log.info("Worker %s started (backend: %s)", me, JOB_BACKEND)
+    done = 0
+    while not _stop:
+        sess = Session()
+        try:
+            job_id = next_job(sess, me, timeout=args.poll)
+        finally:
+            sess.close()
+
+        if job_id is None:
+            if args.once:
+                break
+            if JOB_BACKEND != "redis":   # redis already blocked in BRPOP
+                time.sleep(args.poll)
+            continue
+
+        log.info("Job %d claimed", job_id)
+        started = time.monotonic()
+        run_job(job_id, me)
+        done += 1
+        log.info("Job %d finished in %.1fs", job_id, time.monotonic() - started)
+
+    log.info("Worker %s stopped after %d jobs", me, done)
+
+
+if __name__ == "__main__":
+    main()